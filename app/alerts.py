@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import time
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime, timedelta
+from typing import Optional
+
+from .config import settings
+from .emailer import send_alert_email
+from .metrics import DELIVERY_FAILURES, DELIVERY_LATENCY
+from .targets import Target
+from .teams_notifier import PartialDeliveryError, configured_webhook_urls, send_teams_notification
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryError(Exception):
+	"""
+	Raised when an alert could not be delivered on any enabled channel, or
+	reached only part of its Teams webhooks. In the latter case `retry` is the
+	alert narrowed to the webhooks still missing it.
+	"""
+
+	def __init__(self, message: str, retry: Optional["Alert"] = None) -> None:
+		super().__init__(message)
+		self.retry = retry
+
+
+@dataclass(frozen=True)
+class Alert:
+	"""A rendered notification, ready for Teams (title/message) or email (subject/body)."""
+
+	dedup_key: str
+	title: str
+	message: str
+	subject: str
+	body: str
+	threshold_minutes: int
+	# Teams card extras: replacement facts for the main section and extra sections below it
+	facts: list[dict] = field(default_factory=list)
+	sections: list[dict] = field(default_factory=list)
+	theme_color: str = "0076D7"
+	# Teams webhooks still to reach after a partial failure; empty means every configured one
+	webhook_urls: list[str] = field(default_factory=list)
+
+	def to_dict(self) -> dict:
+		return asdict(self)
+
+	@classmethod
+	def from_dict(cls, data: dict) -> "Alert":
+		return cls(**data)
+
+
+@dataclass(frozen=True)
+class AlertEvent:
+	"""
+	A target going quiet ("inactive"), receiving rows again after an alert
+	("resumed"), or receiving far fewer rows than usual ("rate_drop").
+	"""
+
+	kind: str
+	target: Target
+	last_update: datetime
+	# How long the target had been quiet when the event was raised
+	inactive_for: timedelta
+	at: datetime
+	# rate_drop only: rows per minute over the detection window and the learned baseline
+	observed_rate: Optional[float] = None
+	expected_rate: Optional[float] = None
+	# Grouped targets: the (key, last seen) pairs this event covers, most recently active first
+	keys: tuple[tuple[str, datetime], ...] = ()
+
+	@property
+	def key(self) -> str:
+		if self.keys:
+			keys = hashlib.sha1("|".join(k for k, _ in self.keys).encode()).hexdigest()[:16]
+			return f"{self.kind}:{self.target.name}:{keys}:{self.at.isoformat()}"
+		return f"{self.kind}:{self.target.name}:{self.last_update.isoformat()}"
+
+
+def inactivity_alert(target: Target, last_update: datetime, inactive_for: timedelta, threshold: timedelta) -> Alert:
+	minutes = int(threshold.total_seconds() // 60)
+	return Alert(
+		# One inactivity episode is identified by the last row seen before it went quiet
+		dedup_key=f"inactivity:{target.name}:{last_update.isoformat()}",
+		title=f"⚠️ Database Inactivity Alert - {minutes} minutes",
+		message=(
+			f"Database activity monitor detected inactivity.\n\n"
+			f"**Activity table:** {target.table}\n"
+			f"**Timestamp column:** {target.timestamp_column}\n"
+			f"**Last update (UTC):** {last_update.isoformat()}\n"
+			f"**Inactive for:** {inactive_for}\n"
+			f"**Threshold:** {threshold}\n\n"
+			f"Please check the database for any issues."
+		),
+		subject=f"DB inactivity alert: {target.table} has no updates in {minutes} min",
+		body=(
+			"Database activity monitor detected inactivity.\n\n"
+			f"Activity table: {target.table}\n"
+			f"Timestamp column: {target.timestamp_column}\n"
+			f"Last update (UTC): {last_update.isoformat()}\n"
+			f"Inactive for: {inactive_for}\n"
+			f"Threshold: {threshold}\n"
+		),
+		threshold_minutes=target.inactivity_threshold_minutes,
+	)
+
+
+def resumed_alert(event: AlertEvent) -> Alert:
+	target = event.target
+	return Alert(
+		dedup_key=event.key,
+		title=f"🟢 Database Activity Resumed - {target.table}",
+		message=(
+			f"Database activity has been detected again.\n\n"
+			f"**Activity table:** {target.table}\n"
+			f"**Latest update (UTC):** {event.last_update.isoformat()}\n"
+			f"**Quiet for:** {event.inactive_for}"
+		),
+		subject=f"DB activity resumed: {target.table}",
+		body=(
+			"Database activity has been detected again.\n\n"
+			f"Activity table: {target.table}\n"
+			f"Latest update (UTC): {event.last_update.isoformat()}\n"
+			f"Quiet for: {event.inactive_for}\n"
+		),
+		threshold_minutes=target.inactivity_threshold_minutes,
+		facts=[{"name": "Status", "value": "🟢 Activity Resumed"}, {"name": "Table", "value": target.table}],
+		theme_color="2EB886",
+	)
+
+
+def rate_drop_alert(event: AlertEvent) -> Alert:
+	target = event.target
+	observed = f"{event.observed_rate:.2f} rows/min"
+	expected = f"{event.expected_rate:.2f} rows/min"
+	return Alert(
+		dedup_key=event.key,
+		title=f"📉 Database Activity Rate Drop - {target.table}",
+		message=(
+			f"Rows are arriving much slower than usual for this time of the week.\n\n"
+			f"**Activity table:** {target.table}\n"
+			f"**Observed rate:** {observed}\n"
+			f"**Usual rate:** {expected}\n"
+			f"**Last update (UTC):** {event.last_update.isoformat()}"
+		),
+		subject=f"DB activity rate drop: {target.table} at {observed} (usually {expected})",
+		body=(
+			"Rows are arriving much slower than usual for this time of the week.\n\n"
+			f"Activity table: {target.table}\n"
+			f"Observed rate: {observed}\n"
+			f"Usual rate: {expected}\n"
+			f"Last update (UTC): {event.last_update.isoformat()}\n"
+		),
+		threshold_minutes=target.inactivity_threshold_minutes,
+		facts=[
+			{"name": "Status", "value": "📉 Rate Drop"},
+			{"name": "Table", "value": target.table},
+			{"name": "Observed rate", "value": observed},
+			{"name": "Usual rate", "value": expected},
+		],
+		theme_color="FFB900",
+	)
+
+
+def _key_lines(event: AlertEvent) -> list[str]:
+	shown = event.keys[: settings.grouped_alert_max_keys]
+	lines = [f"{key}: last update {seen.isoformat()}" for key, seen in shown]
+	if len(event.keys) > len(shown):
+		lines.append(f"... and {len(event.keys) - len(shown)} more")
+	return lines
+
+
+def key_alert(event: AlertEvent) -> Alert:
+	"""Keys of a grouped target that went quiet ("inactive") or came back ("resumed")."""
+	target = event.target
+	count = len(event.keys)
+	if event.kind == "resumed":
+		icon, status = "🟢", "Activity Resumed"
+		headline = f"{count} key(s) of {target.table} active again"
+	else:
+		icon, status = "⚠️", "Key Inactivity Alert"
+		headline = f"{count} key(s) of {target.table} quiet for {target.inactivity_threshold_minutes}+ minutes"
+	lines = _key_lines(event)
+	return Alert(
+		dedup_key=event.key,
+		title=f"{icon} Database {status} - {headline}",
+		message=(
+			f"{headline}.\n\n"
+			f"**Activity table:** {target.table}\n"
+			f"**Key column:** {target.key_column}\n"
+			f"**Threshold:** {target.inactivity_timedelta()}\n\n" + "\n".join(f"- {line}" for line in lines)
+		),
+		subject=f"DB {status.lower()}: {headline}",
+		body=(
+			f"{headline}.\n\n"
+			f"Activity table: {target.table}\n"
+			f"Key column: {target.key_column}\n"
+			f"Threshold: {target.inactivity_timedelta()}\n\n" + "\n".join(lines) + "\n"
+		),
+		threshold_minutes=target.inactivity_threshold_minutes,
+		facts=[
+			{"name": "Status", "value": f"{icon} {status}"},
+			{"name": "Table", "value": f"{target.table}.{target.key_column}"},
+			{"name": "Keys", "value": str(count)},
+		],
+		theme_color="2EB886" if event.kind == "resumed" else "D83B01",
+	)
+
+
+def alert_for_event(event: AlertEvent) -> Alert:
+	if event.keys:
+		return key_alert(event)
+	if event.kind == "resumed":
+		return resumed_alert(event)
+	if event.kind == "rate_drop":
+		return rate_drop_alert(event)
+	return inactivity_alert(event.target, event.last_update, event.inactive_for, event.target.inactivity_timedelta())
+
+
+def digest_alert(events: list[AlertEvent]) -> Alert:
+	"""One card/email summarising many events, with a facts table per target."""
+	if len(events) == 1:
+		return alert_for_event(events[0])
+
+	inactive = [e for e in events if e.kind == "inactive"]
+	resumed = [e for e in events if e.kind == "resumed"]
+	dropped = [e for e in events if e.kind == "rate_drop"]
+	headline = ", ".join(
+		part for part in (
+			f"{len(inactive)} inactive" if inactive else "",
+			f"{len(dropped)} slow" if dropped else "",
+			f"{len(resumed)} resumed" if resumed else "",
+		) if part
+	)
+
+	sections = []
+	lines = []
+	for event in events:
+		target = event.target
+		status = {"inactive": "⚠️ Inactive", "rate_drop": "📉 Rate drop"}.get(event.kind, "🟢 Resumed")
+		facts = [
+			{"name": "Table", "value": f"{target.table}.{target.timestamp_column}"},
+			{"name": "Last update (UTC)", "value": event.last_update.isoformat()},
+			{"name": "Quiet for", "value": str(event.inactive_for)},
+			{"name": "Threshold", "value": f"{target.inactivity_threshold_minutes} minutes"},
+		]
+		line = (
+			f"{status:<12} {target.name:<30} table={target.table} last_update={event.last_update.isoformat()} "
+			f"quiet_for={event.inactive_for} threshold={target.inactivity_threshold_minutes}m"
+		)
+		if event.kind == "rate_drop":
+			rates = f"{event.observed_rate:.2f} rows/min (usually {event.expected_rate:.2f})"
+			facts.append({"name": "Arrival rate", "value": rates})
+			line += f" rate={rates}"
+		if event.keys:
+			facts.append({"name": f"Keys ({len(event.keys)})", "value": "; ".join(_key_lines(event))})
+			line += f" keys={len(event.keys)}"
+		sections.append({"activityTitle": f"{status}: {target.name}", "facts": facts})
+		lines.append(line)
+
+	digest_id = hashlib.sha1("|".join(sorted(e.key for e in events)).encode()).hexdigest()[:16]
+	return Alert(
+		dedup_key=f"digest:{digest_id}",
+		title=f"{'⚠️' if inactive else '📉' if dropped else '🟢'} Database Activity Digest - {headline}",
+		message=f"Database activity monitor digest: {headline} target(s).",
+		subject=f"DB activity digest: {headline}",
+		body="Database activity monitor digest.\n\n" + "\n".join(lines) + "\n",
+		threshold_minutes=max(e.target.inactivity_threshold_minutes for e in events),
+		facts=[
+			{"name": "Inactive targets", "value": str(len(inactive))},
+			{"name": "Slow targets", "value": str(len(dropped))},
+			{"name": "Resumed targets", "value": str(len(resumed))},
+		],
+		sections=sections,
+		theme_color="D83B01" if inactive else "FFB900" if dropped else "2EB886",
+	)
+
+
+def _delivery_fields(alert: Alert, channel: str, started: float) -> dict:
+	return {
+		"stage": "deliver",
+		"channel": channel,
+		"dedup_key": alert.dedup_key,
+		"duration_ms": round((time.perf_counter() - started) * 1000, 1),
+	}
+
+
+async def deliver_alert(alert: Alert) -> None:
+	"""Teams first, email as fallback; raises DeliveryError if every enabled channel failed or Teams only partly succeeded."""
+	with span("deliver_alert", dedup_key=alert.dedup_key):
+		await _deliver(alert)
+
+
+async def _deliver(alert: Alert) -> None:
+	errors: list[str] = []
+
+	# Try Teams notification first (primary method)
+	webhook_urls = configured_webhook_urls()
+	if alert.webhook_urls:
+		# A retry after a partial failure; webhooks dropped from the config since then are skipped
+		webhook_urls = [url for url in alert.webhook_urls if url in webhook_urls]
+		if not webhook_urls:
+			logger.info(f"Teams webhooks pending for {alert.dedup_key} are no longer configured, nothing to retry")
+			return
+	if settings.enable_teams_notifications and webhook_urls:
+		started = time.perf_counter()
+		try:
+			await send_teams_notification(
+				alert.title,
+				alert.message,
+				threshold_minutes=alert.threshold_minutes,
+				facts=alert.facts or None,
+				sections=alert.sections or None,
+				theme_color=alert.theme_color,
+				webhook_urls=webhook_urls,
+			)
+			logger.info("Teams notification sent successfully", extra=_delivery_fields(alert, "teams", started))
+			return
+		except PartialDeliveryError as e:
+			# The card is already in some channels, so no email fallback; retry just the failed webhooks
+			DELIVERY_FAILURES.labels("teams").inc()
+			logger.error(f"Failed to send Teams notification: {e}", extra=_delivery_fields(alert, "teams", started))
+			raise DeliveryError(f"teams: {e}", retry=replace(alert, webhook_urls=e.failed_urls)) from e
+		except Exception as e:
+			DELIVERY_FAILURES.labels("teams").inc()
+			logger.error(f"Failed to send Teams notification: {e}", exc_info=True, extra=_delivery_fields(alert, "teams", started))
+			errors.append(f"teams: {e}")
+		finally:
+			DELIVERY_LATENCY.labels("teams").observe(time.perf_counter() - started)
+
+	# Fallback to email if Teams fails or is disabled
+	if settings.enable_email_notifications:
+		started = time.perf_counter()
+		try:
+			await send_alert_email(alert.subject, alert.body)
+			logger.info("Alert email sent successfully", extra=_delivery_fields(alert, "email", started))
+			return
+		except Exception as e:
+			DELIVERY_FAILURES.labels("email").inc()
+			logger.error(f"Failed to send alert email: {e}", exc_info=True, extra=_delivery_fields(alert, "email", started))
+			errors.append(f"email: {e}")
+		finally:
+			DELIVERY_LATENCY.labels("email").observe(time.perf_counter() - started)
+	elif not errors:
+		logger.warning("Both Teams and email notifications are disabled")
+		return
+
+	raise DeliveryError("; ".join(errors))
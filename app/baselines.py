@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import logging
+import math
+import time
+from array import array
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone, tzinfo
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import settings
+from .db import get_engine
+from .timestamps import resolve_timezone
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_WEEK = 168
+# An hour only teaches the baseline if observations covered most of it (not a restart gap)
+MIN_HOUR_COVERAGE = 0.8
+# Longest gap between two observations that is still spread over the hours it spans
+MAX_GAP_HOURS = 6
+
+_SCHEMA = (
+	"""
+	CREATE TABLE IF NOT EXISTS arrival_baselines (
+		target TEXT PRIMARY KEY,
+		samples BLOB NOT NULL,
+		mean BLOB NOT NULL,
+		variance BLOB NOT NULL,
+		updated_at REAL NOT NULL
+	)
+	""",
+)
+
+
+@dataclass(frozen=True)
+class RateCheck:
+	"""Arrival rate over the trailing window compared with the learned baseline (rows per minute)."""
+
+	observed: float
+	expected: float
+	stddev: float
+	samples: int
+
+	@property
+	def dropped(self) -> bool:
+		floor = min(self.expected * settings.baseline_drop_ratio, self.expected - settings.baseline_sensitivity * self.stddev)
+		return self.observed < floor
+
+
+class HourOfWeekBaseline:
+	"""
+	Row-arrival rate statistics for one target, one slot per hour of the week.
+
+	Each slot keeps a sample count and an exponentially weighted mean and
+	variance of the hourly rate in three 168-entry float arrays (about 4 KB
+	per target), so memory stays fixed however long the monitor runs.
+	Arrival counts are spread over the time between two observations and
+	folded into a slot when its hour ends.
+	"""
+
+	__slots__ = ("samples", "mean", "variance", "tz", "_hour", "_hour_rows", "_hour_covered", "_last_at", "_recent", "dirty")
+
+	def __init__(self, tz: tzinfo = timezone.utc) -> None:
+		self.samples = array("d", bytes(8 * HOURS_PER_WEEK))
+		self.mean = array("d", bytes(8 * HOURS_PER_WEEK))
+		self.variance = array("d", bytes(8 * HOURS_PER_WEEK))
+		self.tz = tz
+		# Absolute hour number (epoch seconds // 3600) being accumulated, its rows and covered seconds
+		self._hour: Optional[int] = None
+		self._hour_rows = 0.0
+		self._hour_covered = 0.0
+		self._last_at: Optional[float] = None
+		# (start, end, rows) per observation inside the detection window
+		self._recent: deque[tuple[float, float, float]] = deque()
+		self.dirty = False
+
+	def slot(self, at: float) -> int:
+		local = datetime.fromtimestamp(at, tz=timezone.utc).astimezone(self.tz)
+		return local.weekday() * 24 + local.hour
+
+	def observe(self, at: float, rows: int) -> None:
+		"""Record `rows` new rows seen at `at` (epoch seconds) since the previous observation."""
+		start, self._last_at = self._last_at, at
+		if start is None or at <= start:
+			return
+		if at - start > MAX_GAP_HOURS * 3600:
+			# Too long to attribute to particular hours; restart the chain
+			self._hour = None
+			return
+		self._recent.append((start, at, float(rows)))
+		window_start = at - settings.baseline_window_minutes * 60
+		while self._recent and self._recent[0][1] <= window_start:
+			self._recent.popleft()
+
+		# Spread the rows evenly over [start, at], closing every hour boundary crossed
+		rate = rows / (at - start)
+		cursor = start
+		while cursor < at:
+			hour = int(cursor // 3600)
+			if hour != self._hour:
+				self._close_hour()
+				self._hour, self._hour_rows, self._hour_covered = hour, 0.0, 0.0
+			segment_end = min(at, (hour + 1) * 3600)
+			self._hour_rows += rate * (segment_end - cursor)
+			self._hour_covered += segment_end - cursor
+			cursor = segment_end
+
+	def _close_hour(self) -> None:
+		if self._hour is None or self._hour_covered < MIN_HOUR_COVERAGE * 3600:
+			return
+		slot = self.slot(self._hour * 3600)
+		value = self._hour_rows / (self._hour_covered / 60)
+		self.samples[slot] += 1
+		# Plain average while a slot is young, then exponential forgetting so the baseline follows drift
+		alpha = max(1 / self.samples[slot], settings.baseline_decay)
+		delta = value - self.mean[slot]
+		self.mean[slot] += alpha * delta
+		self.variance[slot] = (1 - alpha) * (self.variance[slot] + alpha * delta * delta)
+		self.dirty = True
+
+	def check(self, now: float) -> Optional[RateCheck]:
+		"""Compare the trailing window with the baseline; None while there is too little to go on."""
+		window = settings.baseline_window_minutes * 60
+		window_start = now - window
+		covered = rows = 0.0
+		for start, end, count in self._recent:
+			overlap = min(end, now) - max(start, window_start)
+			if overlap > 0:
+				covered += overlap
+				rows += count * overlap / (end - start)
+		if covered < window / 2:
+			return None
+		slot = self.slot(now - window / 2)
+		samples = int(self.samples[slot])
+		if samples < settings.baseline_min_samples:
+			return None
+		expected = self.mean[slot]
+		if expected * covered / 60 < settings.baseline_min_expected_rows:
+			# Too quiet at this hour for a drop to be distinguishable from noise
+			return None
+		return RateCheck(
+			observed=rows / (covered / 60),
+			expected=expected,
+			stddev=math.sqrt(self.variance[slot]),
+			samples=samples,
+		)
+
+
+class BaselineStore:
+	"""Persists learned baselines in the state database so a restart does not forget weeks of history."""
+
+	def __init__(self, database_url: Optional[str] = None) -> None:
+		self.database_url = database_url or settings.state_database_url
+
+	@property
+	def engine(self) -> AsyncEngine:
+		return get_engine(self.database_url)
+
+	async def create_schema(self) -> None:
+		async with self.engine.begin() as conn:
+			for statement in _SCHEMA:
+				await conn.execute(text(statement))
+
+	async def load(self) -> dict[str, tuple[array, array, array]]:
+		async with self.engine.connect() as conn:
+			rows = await conn.execute(text("SELECT target, samples, mean, variance FROM arrival_baselines"))
+			loaded = {}
+			for row in rows:
+				arrays = []
+				for blob in (row.samples, row.mean, row.variance):
+					values = array("d")
+					values.frombytes(blob)
+					arrays.append(values)
+				if all(len(a) == HOURS_PER_WEEK for a in arrays):
+					loaded[row.target] = tuple(arrays)
+			return loaded
+
+	async def save(self, baselines: Iterable[tuple[str, HourOfWeekBaseline]]) -> None:
+		params = [
+			{
+				"target": name,
+				"samples": b.samples.tobytes(),
+				"mean": b.mean.tobytes(),
+				"variance": b.variance.tobytes(),
+				"updated_at": time.time(),
+			}
+			for name, b in baselines
+		]
+		if not params:
+			return
+		async with self.engine.begin() as conn:
+			await conn.execute(
+				text(
+					"""
+					INSERT INTO arrival_baselines (target, samples, mean, variance, updated_at)
+					VALUES (:target, :samples, :mean, :variance, :updated_at)
+					ON CONFLICT (target) DO UPDATE SET
+						samples = excluded.samples, mean = excluded.mean,
+						variance = excluded.variance, updated_at = excluded.updated_at
+					"""
+				),
+				params,
+			)
+
+
+class BaselineTracker:
+	"""Hour-of-week arrival baselines for every target, loaded from and saved to a BaselineStore."""
+
+	def __init__(self, store: Optional[BaselineStore] = None) -> None:
+		self.store = store or BaselineStore()
+		self.tz = resolve_timezone(settings.baseline_timezone)
+		self.baselines: dict[str, HourOfWeekBaseline] = {}
+		self._loaded: dict[str, tuple[array, array, array]] = {}
+
+	async def load(self) -> None:
+		await self.store.create_schema()
+		self._loaded = await self.store.load()
+		logger.info(f"Loaded arrival baselines for {len(self._loaded)} target(s)")
+
+	def get(self, name: str) -> HourOfWeekBaseline:
+		baseline = self.baselines.get(name)
+		if baseline is None:
+			baseline = self.baselines[name] = HourOfWeekBaseline(self.tz)
+			saved = self._loaded.pop(name, None)
+			if saved is not None:
+				baseline.samples, baseline.mean, baseline.variance = saved
+		return baseline
+
+	def forget(self, names: Iterable[str]) -> None:
+		for name in names:
+			self.baselines.pop(name, None)
+
+	async def save(self) -> None:
+		"""Write the baselines that learned something since the last save."""
+		dirty = [(name, b) for name, b in self.baselines.items() if b.dirty]
+		if not dirty:
+			return
+		await self.store.save(dirty)
+		for _, baseline in dirty:
+			baseline.dirty = False
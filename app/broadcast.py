@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import settings
+from .db import get_engine
+from .metrics import STREAM_CLIENTS, STREAM_CLIENTS_DROPPED
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+	"""
+	CREATE TABLE IF NOT EXISTS status_events (
+		id INTEGER PRIMARY KEY AUTOINCREMENT,
+		payload TEXT NOT NULL,
+		created_at REAL NOT NULL,
+		size INTEGER NOT NULL DEFAULT 0
+	)
+	""",
+)
+
+# Drops the oldest rows once the newer ones add up to more than :max_bytes, always keeping the newest
+_PRUNE_BY_SIZE = """
+	DELETE FROM status_events WHERE id < (SELECT MAX(id) FROM status_events) AND id <= (
+		SELECT id FROM (SELECT id, SUM(size) OVER (ORDER BY id DESC) AS total FROM status_events) AS newest
+		WHERE total > :max_bytes ORDER BY id DESC LIMIT 1
+	)
+"""
+
+# Fields of a check result carried as columns of the compact relay row; the rest travel as-is
+_CHECK_COLUMNS = ("status", "checked_at", "last_activity", "next_check_at")
+
+
+@dataclass(frozen=True)
+class StatusMessage:
+	"""One event, serialised once and shared by every subscriber."""
+
+	seq: int
+	type: str
+	data: str
+
+	@property
+	def sse(self) -> str:
+		return f"id: {self.seq}\nevent: {self.type}\ndata: {self.data}\n\n"
+
+
+class Subscription:
+	"""A subscriber's bounded queue; the broadcaster closes it when the subscriber falls behind."""
+
+	def __init__(self, maxsize: int) -> None:
+		self.queue: asyncio.Queue[Optional[StatusMessage]] = asyncio.Queue(maxsize)
+		self.dropped = False
+
+	def close(self) -> None:
+		self.dropped = True
+		# Discard the backlog so the end-of-stream marker fits and is seen next
+		while not self.queue.empty():
+			self.queue.get_nowait()
+		self.queue.put_nowait(None)
+
+	async def get(self, timeout: float) -> Optional[StatusMessage]:
+		"""Next message; raises asyncio.TimeoutError when idle, returns None once dropped."""
+		return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class StatusBroadcaster:
+	"""
+	Fans check results and alert events out to live /events and /ws clients.
+
+	Publishing never waits on a client: every subscriber has a bounded queue
+	and one that is full is disconnected (it reconnects and starts from a
+	fresh snapshot). The latest check result per target is kept in memory, so
+	new subscribers are served without touching any database.
+	"""
+
+	def __init__(self, client_queue_size: Optional[int] = None, max_clients: Optional[int] = None) -> None:
+		self.client_queue_size = client_queue_size or settings.stream_client_queue_size
+		self.max_clients = max_clients or settings.stream_max_clients
+		self.latest: dict[str, dict] = {}
+		self.relay: Optional[StatusRelay] = None
+		self._subscribers: set[Subscription] = set()
+		self._seq = 0
+
+	@property
+	def subscriber_count(self) -> int:
+		return len(self._subscribers)
+
+	def snapshot(self) -> StatusMessage:
+		data = {"type": "snapshot", "at": datetime.now(timezone.utc).isoformat(), "targets": self.latest}
+		return StatusMessage(self._seq, "snapshot", json.dumps(data, default=str))
+
+	@property
+	def full(self) -> bool:
+		return len(self._subscribers) >= self.max_clients
+
+	def subscribe(self) -> Subscription:
+		subscription = Subscription(self.client_queue_size)
+		subscription.queue.put_nowait(self.snapshot())
+		self._subscribers.add(subscription)
+		STREAM_CLIENTS.set(len(self._subscribers))
+		return subscription
+
+	def unsubscribe(self, subscription: Subscription) -> None:
+		self._subscribers.discard(subscription)
+		STREAM_CLIENTS.set(len(self._subscribers))
+
+	async def publish(self, event: dict) -> None:
+		"""Record and fan out an event; in the scheduling worker also hand it to the relay."""
+		if self.relay is not None and self.relay.leading:
+			try:
+				await self.relay.store(event)
+			except Exception as e:
+				logger.error(f"Failed to relay status event: {e}", exc_info=True)
+		self.deliver(event)
+
+	def deliver(self, event: dict) -> None:
+		if event.get("type") == "check":
+			self.latest.update(event.get("targets", {}))
+		elif event.get("type") == "removed":
+			for name in event.get("targets", ()):
+				self.latest.pop(name, None)
+		if not self._subscribers:
+			return
+		self._seq += 1
+		message = StatusMessage(self._seq, event["type"], json.dumps(event, default=str))
+		for subscription in list(self._subscribers):
+			try:
+				subscription.queue.put_nowait(message)
+			except asyncio.QueueFull:
+				STREAM_CLIENTS_DROPPED.inc()
+				logger.info("Dropping a status stream client that stopped reading")
+				subscription.close()
+				self.unsubscribe(subscription)
+
+	async def close(self) -> None:
+		"""End every stream, e.g. on shutdown."""
+		for subscription in list(self._subscribers):
+			subscription.close()
+			self.unsubscribe(subscription)
+
+
+async def stream(subscription: Subscription) -> AsyncIterator[Optional[StatusMessage]]:
+	"""Messages for one client, with None as a keep-alive tick when nothing happened for a while."""
+	while True:
+		try:
+			message = await subscription.get(settings.stream_heartbeat_seconds)
+		except asyncio.TimeoutError:
+			yield None
+			continue
+		if message is None:
+			return
+		yield message
+
+
+class StatusRelay:
+	"""
+	Carries status events from the scheduling worker to HTTP-only workers.
+
+	Only the worker holding the scheduler lock probes, so it appends every
+	published event to status_events in the local state database: one
+	compact row per check tick, whatever the number of targets. The other
+	workers poll that table and re-broadcast what they read, so viewers on
+	any worker see the same stream and /health?deep=1 answers from it.
+	Either way the monitored databases are never queried on a viewer's
+	behalf. Rows are kept for STREAM_RELAY_RETENTION_SECONDS and within
+	STREAM_RELAY_MAX_BYTES.
+	"""
+
+	def __init__(self, broadcaster: StatusBroadcaster, database_url: Optional[str] = None) -> None:
+		self.broadcaster = broadcaster
+		self.database_url = database_url or settings.state_database_url
+		self.leading = False
+		self._last_id = 0
+		self._task: Optional[asyncio.Task] = None
+
+	@property
+	def engine(self) -> AsyncEngine:
+		return get_engine(self.database_url)
+
+	async def create_schema(self) -> None:
+		async with self.engine.begin() as conn:
+			for statement in _SCHEMA:
+				await conn.execute(text(statement))
+		# Tables created before events were pruned by size lack the column
+		if not await self._has_size_column():
+			try:
+				async with self.engine.begin() as conn:
+					await conn.execute(text("ALTER TABLE status_events ADD COLUMN size INTEGER NOT NULL DEFAULT 0"))
+			except DBAPIError:
+				# Every worker runs this at start; another one may have added it first
+				if not await self._has_size_column():
+					raise
+
+	async def _has_size_column(self) -> bool:
+		async with self.engine.connect() as conn:
+			columns = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_columns("status_events"))
+		return "size" in {column["name"] for column in columns}
+
+	async def store(self, event: dict) -> None:
+		"""Append one event (a whole tick for check results) and prune the table by age and size."""
+		payload = json.dumps(compact_event(event), default=str, separators=(",", ":"))
+		now = time.time()
+		async with self.engine.begin() as conn:
+			await conn.execute(
+				text("INSERT INTO status_events (payload, created_at, size) VALUES (:payload, :now, :size)"),
+				{"payload": payload, "now": now, "size": len(payload)},
+			)
+			await conn.execute(
+				text("DELETE FROM status_events WHERE created_at < :cutoff"),
+				{"cutoff": now - settings.stream_relay_retention_seconds},
+			)
+			await conn.execute(text(_PRUNE_BY_SIZE), {"max_bytes": settings.stream_relay_max_bytes})
+
+	def lead(self) -> None:
+		"""This worker took the scheduler lock: publish into the table instead of reading it."""
+		self.leading = True
+		if self._task is not None:
+			self._task.cancel()
+			self._task = None
+
+	def follow(self) -> None:
+		if self._task is None:
+			self._task = asyncio.create_task(self._follow())
+
+	async def stop(self) -> None:
+		if self._task is not None:
+			self._task.cancel()
+			self._task = None
+
+	async def _follow(self) -> None:
+		while True:
+			try:
+				await self._poll()
+			except asyncio.CancelledError:
+				raise
+			except Exception as e:
+				logger.error(f"Failed to read relayed status events: {e}", exc_info=True)
+			await asyncio.sleep(settings.stream_relay_poll_seconds)
+
+	async def _poll(self) -> None:
+		# Polled even without subscribers, so `latest` is current when the first one connects
+		async with self.engine.connect() as conn:
+			rows = (
+				await conn.execute(
+					text("SELECT id, payload FROM status_events WHERE id > :last ORDER BY id"), {"last": self._last_id}
+				)
+			).all()
+		for row in rows:
+			self.broadcaster.deliver(expand_event(json.loads(row.payload)))
+			self._last_id = row.id
+
+
+def compact_event(event: dict) -> dict:
+	"""
+	The relay form of an event: a check result becomes one row per target of
+	[name, status, last_activity, next_check_at, other fields], with the
+	tick time stated once instead of in every entry.
+	"""
+	if event.get("type") != "check":
+		return event
+	rows = [
+		[
+			name,
+			entry.get("status"),
+			entry.get("last_activity"),
+			entry.get("next_check_at"),
+			{k: v for k, v in entry.items() if k not in _CHECK_COLUMNS} or None,
+		]
+		for name, entry in event.get("targets", {}).items()
+	]
+	return {"type": "check", "at": event.get("at"), "rows": rows}
+
+
+def expand_event(event: dict) -> dict:
+	"""Inverse of compact_event, so relayed events look the same on every worker."""
+	if event.get("type") != "check" or "rows" not in event:
+		return event
+	at = event.get("at")
+	targets = {
+		name: {"status": status, **(extra or {}), "checked_at": at, "last_activity": last_activity, "next_check_at": due}
+		for name, status, last_activity, due, extra in event["rows"]
+	}
+	return {"type": "check", "at": at, "targets": targets}
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Hashable, Iterable, Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .db import get_engine
+from .probe import group_by_database
+from .targets import Target
+
+logger = logging.getLogger(__name__)
+
+CHANGE_DETECTION_MODES = {"off", "auto"}
+
+
+class ChangeSource:
+	"""
+	Cheap "did anything change?" signal for the targets of one database.
+
+	`signatures` returns an opaque value per target that differs whenever the
+	table may have changed; None means the source cannot tell and the target
+	must be probed.
+	"""
+
+	def __init__(self, database_url: str) -> None:
+		self.database_url = database_url
+
+	async def signatures(self, targets: list[Target]) -> dict[Target, Optional[Hashable]]:
+		return {t: None for t in targets}
+
+	async def aclose(self) -> None:
+		pass
+
+
+class SQLiteDataVersionSource(ChangeSource):
+	"""
+	`PRAGMA data_version` on a dedicated connection.
+
+	The counter moves whenever another connection commits to the database
+	file, so it is a database-wide signal: any write marks every target in
+	the file as changed.
+	"""
+
+	def __init__(self, database_url: str) -> None:
+		super().__init__(database_url)
+		self._conn: Optional[AsyncConnection] = None
+
+	async def signatures(self, targets: list[Target]) -> dict[Target, Optional[Hashable]]:
+		if self._conn is None:
+			self._conn = await get_engine(self.database_url).connect()
+		try:
+			version = (await self._conn.exec_driver_sql("PRAGMA data_version")).scalar_one()
+		finally:
+			# Never hold a read transaction open, or the counter would stop moving
+			await self._conn.rollback()
+		return {t: version for t in targets}
+
+	async def aclose(self) -> None:
+		if self._conn is not None:
+			await self._conn.close()
+			self._conn = None
+
+
+class PostgresStatSource(ChangeSource):
+	"""
+	Insert/update/delete counters from `pg_stat_user_tables`.
+
+	Tables missing from the statistics view (no privileges, foreign tables)
+	fall back to `pg_current_wal_lsn()`, which moves on any write to the
+	cluster. Statistics are flushed asynchronously, which is why the monitor
+	still probes targets close to their alert deadline.
+	"""
+
+	async def signatures(self, targets: list[Target]) -> dict[Target, Optional[Hashable]]:
+		names = sorted({t.table.rpartition(".")[2] for t in targets})
+		query = text(
+			"""
+			SELECT schemaname, relname, n_tup_ins + n_tup_upd + n_tup_del AS changes
+			FROM pg_stat_user_tables WHERE relname IN :names
+			"""
+		).bindparams(bindparam("names", expanding=True))
+		async with get_engine(self.database_url).connect() as conn:
+			rows = (await conn.execute(query, {"names": names})).all()
+			counters: dict[tuple[str, str], int] = {(schema, rel): changes for schema, rel, changes in rows}
+			wal_lsn: Any = None
+			if any(_stat_key(t, counters) is None for t in targets):
+				wal_lsn = (await conn.execute(text("SELECT pg_current_wal_lsn()::text"))).scalar_one()
+
+		signatures: dict[Target, Optional[Hashable]] = {}
+		for target in targets:
+			keys = _stat_key(target, counters)
+			signatures[target] = ("wal", wal_lsn) if keys is None else ("stat", tuple(counters[k] for k in keys))
+		return signatures
+
+
+def _stat_key(target: Target, counters: dict[tuple[str, str], int]) -> Optional[list[tuple[str, str]]]:
+	"""Statistics rows for a target; an unqualified table matches that name in any schema."""
+	schema, _, table = target.table.rpartition(".")
+	keys = [k for k in counters if k[1] == table and (not schema or k[0] == schema)]
+	return sorted(keys) or None
+
+
+def source_for(database_url: str) -> ChangeSource:
+	backend = get_engine(database_url).url.get_backend_name()
+	if backend == "sqlite":
+		return SQLiteDataVersionSource(database_url)
+	if backend == "postgresql":
+		return PostgresStatSource(database_url)
+	return ChangeSource(database_url)
+
+
+class ChangeDetector:
+	"""Tracks change signatures per target and reports which ones may have changed."""
+
+	def __init__(self) -> None:
+		self._sources: dict[str, ChangeSource] = {}
+		self._last: dict[Target, Hashable] = {}
+		# Signatures read before the current probe, committed once it succeeds
+		self._pending: dict[Target, Optional[Hashable]] = {}
+
+	async def _signatures(self, database_url: str, targets: list[Target]) -> dict[Target, Optional[Hashable]]:
+		source = self._sources.get(database_url)
+		if source is None:
+			source = self._sources[database_url] = source_for(database_url)
+		try:
+			return await source.signatures(targets)
+		except Exception as e:
+			logger.warning(f"Change detection failed for {len(targets)} target(s), probing them instead: {e}")
+			await source.aclose()
+			return {t: None for t in targets}
+
+	async def unchanged(self, targets: Iterable[Target]) -> set[Target]:
+		"""Targets whose signature matches the one recorded at their last probe."""
+		groups = group_by_database(targets)
+		batches = await asyncio.gather(*(self._signatures(url, group) for url, group in groups.items()))
+		result = set()
+		for signatures in batches:
+			for target, signature in signatures.items():
+				if signature is not None and self._last.get(target) == signature:
+					result.add(target)
+				self._pending[target] = signature
+		return result
+
+	def commit(self, targets: Iterable[Target]) -> None:
+		"""Remember the signatures read by `unchanged` for targets that were successfully probed."""
+		for target in targets:
+			signature = self._pending.pop(target, None)
+			if signature is not None:
+				self._last[target] = signature
+
+	def forget(self, targets: Iterable[Target]) -> None:
+		for target in targets:
+			self._last.pop(target, None)
+			self._pending.pop(target, None)
+
+	async def aclose(self) -> None:
+		for source in self._sources.values():
+			await source.aclose()
+		self._sources.clear()
@@ -1,12 +1,11 @@
 import os
+import socket
 from datetime import timedelta
+from functools import lru_cache
 from pathlib import Path
-from dotenv import load_dotenv
-
+from typing import cast
 
-# Ensure values from config.env override any existing environment variables
-# Explicitly load config.env from project root to avoid using a stale .env/system env
-load_dotenv(dotenv_path=Path(__file__).resolve().parents[1] / "config.env", override=True)
+from dotenv import load_dotenv
 
 
 def get_env(name: str, default: str | None = None) -> str:
@@ -19,33 +18,159 @@ def get_env(name: str, default: str | None = None) -> str:
 class Settings:
 	"""Runtime configuration loaded from environment variables."""
 
-	# FastAPI
-	app_name: str = os.getenv("APP_NAME", "db-activity-monitor")
-
-	# Database
-	database_url: str = get_env("DATABASE_URL")
-	activity_table: str = get_env("ACTIVITY_TABLE")
-	activity_timestamp_column: str = os.getenv("ACTIVITY_TIMESTAMP_COLUMN", "updated_at")
-
-	# Monitor
-	check_interval_seconds: int = int(os.getenv("CHECK_INTERVAL_SECONDS", "60"))
-	inactivity_threshold_minutes: int = int(os.getenv("INACTIVITY_THRESHOLD_MINUTES", "10"))
-	alert_cooldown_minutes: int = int(os.getenv("ALERT_COOLDOWN_MINUTES", "30"))
-
-	# Email (SMTP) - Optional
-	smtp_host: str = os.getenv("SMTP_HOST", "")
-	smtp_port: int = int(os.getenv("SMTP_PORT", "587"))
-	smtp_user: str = os.getenv("SMTP_USER", "")
-	smtp_password: str = os.getenv("SMTP_PASSWORD", "")
-	smtp_use_tls: bool = os.getenv("SMTP_USE_TLS", "true").lower() in {"1", "true", "yes", "on"}
-	smtp_use_ssl: bool = os.getenv("SMTP_USE_SSL", "false").lower() in {"1", "true", "yes", "on"}
-	mail_sender: str = os.getenv("MAIL_SENDER", "")
-	mail_recipients: list[str] = [r.strip() for r in os.getenv("MAIL_RECIPIENTS", "").split(",") if r.strip()]
-	
-	# Teams - Primary notification method
-	teams_webhook_url: str = os.getenv("TEAMS_WEBHOOK_URL", "")
-	enable_teams_notifications: bool = os.getenv("ENABLE_TEAMS_NOTIFICATIONS", "true").lower() in {"1", "true", "yes", "on"}
-	enable_email_notifications: bool = os.getenv("ENABLE_EMAIL_NOTIFICATIONS", "false").lower() in {"1", "true", "yes", "on"}
+	def __init__(self) -> None:
+		# FastAPI
+		self.app_name: str = os.getenv("APP_NAME", "db-activity-monitor")
+
+		# Logging - records are written by a background thread; "json" or "text" lines on stdout
+		self.log_level: str = os.getenv("LOG_LEVEL", "INFO").upper()
+		self.log_format: str = os.getenv("LOG_FORMAT", "json").lower()
+		self.log_queue_size: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+		# At most this many records per logging call site per window (0 disables the limit)
+		self.log_rate_limit_burst: int = int(os.getenv("LOG_RATE_LIMIT_BURST", "20"))
+		self.log_rate_limit_window_seconds: float = float(os.getenv("LOG_RATE_LIMIT_WINDOW_SECONDS", "60"))
+
+		# Tracing - span timings of checks and deliveries, exported to a rotating JSONL file (TRACE_FILE empty = not written)
+		self.trace_enabled: bool = os.getenv("TRACE_ENABLED", "false").lower() in {"1", "true", "yes", "on"}
+		self.trace_file: str = os.getenv("TRACE_FILE", str(Path(__file__).resolve().parents[1] / "activity_monitor.traces.jsonl"))
+		self.trace_file_max_bytes: int = int(os.getenv("TRACE_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+		self.trace_file_backups: int = int(os.getenv("TRACE_FILE_BACKUPS", "5"))
+		# Traces over this budget keep their full span tree in memory for /debug/slow-checks
+		self.trace_slow_check_ms: float = float(os.getenv("TRACE_SLOW_CHECK_MS", "1000"))
+		self.trace_slow_buffer_size: int = int(os.getenv("TRACE_SLOW_BUFFER_SIZE", "50"))
+
+		# Database
+		self.database_url: str = get_env("DATABASE_URL")
+		self.activity_table: str = os.getenv("ACTIVITY_TABLE", "")
+		self.activity_timestamp_column: str = os.getenv("ACTIVITY_TIMESTAMP_COLUMN", "updated_at")
+		# Time zone of naive timestamp values (IANA name); TIMESTAMP_FORMAT pins a strptime pattern or epoch_s/ms/us/ns
+		self.source_timezone: str = os.getenv("SOURCE_TIMEZONE", "UTC")
+		self.timestamp_format: str = os.getenv("TIMESTAMP_FORMAT", "")
+		# Alert per value of this column (e.g. tenant_id) rather than for the whole table
+		self.activity_key_column: str = os.getenv("ACTIVITY_KEY_COLUMN", "")
+
+		# Targets - optional JSON file listing several tables/databases to watch
+		self.targets_file: str = os.getenv("TARGETS_FILE", "")
+		# Bearer token for POST/PUT/PATCH/DELETE /targets; empty leaves those endpoints disabled
+		self.targets_api_token: str = os.getenv("TARGETS_API_TOKEN", "")
+		# Databases API-created targets may use besides DATABASE_URL and those of configured targets
+		self.targets_api_database_urls: list[str] = [u.strip() for u in os.getenv("TARGETS_API_DATABASE_URLS", "").split(",") if u.strip()]
+		# How often the scheduling worker picks up /targets changes made elsewhere
+		self.targets_reload_seconds: float = float(os.getenv("TARGETS_RELOAD_SECONDS", "10"))
+
+		# Probe - what to do when a timestamp column has no usable index: warn, refuse or ignore
+		self.timestamp_index_policy: str = os.getenv("TIMESTAMP_INDEX_POLICY", "warn").lower()
+		# Probe statements are cut off after this many seconds (0 = half of CHECK_INTERVAL_SECONDS)
+		self.probe_timeout_seconds: float = float(os.getenv("PROBE_TIMEOUT_SECONDS", "0"))
+		# Targets per batched probe statement (SQLite allows at most 500 UNION ALL branches)
+		self.probe_batch_size: int = int(os.getenv("PROBE_BATCH_SIZE", "500"))
+		# Databases probed at once; each runs its batches one after another on its own connection
+		self.probe_workers: int = int(os.getenv("PROBE_WORKERS", "16"))
+		# Circuit breaker - after this many failed probes in a row a database is skipped, retried with backoff
+		self.probe_breaker_failures: int = int(os.getenv("PROBE_BREAKER_FAILURES", "3"))
+		self.probe_breaker_reset_seconds: float = float(os.getenv("PROBE_BREAKER_RESET_SECONDS", "30"))
+		self.probe_breaker_max_reset_seconds: float = float(os.getenv("PROBE_BREAKER_MAX_RESET_SECONDS", "300"))
+
+		# Monitor
+		self.check_interval_seconds: int = int(os.getenv("CHECK_INTERVAL_SECONDS", "60"))
+		self.inactivity_threshold_minutes: int = int(os.getenv("INACTIVITY_THRESHOLD_MINUTES", "10"))
+		self.alert_cooldown_minutes: int = int(os.getenv("ALERT_COOLDOWN_MINUTES", "30"))
+		# "interval" probes every CHECK_INTERVAL_SECONDS; "adaptive" waits until a target could first be inactive
+		self.scheduler_mode: str = os.getenv("SCHEDULER_MODE", "interval").lower()
+		self.adaptive_jitter_seconds: float = float(os.getenv("ADAPTIVE_JITTER_SECONDS", "5"))
+		# Per-target series on /metrics; with tens of thousands of targets they outweigh the monitor's own state
+		self.per_target_metrics: bool = os.getenv("PER_TARGET_METRICS", "true").lower() in {"1", "true", "yes", "on"}
+		# "auto" skips the timestamp query while cheap change signals (SQLite data_version, pg_stat counters) are unchanged
+		self.change_detection: str = os.getenv("CHANGE_DETECTION", "off").lower()
+		# /check-now serves a probe result this fresh instead of querying again
+		self.check_cache_ttl_seconds: float = float(os.getenv("CHECK_CACHE_TTL_SECONDS", "5"))
+		self.change_detection_margin_seconds: int = int(os.getenv("CHANGE_DETECTION_MARGIN_SECONDS", "120"))
+
+		# Email (SMTP) - Optional
+		self.smtp_host: str = os.getenv("SMTP_HOST", "")
+		self.smtp_port: int = int(os.getenv("SMTP_PORT", "587"))
+		self.smtp_user: str = os.getenv("SMTP_USER", "")
+		self.smtp_password: str = os.getenv("SMTP_PASSWORD", "")
+		self.smtp_use_tls: bool = os.getenv("SMTP_USE_TLS", "true").lower() in {"1", "true", "yes", "on"}
+		self.smtp_use_ssl: bool = os.getenv("SMTP_USE_SSL", "false").lower() in {"1", "true", "yes", "on"}
+		# Unencrypted SMTP only on explicit opt-in (e.g. a local relay); otherwise TLS/SSL off still means STARTTLS
+		self.smtp_allow_plaintext: bool = os.getenv("SMTP_ALLOW_PLAINTEXT", "false").lower() in {"1", "true", "yes", "on"}
+		self.smtp_debug: bool = os.getenv("SMTP_DEBUG", "false").lower() in {"1", "true", "yes", "on"}
+		self.mail_sender: str = os.getenv("MAIL_SENDER", "")
+		self.mail_recipients: list[str] = [r.strip() for r in os.getenv("MAIL_RECIPIENTS", "").split(",") if r.strip()]
+
+		# Teams - Primary notification method
+		self.teams_webhook_url: str = os.getenv("TEAMS_WEBHOOK_URL", "")
+		self.teams_webhook_urls: list[str] = [u.strip() for u in os.getenv("TEAMS_WEBHOOK_URLS", "").split(",") if u.strip()]
+		self.teams_timeout_seconds: float = float(os.getenv("TEAMS_TIMEOUT_SECONDS", "10"))
+		self.teams_max_retries: int = int(os.getenv("TEAMS_MAX_RETRIES", "3"))
+		self.teams_backoff_seconds: float = float(os.getenv("TEAMS_BACKOFF_SECONDS", "1"))
+		self.teams_max_concurrency: int = int(os.getenv("TEAMS_MAX_CONCURRENCY", "4"))
+		self.enable_teams_notifications: bool = os.getenv("ENABLE_TEAMS_NOTIFICATIONS", "true").lower() in {"1", "true", "yes", "on"}
+		self.enable_email_notifications: bool = os.getenv("ENABLE_EMAIL_NOTIFICATIONS", "false").lower() in {"1", "true", "yes", "on"}
+
+		# Notification outbox - alerts are queued in the local state database and delivered by workers
+		# Kept apart from the monitored database so state writes never show up as activity there
+		self.state_database_url: str = os.getenv("STATE_DATABASE_URL", "sqlite+aiosqlite:///activity_monitor_state.db")
+		self.outbox_enabled: bool = os.getenv("OUTBOX_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+		self.outbox_workers: int = int(os.getenv("OUTBOX_WORKERS", "2"))
+		self.outbox_batch_size: int = int(os.getenv("OUTBOX_BATCH_SIZE", "10"))
+		self.outbox_poll_seconds: float = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+		self.outbox_max_attempts: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+		self.outbox_retry_base_seconds: float = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "30"))
+		# Claimed rows whose outcome was never recorded are delivered again after this long
+		self.outbox_claim_timeout_seconds: float = float(os.getenv("OUTBOX_CLAIM_TIMEOUT_SECONDS", "600"))
+		self.outbox_retention_days: int = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+
+		# Alert digest - collect events for this many seconds into one notification (0 sends each at once)
+		self.digest_window_seconds: float = float(os.getenv("DIGEST_WINDOW_SECONDS", "0"))
+		self.notify_on_resume: bool = os.getenv("NOTIFY_ON_RESUME", "true").lower() in {"1", "true", "yes", "on"}
+
+		# Live status stream (/events, /ws) - per-client queue bound, client limit and keep-alive interval
+		self.stream_client_queue_size: int = int(os.getenv("STREAM_CLIENT_QUEUE_SIZE", "100"))
+		self.stream_max_clients: int = int(os.getenv("STREAM_MAX_CLIENTS", "2000"))
+		self.stream_heartbeat_seconds: float = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+		# HTTP-only workers read the scheduling worker's events from the state database this often
+		self.stream_relay_poll_seconds: float = float(os.getenv("STREAM_RELAY_POLL_SECONDS", "1"))
+		# Relayed events are kept this long, and within this many bytes, for HTTP-only workers to catch up from
+		self.stream_relay_retention_seconds: float = float(os.getenv("STREAM_RELAY_RETENTION_SECONDS", "300"))
+		self.stream_relay_max_bytes: int = int(os.getenv("STREAM_RELAY_MAX_BYTES", str(16 * 1024 * 1024)))
+		# ... and the scheduling worker publishes its /metrics there this often for the others to serve
+		self.metrics_relay_seconds: float = float(os.getenv("METRICS_RELAY_SECONDS", "15"))
+
+		# Grouped targets - key discovery window of the first probe, and how long silent keys are remembered
+		self.grouped_lookback_minutes: float = float(os.getenv("GROUPED_LOOKBACK_MINUTES", "1440"))
+		self.grouped_key_retention_hours: float = float(os.getenv("GROUPED_KEY_RETENTION_HOURS", "168"))
+		# Per-key state is written to the state database at most this often (and at shutdown)
+		self.grouped_state_save_seconds: float = float(os.getenv("GROUPED_STATE_SAVE_SECONDS", "60"))
+		# Keys listed by name in one alert; the rest are counted
+		self.grouped_alert_max_keys: int = int(os.getenv("GROUPED_ALERT_MAX_KEYS", "50"))
+
+		# Learned baselines - alert when rows arrive much slower than usual for this hour of the week
+		self.baseline_enabled: bool = os.getenv("BASELINE_ENABLED", "false").lower() in {"1", "true", "yes", "on"}
+		self.baseline_window_minutes: float = float(os.getenv("BASELINE_WINDOW_MINUTES", "30"))
+		self.baseline_min_samples: int = int(os.getenv("BASELINE_MIN_SAMPLES", "3"))
+		self.baseline_min_expected_rows: float = float(os.getenv("BASELINE_MIN_EXPECTED_ROWS", "20"))
+		self.baseline_drop_ratio: float = float(os.getenv("BASELINE_DROP_RATIO", "0.5"))
+		self.baseline_sensitivity: float = float(os.getenv("BASELINE_SENSITIVITY", "3"))
+		self.baseline_decay: float = float(os.getenv("BASELINE_DECAY", "0.2"))
+		self.baseline_timezone: str = os.getenv("BASELINE_TIMEZONE", "UTC")
+
+		# Sharding - replicas split targets by consistent hashing and hold per-target leases in LEASE_DATABASE_URL
+		self.sharding_enabled: bool = os.getenv("SHARDING_ENABLED", "false").lower() in {"1", "true", "yes", "on"}
+		self.replica_id: str = os.getenv("REPLICA_ID") or f"{socket.gethostname()}-{os.getpid()}"
+		self.lease_database_url: str = os.getenv("LEASE_DATABASE_URL", "") or self.state_database_url
+		self.lease_ttl_seconds: float = float(os.getenv("LEASE_TTL_SECONDS", "30"))
+		self.lease_renew_seconds: float = float(os.getenv("LEASE_RENEW_SECONDS", "10"))
+
+		# Serving - python run.py starts WEB_CONCURRENCY workers; the one holding SCHEDULER_LOCK_FILE runs the checks
+		self.host: str = os.getenv("HOST", "0.0.0.0")
+		self.port: int = int(os.getenv("PORT", "8000"))
+		self.web_concurrency: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+		self.scheduler_lock_file: str = os.getenv("SCHEDULER_LOCK_FILE", "") or str(
+			Path(__file__).resolve().parents[1] / "activity_monitor.scheduler.lock"
+		)
+		self.scheduler_lock_retry_seconds: float = float(os.getenv("SCHEDULER_LOCK_RETRY_SECONDS", "5"))
 
 	def inactivity_timedelta(self) -> timedelta:
 		return timedelta(minutes=self.inactivity_threshold_minutes)
@@ -53,7 +178,29 @@ class Settings:
 	def alert_cooldown_timedelta(self) -> timedelta:
 		return timedelta(minutes=self.alert_cooldown_minutes)
 
+	def check_interval_timedelta(self) -> timedelta:
+		return timedelta(seconds=self.check_interval_seconds)
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+	"""Load config.env and build Settings on first use rather than at import time."""
+	# Ensure values from config.env override any existing environment variables
+	# Explicitly load config.env from project root to avoid using a stale .env/system env
+	load_dotenv(dotenv_path=Path(__file__).resolve().parents[1] / "config.env", override=True)
+	return Settings()
+
+
+class _LazySettings:
+	"""Stands in for the Settings instance and builds it on first attribute access."""
+
+	def __getattr__(self, name: str):
+		return getattr(get_settings(), name)
+
+	def __setattr__(self, name: str, value) -> None:
+		setattr(get_settings(), name, value)
+
 
-settings = Settings()
+settings = cast(Settings, _LazySettings())
 
 
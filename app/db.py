@@ -1,39 +1,71 @@
 from __future__ import annotations
 
-from sqlalchemy import text
+import os
+from functools import lru_cache
+
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from .config import settings
+from .metrics import instrument_engine
+
+
+_engines: dict[str, AsyncEngine] = {}
+
+
+def create_engine(database_url: str | None = None) -> AsyncEngine:
+	return create_async_engine(database_url or settings.database_url, pool_pre_ping=True, future=True)
+
 
+def get_engine(database_url: str | None = None) -> AsyncEngine:
+	"""Return the shared engine for a database URL, creating it on first use."""
+	url = database_url or settings.database_url
+	engine = _engines.get(url)
+	if engine is None:
+		engine = _engines[url] = create_engine(url)
+		instrument_engine(engine)
+	return engine
 
-def create_engine() -> AsyncEngine:
-	return create_async_engine(settings.database_url, pool_pre_ping=True, future=True)
 
+def same_database(first: str, second: str) -> bool:
+	"""Whether two URLs point at the same database, comparing SQLite files by absolute path."""
+	a, b = make_url(first), make_url(second)
+	if a.get_backend_name() == b.get_backend_name() == "sqlite":
+		return os.path.abspath(a.database or ":memory:") == os.path.abspath(b.database or ":memory:")
+	return (a.get_backend_name(), a.host, a.port, a.database) == (b.get_backend_name(), b.host, b.port, b.database)
 
-engine: AsyncEngine = create_engine()
-async_session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+async def dispose_engines() -> None:
+	for engine in _engines.values():
+		await engine.dispose()
+
+
+def __getattr__(name: str):
+	# `engine` and `async_session_factory` are built on first use so importing this module stays cheap
+	if name == "engine":
+		return get_engine()
+	if name == "async_session_factory":
+		return _session_factory()
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@lru_cache(maxsize=None)
+def _session_factory() -> sessionmaker:
+	return sessionmaker(bind=get_engine(), class_=AsyncSession, expire_on_commit=False)
 
 
 async def fetch_latest_timestamp() -> tuple[bool, str | None]:
 	"""
-	Return (has_row, iso_timestamp_str or None)
+	Return (has_row, iso_timestamp_str or None) for the ACTIVITY_TABLE target
 	"""
-	query = text(
-		f"""
-		SELECT {settings.activity_timestamp_column}
-		FROM {settings.activity_table}
-		ORDER BY {settings.activity_timestamp_column} DESC
-		LIMIT 1
-		"""
-	)
-	async with async_session_factory() as session:
-		result = await session.execute(query)
-		row = result.first()
-		if not row:
-			return False, None
-		ts = row[0]
-		# Support both datetime and string timestamps
-		return True, (ts.isoformat() if hasattr(ts, "isoformat") else str(ts))
-
+	from .probe import probe_targets
+	from .targets import default_target
+	from .tracing import span
 
+	target = default_target()
+	with span("fetch_latest_timestamp", target=target.name):
+		result = (await probe_targets([target]))[target.name]
+	if result.error is not None:
+		raise result.error
+	return result.has_row, result.latest_iso
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
+
+from .alerts import Alert, AlertEvent, alert_for_event, digest_alert
+
+if TYPE_CHECKING:
+	from .outbox import OutboxDispatcher
+
+logger = logging.getLogger(__name__)
+
+
+class AlertDigest:
+	"""
+	Collects alert events for a window and sends them as one notification.
+
+	The first event of a quiet period opens a window of `window_seconds`;
+	everything raised until it closes is rendered by `digest_alert` into a
+	single Teams card / email. An event for a critical target flushes the
+	buffer straight away, taking any pending events along with it.
+
+	With the outbox, each event is written to it as it arrives, held until
+	well after the window closes; the flush swaps the held rows for the
+	digest in one transaction. Events buffered by a process that dies before
+	the flush therefore still go out, one notification each.
+	"""
+
+	def __init__(
+		self,
+		send: Callable[[Alert], Awaitable[None]],
+		window_seconds: float,
+		dispatcher: Optional[OutboxDispatcher] = None,
+	) -> None:
+		self.send = send
+		self.window_seconds = window_seconds
+		self.dispatcher = dispatcher
+		self._events: list[AlertEvent] = []
+		# Outbox rows held for the buffered events, including superseded ones
+		self._held: list[int] = []
+		self._timer: Optional[asyncio.Task] = None
+		self._lock = asyncio.Lock()
+
+	async def add(self, event: AlertEvent) -> None:
+		async with self._lock:
+			# A newer event of the same kind for the same target supersedes the buffered one; an
+			# "inactive" followed by "resumed" keeps both, so the digest shows the whole episode
+			self._events = [e for e in self._events if (e.target.name, e.kind) != (event.target.name, event.kind)]
+			self._events.append(event)
+			if self.dispatcher is not None:
+				await self._hold(event)
+			if event.target.critical:
+				await self._flush_locked()
+			elif self._timer is None:
+				self._timer = asyncio.create_task(self._flush_after_window())
+
+	async def flush(self) -> None:
+		async with self._lock:
+			await self._flush_locked()
+
+	async def aclose(self) -> None:
+		"""Send whatever is buffered; called on shutdown."""
+		await self.flush()
+
+	async def _hold(self, event: AlertEvent) -> None:
+		try:
+			# Twice the window leaves the flush ample time to replace the row before it falls due
+			row_id = await self.dispatcher.outbox.hold(alert_for_event(event), time.time() + 2 * self.window_seconds)
+		except Exception as e:
+			logger.error(f"Failed to hold {event.key} in the outbox, it is only buffered in memory: {e}", exc_info=True)
+			return
+		if row_id is not None:
+			self._held.append(row_id)
+
+	async def _flush_after_window(self) -> None:
+		await asyncio.sleep(self.window_seconds)
+		async with self._lock:
+			self._timer = None
+			await self._flush_locked()
+
+	async def _flush_locked(self) -> None:
+		if self._timer is not None and self._timer is not asyncio.current_task():
+			self._timer.cancel()
+		self._timer = None
+		events, self._events = self._events, []
+		held, self._held = self._held, []
+		if not events:
+			return
+		logger.info(f"Sending digest of {len(events)} event(s)")
+		try:
+			if self.dispatcher is None:
+				await self.send(digest_alert(events))
+			elif len(events) == 1 and len(held) == 1:
+				# The held row already is the notification to send
+				await self.dispatcher.release(held)
+			else:
+				await self.dispatcher.enqueue(digest_alert(events), replaces=held)
+		except Exception as e:
+			logger.error(f"Failed to send alert digest: {e}", exc_info=True)
@@ -1,89 +1,227 @@
 from __future__ import annotations
 
+import asyncio
+import contextvars
+import logging
 import smtplib
 import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.utils import formatdate
+from typing import Optional
 
 from .config import settings
+from .tracing import span
 
+logger = logging.getLogger(__name__)
+# SMTP_DEBUG protocol transcript, kept apart so it can be filtered on its own
+transcript_logger = logging.getLogger(f"{__name__}.transcript")
 
-def _send_via_smtp_tls(host: str, port: int, user: str, password: str, sender: str, recipients: list[str], msg: MIMEText, timeout_seconds: float) -> None:
-	with smtplib.SMTP(host, port, timeout=timeout_seconds) as smtp:
-		smtp.set_debuglevel(1)
-		smtp.starttls()
-		smtp.login(user, password)
-		smtp.sendmail(sender, recipients, msg.as_string())
 
+def _open_smtp_tls(host: str, port: int, timeout_seconds: float) -> smtplib.SMTP:
+	smtp = smtplib.SMTP(host, port, timeout=timeout_seconds)
+	smtp.starttls()
+	return smtp
 
-def _send_via_smtp_ssl(host: str, port: int, user: str, password: str, sender: str, recipients: list[str], msg: MIMEText, timeout_seconds: float) -> None:
-	with smtplib.SMTP_SSL(host, port, timeout=timeout_seconds) as smtp:
-		smtp.set_debuglevel(1)
-		smtp.login(user, password)
-		smtp.sendmail(sender, recipients, msg.as_string())
 
+def _open_smtp_ssl(host: str, port: int, timeout_seconds: float) -> smtplib.SMTP:
+	return smtplib.SMTP_SSL(host, port, timeout=timeout_seconds)
 
-async def send_alert_email(subject: str, body: str) -> None:
-	msg = MIMEText(body, _charset="utf-8")
-	msg["Subject"] = subject
-	msg["From"] = settings.mail_sender
-	msg["To"] = ", ".join(settings.mail_recipients)
-	msg["Date"] = formatdate(localtime=True)
 
-	# Slightly longer timeout and connection strategy with fallbacks
-	timeout_seconds = 20
+def _open_smtp_plain(host: str, port: int, timeout_seconds: float) -> smtplib.SMTP:
+	return smtplib.SMTP(host, port, timeout=timeout_seconds)
 
+
+_OPENERS = {"tls": _open_smtp_tls, "ssl": _open_smtp_ssl, "plain": _open_smtp_plain}
+
+
+def _build_attempts() -> list[dict]:
 	# Build attempts based on explicit config first, then sensible fallbacks
 	attempts: list[dict] = []
 	if settings.smtp_use_ssl:
 		attempts.append({"mode": "ssl", "host": settings.smtp_host, "port": settings.smtp_port})
-	else:
+	elif settings.smtp_use_tls or not settings.smtp_allow_plaintext:
 		attempts.append({"mode": "tls", "host": settings.smtp_host, "port": settings.smtp_port})
+	else:
+		attempts.append({"mode": "plain", "host": settings.smtp_host, "port": settings.smtp_port})
 
 	# Add common Gmail fallbacks to improve resiliency if the configured one times out
 	if not any(a["mode"] == "tls" and a["port"] == 587 for a in attempts):
 		attempts.append({"mode": "tls", "host": settings.smtp_host or "smtp.gmail.com", "port": 587})
 	if not any(a["mode"] == "ssl" and a["port"] == 465 for a in attempts):
 		attempts.append({"mode": "ssl", "host": settings.smtp_host or "smtp.gmail.com", "port": 465})
+	return attempts
+
+
+class SMTPTransport:
+	"""
+	Keeps one authenticated SMTP session warm and runs all blocking smtplib
+	calls on a single worker thread, so the event loop never waits on SMTP.
+
+	smtplib connections are not thread safe; the one-thread executor both
+	bounds the work and serialises access to the shared connection.
+	"""
+
+	def __init__(self, timeout_seconds: float = 20) -> None:
+		self.timeout_seconds = timeout_seconds
+		self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smtp")
+		self._smtp: Optional[smtplib.SMTP] = None
+		self._endpoint: Optional[str] = None
+		self._lock = threading.Lock()
+
+	async def send(self, msg: MIMEText, sender: str, recipients: list[str]) -> None:
+		loop = asyncio.get_running_loop()
+		# Run in a copy of this task's context so spans opened on the SMTP thread join the current trace
+		context = contextvars.copy_context()
+		await loop.run_in_executor(self._executor, context.run, self._send_blocking, msg, sender, recipients)
+
+	async def aclose(self) -> None:
+		loop = asyncio.get_running_loop()
+		await loop.run_in_executor(self._executor, self._close_blocking)
+		self._executor.shutdown(wait=False)
+
+	def _send_blocking(self, msg: MIMEText, sender: str, recipients: list[str]) -> None:
+		with self._lock:
+			started = time.perf_counter()
+			smtp = self._warm_connection()
+			try:
+				# One session, one envelope for every recipient
+				with span("smtp_sendmail", recipients=len(recipients)):
+					smtp.sendmail(sender, recipients, msg.as_string())
+			except smtplib.SMTPServerDisconnected:
+				# The server dropped the idle session between NOOP and DATA; retry once fresh
+				self._close_blocking()
+				smtp = self._warm_connection()
+				with span("smtp_sendmail", recipients=len(recipients), retry=True):
+					smtp.sendmail(sender, recipients, msg.as_string())
+			logger.info(
+				f"✅ Email alert sent to {len(recipients)} recipient(s) via {self._endpoint}",
+				extra={"stage": "send", "channel": "email", "duration_ms": round((time.perf_counter() - started) * 1000, 1)},
+			)
+
+	def _warm_connection(self) -> smtplib.SMTP:
+		if self._smtp is not None:
+			try:
+				with span("smtp_noop"):
+					alive = self._smtp.noop()[0] == 250
+				if alive:
+					return self._smtp
+			except (smtplib.SMTPException, OSError):
+				pass
+			self._close_blocking()
+		return self._connect()
+
+	def _connect(self) -> smtplib.SMTP:
+		last_error: Exception | None = None
+
+		for attempt in _build_attempts():
+			mode = attempt["mode"]
+			host = attempt["host"]
+			port = attempt["port"]
+			endpoint = f"{mode.upper()} {host}:{port}"
+			fields = {"stage": "connect", "channel": "email", "endpoint": endpoint}
+			smtp: Optional[smtplib.SMTP] = None
+			started = time.perf_counter()
+			try:
+				logger.info(f"🔌 Trying SMTP {endpoint} ...", extra=fields)
+				with span("smtp_connect", endpoint=endpoint):
+					smtp = _OPENERS[mode](host, port, self.timeout_seconds)
+					if settings.smtp_debug:
+						# smtplib writes its transcript to stderr; send it through logging instead
+						smtp._print_debug = _log_transcript
+						smtp.set_debuglevel(1)
+					if settings.smtp_user:
+						smtp.login(settings.smtp_user, settings.smtp_password)
+				self._smtp = smtp
+				self._endpoint = endpoint
+				logger.info(
+					f"SMTP session open on {endpoint}",
+					extra={**fields, "duration_ms": round((time.perf_counter() - started) * 1000, 1)},
+				)
+				return smtp
+			except smtplib.SMTPAuthenticationError as e:
+				_quietly_close(smtp)
+				error_msg = f"❌ Gmail authentication failed: {e}"
+				logger.error(
+					f"{error_msg}. To fix this: generate an app password for 'Mail' at "
+					"https://myaccount.google.com/apppasswords (2-Step Verification must be enabled) "
+					"and set it as SMTP_PASSWORD in config.env",
+					extra=fields,
+				)
+				raise Exception(error_msg)
+			except (socket.timeout, smtplib.SMTPConnectError, smtplib.SMTPServerDisconnected) as e:
+				# Save and try next attempt
+				_quietly_close(smtp)
+				last_error = e
+				logger.warning(f"⚠️ Connection attempt failed for {endpoint}: {e}", extra=fields)
+				continue
+			except smtplib.SMTPException as e:
+				_quietly_close(smtp)
+				last_error = e
+				logger.error(f"❌ SMTP error on {endpoint}: {e}", extra=fields)
+				continue
+			except Exception as e:
+				_quietly_close(smtp)
+				last_error = e
+				logger.error(f"❌ Email error on {endpoint}: {e}", extra=fields)
+				continue
 
-	last_error: Exception | None = None
-
-	for attempt in attempts:
-		mode = attempt["mode"]
-		host = attempt["host"]
-		port = attempt["port"]
-		try:
-			print(f"🔌 Trying SMTP {mode.upper()} {host}:{port} ...")
-			if mode == "ssl":
-				_send_via_smtp_ssl(host, port, settings.smtp_user, settings.smtp_password, settings.mail_sender, settings.mail_recipients, msg, timeout_seconds)
-			else:
-				_send_via_smtp_tls(host, port, settings.smtp_user, settings.smtp_password, settings.mail_sender, settings.mail_recipients, msg, timeout_seconds)
-			print(f"✅ Email alert sent successfully to {settings.mail_recipients}")
-			return
-		except smtplib.SMTPAuthenticationError as e:
-			error_msg = f"❌ Gmail authentication failed: {e}"
-			print(error_msg)
-			print("🔧 To fix this:")
-			print("   1. Go to: https://myaccount.google.com/apppasswords")
-			print("   2. Generate a new app password for 'Mail'")
-			print("   3. Update SMTP_PASSWORD in your config.env file")
-			print("   4. Make sure 2-Step Verification is enabled")
-			raise Exception(error_msg)
-		except (socket.timeout, smtplib.SMTPConnectError, smtplib.SMTPServerDisconnected) as e:
-			# Save and try next attempt
-			last_error = e
-			print(f"⚠️ Connection attempt failed for {mode.upper()} {host}:{port}: {e}")
-			continue
-		except smtplib.SMTPException as e:
-			last_error = e
-			print(f"❌ SMTP error on {mode.upper()} {host}:{port}: {e}")
-			continue
-		except Exception as e:
-			last_error = e
-			print(f"❌ Email error on {mode.upper()} {host}:{port}: {e}")
-			continue
-
-	# If we reach here, all attempts failed
-	detail = f"Last error: {last_error}" if last_error else "Unknown error"
-	raise Exception(f"❌ SMTP connection failed for all attempts. {detail}")
+		# If we reach here, all attempts failed
+		detail = f"Last error: {last_error}" if last_error else "Unknown error"
+		raise Exception(f"❌ SMTP connection failed for all attempts. {detail}")
+
+	def _close_blocking(self) -> None:
+		_quietly_close(self._smtp)
+		self._smtp = None
+		self._endpoint = None
+
+
+def _log_transcript(*args) -> None:
+	line = " ".join(str(a) for a in args)
+	if "AUTH" in line.upper():
+		# The AUTH exchange carries base64-encoded credentials
+		line = line[: line.upper().index("AUTH") + 4] + " [redacted]"
+	transcript_logger.info(line, extra={"stage": "smtp", "channel": "email", "rate_limit": False})
+
+
+def _quietly_close(smtp: Optional[smtplib.SMTP]) -> None:
+	if smtp is None:
+		return
+	try:
+		smtp.quit()
+	except (smtplib.SMTPException, OSError):
+		smtp.close()
+
+
+_transport: Optional[SMTPTransport] = None
+
+
+def get_smtp_transport() -> SMTPTransport:
+	global _transport
+	if _transport is None:
+		_transport = SMTPTransport()
+	return _transport
+
+
+async def close_smtp_transport() -> None:
+	global _transport
+	if _transport is not None:
+		await _transport.aclose()
+		_transport = None
+
+
+async def send_alert_email(subject: str, body: str) -> None:
+	with span("send_alert_email", recipients=len(settings.mail_recipients)):
+		await _send_alert_email(subject, body)
+
+
+async def _send_alert_email(subject: str, body: str) -> None:
+	msg = MIMEText(body, _charset="utf-8")
+	msg["Subject"] = subject
+	msg["From"] = settings.mail_sender
+	msg["To"] = ", ".join(settings.mail_recipients)
+	msg["Date"] = formatdate(localtime=True)
 
+	await get_smtp_transport().send(msg, settings.mail_sender, settings.mail_recipients)
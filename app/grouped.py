@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import json
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import settings
+from .db import get_engine
+
+_SCHEMA = (
+	"""
+	CREATE TABLE IF NOT EXISTS grouped_key_state (
+		target TEXT PRIMARY KEY,
+		keys TEXT NOT NULL,
+		last_seen BLOB NOT NULL,
+		last_alert BLOB NOT NULL,
+		alerting BLOB NOT NULL,
+		updated_at REAL NOT NULL
+	)
+	""",
+)
+
+
+class KeyState:
+	"""
+	Last-seen and alert state for every key of one grouped target.
+
+	Keys map to slots in parallel arrays (epoch seconds as doubles, alert
+	flags as bytes) instead of one object per key, so 100k keys cost a few
+	MB and a full scan per check is a tight loop over flat arrays.
+	"""
+
+	def __init__(self) -> None:
+		self.index: dict[str, int] = {}
+		self.keys: list[str] = []
+		# Epoch seconds of the newest row seen per key
+		self.last_seen = array("d")
+		# Epoch seconds of the last alert per key (0 = never alerted)
+		self.last_alert = array("d")
+		# 1 while a key has been alerted on and not seen active again
+		self.alerting = bytearray()
+		# Changed since it was last saved to the KeyStateStore
+		self.dirty = False
+
+	def __len__(self) -> int:
+		return len(self.keys)
+
+	def observe(self, latest: dict[str, float]) -> list[tuple[int, float]]:
+		"""Record the newest row per key; returns (slot, previous last seen) for alerted keys that came back."""
+		resumed = []
+		for key, seen in latest.items():
+			slot = self.index.get(key)
+			if slot is None:
+				self.index[key] = len(self.keys)
+				self.keys.append(key)
+				self.last_seen.append(seen)
+				self.last_alert.append(0.0)
+				self.alerting.append(0)
+				self.dirty = True
+			elif seen > self.last_seen[slot]:
+				if self.alerting[slot]:
+					self.alerting[slot] = 0
+					resumed.append((slot, self.last_seen[slot]))
+				self.last_seen[slot] = seen
+				self.dirty = True
+		return resumed
+
+	def quiet(self, cutoff: float) -> list[int]:
+		"""Slots of keys with no row after `cutoff`."""
+		return [slot for slot, seen in enumerate(self.last_seen) if seen <= cutoff]
+
+	def earliest_active(self, cutoff: float) -> Optional[float]:
+		"""Oldest last-seen time among keys with a row after `cutoff`: the next key that can go quiet."""
+		seen = [seen for seen in self.last_seen if seen > cutoff]
+		return min(seen) if seen else None
+
+	def due(self, slots: Iterable[int], now: float, cooldown_seconds: float) -> list[int]:
+		"""The given slots whose alert cooldown has run out."""
+		last_alert = self.last_alert
+		return [slot for slot in slots if not last_alert[slot] or now >= last_alert[slot] + cooldown_seconds]
+
+	def mark_alerted(self, slots: Iterable[int], now: float) -> None:
+		for slot in slots:
+			self.last_alert[slot] = now
+			self.alerting[slot] = 1
+			self.dirty = True
+
+	def forget_before(self, cutoff: float) -> int:
+		"""Drop keys silent since before `cutoff` (e.g. retired tenants); returns how many."""
+		if not self.keys or min(self.last_seen) > cutoff:
+			return 0
+		keep = [slot for slot, seen in enumerate(self.last_seen) if seen > cutoff]
+		dropped = len(self.keys) - len(keep)
+		self.keys = [self.keys[slot] for slot in keep]
+		self.last_seen = array("d", (self.last_seen[slot] for slot in keep))
+		self.last_alert = array("d", (self.last_alert[slot] for slot in keep))
+		self.alerting = bytearray(self.alerting[slot] for slot in keep)
+		self.index = {key: slot for slot, key in enumerate(self.keys)}
+		self.dirty = True
+		return dropped
+
+	def describe(self, slots: Iterable[int]) -> tuple[tuple[str, datetime], ...]:
+		"""(key, last seen) pairs for alerts, most recently active first."""
+		pairs = [(self.keys[slot], self.last_seen[slot]) for slot in slots]
+		pairs.sort(key=lambda pair: pair[1], reverse=True)
+		return tuple((key, datetime.fromtimestamp(seen, tz=timezone.utc)) for key, seen in pairs)
+
+
+class KeyStateStore:
+	"""
+	Persists per-key state in the state database, so keys that were already
+	quiet before a restart (and older than the lookback window the first
+	probe reads) are still known, and alerted keys keep their cooldowns.
+	"""
+
+	def __init__(self, database_url: Optional[str] = None) -> None:
+		self.database_url = database_url or settings.state_database_url
+
+	@property
+	def engine(self) -> AsyncEngine:
+		return get_engine(self.database_url)
+
+	async def create_schema(self) -> None:
+		async with self.engine.begin() as conn:
+			for statement in _SCHEMA:
+				await conn.execute(text(statement))
+
+	async def load(self) -> dict[str, KeyState]:
+		async with self.engine.connect() as conn:
+			rows = await conn.execute(text("SELECT target, keys, last_seen, last_alert, alerting FROM grouped_key_state"))
+			loaded = {}
+			for row in rows:
+				state = KeyState()
+				state.keys = json.loads(row.keys)
+				state.last_seen.frombytes(row.last_seen)
+				state.last_alert.frombytes(row.last_alert)
+				state.alerting = bytearray(row.alerting)
+				if len(state.last_seen) == len(state.last_alert) == len(state.alerting) == len(state.keys):
+					state.index = {key: slot for slot, key in enumerate(state.keys)}
+					loaded[row.target] = state
+			return loaded
+
+	async def save(self, states: Iterable[tuple[str, KeyState]]) -> None:
+		params = [
+			{
+				"target": name,
+				"keys": json.dumps(state.keys),
+				"last_seen": state.last_seen.tobytes(),
+				"last_alert": state.last_alert.tobytes(),
+				"alerting": bytes(state.alerting),
+				"updated_at": time.time(),
+			}
+			for name, state in states
+		]
+		if not params:
+			return
+		async with self.engine.begin() as conn:
+			await conn.execute(
+				text(
+					"""
+					INSERT INTO grouped_key_state (target, keys, last_seen, last_alert, alerting, updated_at)
+					VALUES (:target, :keys, :last_seen, :last_alert, :alerting, :updated_at)
+					ON CONFLICT (target) DO UPDATE SET
+						keys = excluded.keys, last_seen = excluded.last_seen, last_alert = excluded.last_alert,
+						alerting = excluded.alerting, updated_at = excluded.updated_at
+					"""
+				),
+				params,
+			)
+
+	async def delete(self, names: Iterable[str]) -> None:
+		names = list(names)
+		if not names:
+			return
+		async with self.engine.begin() as conn:
+			await conn.execute(
+				text("DELETE FROM grouped_key_state WHERE target IN :names").bindparams(bindparam("names", expanding=True)),
+				{"names": names},
+			)
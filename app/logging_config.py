@@ -0,0 +1,157 @@
+"""
+Queue-based logging: the event loop only formats a record and drops it on an
+in-memory queue; a QueueListener thread does the stream I/O. Records are JSON
+(LOG_FORMAT=json) or plain text, and repetitive call sites are rate limited.
+
+Structured fields are passed with `extra`, e.g.
+`logger.info("Probe finished", extra={"target": name, "stage": "probe", "duration_ms": 12.5})`.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from .config import settings
+from .metrics import LOG_RECORDS_DROPPED
+
+LOG_FORMATS = {"json", "text"}
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has; anything else on a record came in through `extra`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+# Control fields that are not worth emitting (uvicorn's ANSI-coloured duplicate, our rate-limit opt-out)
+_HIDDEN_ATTRS = {"color_message", "rate_limit"}
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+	"""One JSON object per line: time, level, logger, message, then any `extra` fields."""
+
+	def format(self, record: logging.LogRecord) -> str:
+		entry = {
+			"ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+			"level": record.levelname,
+			"logger": record.name,
+			"message": record.getMessage(),
+		}
+		for key, value in vars(record).items():
+			if key not in _RECORD_ATTRS and key not in _HIDDEN_ATTRS:
+				entry[key] = value
+		if record.exc_info and not record.exc_text:
+			record.exc_text = self.formatException(record.exc_info)
+		if record.exc_text:
+			entry["exc"] = record.exc_text
+		return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+	"""
+	Lets at most `burst` records per call site (and target, when the record
+	names one) through every `window_seconds`.
+
+	The first record after a limited window carries a `suppressed` count.
+	Records logged with `extra={"rate_limit": False}` are never limited, nor
+	is the HTTP access log, whose volume follows the request rate by design.
+	"""
+
+	def __init__(self, burst: int, window_seconds: float) -> None:
+		super().__init__()
+		self.burst = burst
+		self.window_seconds = window_seconds
+		# (path, line, target) -> [window start, records let through, records suppressed]
+		self._windows: dict[tuple[str, int, Optional[str]], list] = {}
+		self._swept_at = time.monotonic()
+		self._lock = threading.Lock()
+
+	def filter(self, record: logging.LogRecord) -> bool:
+		if self.burst <= 0 or getattr(record, "rate_limit", True) is False or record.name == "uvicorn.access":
+			return True
+		key = (record.pathname, record.lineno, getattr(record, "target", None))
+		now = time.monotonic()
+		with self._lock:
+			if now - self._swept_at >= self.window_seconds:
+				self._sweep(now)
+			window = self._windows.get(key)
+			if window is None or now - window[0] >= self.window_seconds:
+				if window is not None and window[2]:
+					record.suppressed = window[2]
+				window = self._windows[key] = [now, 0, 0]
+			if window[1] >= self.burst:
+				window[2] += 1
+				LOG_RECORDS_DROPPED.labels("rate_limited").inc()
+				return False
+			window[1] += 1
+		return True
+
+	def _sweep(self, now: float) -> None:
+		"""Forget call sites that went quiet, so one-off keys (e.g. removed targets) do not pile up."""
+		# A window that suppressed records is kept one window longer for its `suppressed` count
+		self._windows = {
+			key: window
+			for key, window in self._windows.items()
+			if now - window[0] < self.window_seconds * (2 if window[2] else 1)
+		}
+		self._swept_at = now
+
+
+class DroppingQueueHandler(QueueHandler):
+	"""QueueHandler that drops records when the queue is full instead of blocking or raising."""
+
+	def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+		# Render the message and traceback now; the record is read on another thread later
+		record = logging.makeLogRecord(vars(record))
+		record.message = record.getMessage()
+		if record.exc_info:
+			record.exc_text = logging.Formatter().formatException(record.exc_info)
+		record.msg, record.args, record.exc_info = record.message, None, None
+		return record
+
+	def enqueue(self, record: logging.LogRecord) -> None:
+		try:
+			self.queue.put_nowait(record)
+		except queue.Full:
+			LOG_RECORDS_DROPPED.labels("queue_full").inc()
+
+
+def configure_logging() -> None:
+	"""Route the root logger (and uvicorn's loggers) through the queue; safe to call more than once."""
+	global _listener
+	if _listener is not None:
+		return
+	if settings.log_format not in LOG_FORMATS:
+		raise RuntimeError(f"LOG_FORMAT must be one of {sorted(LOG_FORMATS)}, got {settings.log_format!r}")
+
+	stream = logging.StreamHandler(sys.stdout)
+	stream.setFormatter(JsonFormatter() if settings.log_format == "json" else logging.Formatter(TEXT_FORMAT))
+	handler = DroppingQueueHandler(queue.Queue(maxsize=settings.log_queue_size))
+	handler.addFilter(RateLimitFilter(settings.log_rate_limit_burst, settings.log_rate_limit_window_seconds))
+
+	root = logging.getLogger()
+	root.handlers = [handler]
+	root.setLevel(settings.log_level)
+	for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+		uvicorn_logger = logging.getLogger(name)
+		uvicorn_logger.handlers = []
+		uvicorn_logger.propagate = True
+
+	_listener = QueueListener(handler.queue, stream)
+	_listener.start()
+	atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+	"""Flush queued records and stop the writer thread."""
+	global _listener
+	if _listener is not None:
+		_listener.stop()
+		_listener = None
@@ -1,56 +1,479 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from fastapi import FastAPI
+import secrets
+from dataclasses import asdict, replace
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from fastapi import APIRouter, Body, Depends, FastAPI, Header, HTTPException, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import ArgumentError
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
+from .broadcast import StatusRelay, stream
 from .config import settings
+from .db import dispose_engines, same_database
+from .emailer import close_smtp_transport
+from .logging_config import configure_logging
+from .metrics import SCHEDULER_EVENTS, SHARD_MEMBERS, SHARD_OWNED_TARGETS, scheduler_listener
+from .metrics_relay import MetricsRelay
 from .monitor import ActivityMonitor
+from .outbox import NotificationOutbox, OutboxDispatcher
+from .scheduler_lock import SchedulerLock
+from .scheduling import SCHEDULER_MODES
+from .sharding import LeaseStore, ShardCoordinator
+from .target_store import TargetStore
+from .targets import Target, target_from_dict, target_to_dict
+from .teams_notifier import close_http_session, start_http_session
+from .tracing import configure_tracing, get_tracer
+
+logger = logging.getLogger(__name__)
+
+# What make_url(...).render_as_string(hide_password=True) puts in place of a password
+MASKED_PASSWORD = "***"
+# Interval mode runs one check job per database, named with this prefix and the password-masked URL
+CHECK_JOB_PREFIX = "db-activity-check:"
+
+router = APIRouter()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Built by create_app(), so importing this module loads no settings or targets and starts no threads
+dispatcher: Optional[OutboxDispatcher] = None
+monitor: ActivityMonitor
+# Databases /targets may point at: the configured ones plus TARGETS_API_DATABASE_URLS
+api_database_urls: list[str] = []
+coordinator: Optional[ShardCoordinator] = None
+target_store: TargetStore
+# With several workers, status events and metrics reach the HTTP-only ones through the state database
+status_relay: Optional[StatusRelay] = None
+metrics_relay: Optional[MetricsRelay] = None
+scheduler: AsyncIOScheduler
+# With several HTTP workers only the holder of this lock runs the scheduler
+scheduler_lock: SchedulerLock
+_lock_waiter: Optional[asyncio.Task] = None
+# Revision of the target registry the monitor was last loaded from
+_targets_revision: Optional[int] = None
 
-app = FastAPI(title=settings.app_name)
-monitor = ActivityMonitor()
-scheduler = AsyncIOScheduler()
+
+def create_app() -> FastAPI:
+	"""Application factory; uvicorn calls it once in every worker (see app.server)."""
+	global dispatcher, monitor, api_database_urls, coordinator, target_store, status_relay, metrics_relay
+	global scheduler, scheduler_lock, _lock_waiter, _targets_revision
+	configure_logging()
+	configure_tracing()
+
+	dispatcher = OutboxDispatcher(NotificationOutbox()) if settings.outbox_enabled else None
+	monitor = ActivityMonitor(dispatcher=dispatcher)
+	api_database_urls = [settings.database_url, *settings.targets_api_database_urls, *{t.database_url for t in monitor.all_targets}]
+	coordinator = ShardCoordinator(LeaseStore()) if settings.sharding_enabled else None
+	target_store = TargetStore()
+	status_relay = StatusRelay(monitor.events) if settings.web_concurrency > 1 else None
+	monitor.events.relay = status_relay
+	metrics_relay = MetricsRelay() if settings.web_concurrency > 1 else None
+	scheduler = AsyncIOScheduler()
+	scheduler.add_listener(scheduler_listener, SCHEDULER_EVENTS)
+	scheduler_lock = SchedulerLock(settings.scheduler_lock_file)
+	_lock_waiter = None
+	_targets_revision = None
+
+	app = FastAPI(title=settings.app_name)
+	app.include_router(router)
+	app.add_event_handler("startup", startup_event)
+	app.add_event_handler("shutdown", shutdown_event)
+	return app
 
 
-@app.on_event("startup")
 async def startup_event() -> None:
-	# Schedule the periodic job
-	trigger = IntervalTrigger(seconds=settings.check_interval_seconds)
-	scheduler.add_job(monitor.check_and_alert, trigger, name="db-activity-check")
+	global _lock_waiter
+	if settings.scheduler_mode not in SCHEDULER_MODES:
+		raise RuntimeError(f"SCHEDULER_MODE must be one of {sorted(SCHEDULER_MODES)}, got {settings.scheduler_mode!r}")
+	if coordinator is not None and settings.lease_renew_seconds >= settings.lease_ttl_seconds:
+		raise RuntimeError("LEASE_RENEW_SECONDS must be shorter than LEASE_TTL_SECONDS")
+	if coordinator is not None and make_url(settings.lease_database_url).get_backend_name() == "sqlite":
+		logger.warning(
+			"SHARDING_ENABLED with a SQLite LEASE_DATABASE_URL: only replicas on this host sharing that file see each "
+			"other, and replicas elsewhere each check and alert on every target. Set LEASE_DATABASE_URL to a "
+			"database all replicas share."
+		)
+	monitored = {settings.database_url} | {t.database_url for t in monitor.all_targets}
+	if any(same_database(settings.state_database_url, url) for url in monitored if url):
+		logger.warning(
+			"STATE_DATABASE_URL points at a monitored database; outbox and target writes there will count as "
+			"activity and bump its change counters. Set STATE_DATABASE_URL to a separate database."
+		)
+	await start_http_session()
+	await target_store.create_schema()
+	await target_store.sync_config(monitor.all_targets)
+	await reload_targets()
+	if status_relay is not None:
+		await status_relay.create_schema()
+	if metrics_relay is not None:
+		await metrics_relay.create_schema()
+	if scheduler_lock.acquire():
+		await start_monitoring()
+	else:
+		logger.info("Another worker holds the scheduler lock; this one serves HTTP only")
+		monitor.sends_alerts = False
+		if status_relay is not None:
+			status_relay.follow()
+		_lock_waiter = asyncio.create_task(wait_for_scheduler_lock())
+
+
+async def wait_for_scheduler_lock() -> None:
+	# Take over if the scheduling worker exits
+	while not scheduler_lock.acquire():
+		await asyncio.sleep(settings.scheduler_lock_retry_seconds)
+	await start_monitoring()
+
+
+async def start_monitoring() -> None:
+	"""Start the outbox, shard leases and scheduled checks in the worker holding the scheduler lock."""
+	if dispatcher is not None:
+		await dispatcher.start()
+	await monitor.prepare()
+	if monitor.baselines is not None:
+		await monitor.baselines.load()
+	await monitor.load_key_state()
+	monitor.sends_alerts = True
+	if status_relay is not None:
+		status_relay.lead()
+	if metrics_relay is not None:
+		scheduler.add_job(
+			metrics_relay.publish,
+			IntervalTrigger(seconds=settings.metrics_relay_seconds),
+			id="metrics-relay",
+			name="metrics-relay",
+			next_run_time=datetime.now(timezone.utc),
+		)
+	if coordinator is not None:
+		await coordinator.start()
+		await rebalance_shards()
+		scheduler.add_job(
+			rebalance_shards,
+			IntervalTrigger(seconds=settings.lease_renew_seconds),
+			id="shard-rebalance",
+			name="shard-rebalance",
+		)
+	# Pick up /targets changes made by other workers or replicas
+	scheduler.add_job(
+		poll_target_registry,
+		IntervalTrigger(seconds=settings.targets_reload_seconds),
+		id="target-registry-sync",
+		name="target-registry-sync",
+	)
+	if settings.scheduler_mode == "adaptive":
+		# First run now; each run schedules the next one at the earliest target deadline
+		scheduler.add_job(adaptive_check, id="db-activity-check", name="db-activity-check")
+	else:
+		sync_check_jobs()
 	scheduler.start()
 
 
-@app.on_event("shutdown")
+def _check_job_id(database_url: str) -> str:
+	return f"{CHECK_JOB_PREFIX}{make_url(database_url).render_as_string(hide_password=True)}"
+
+
+def sync_check_jobs(due_now: Iterable[Target] = ()) -> None:
+	"""
+	Interval mode: keep one periodic job per database with targets to check,
+	adding and removing only the jobs whose database came or went. Databases
+	of `due_now` targets are checked immediately instead of at their next tick.
+	"""
+	if settings.scheduler_mode != "interval" or not scheduler_lock.held:
+		return
+	wanted = {_check_job_id(t.database_url): t.database_url for t in monitor.targets}
+	for job in scheduler.get_jobs():
+		if job.id.startswith(CHECK_JOB_PREFIX) and job.id not in wanted:
+			job.remove()
+	now = datetime.now(timezone.utc)
+	urgent = {_check_job_id(t.database_url) for t in due_now}
+	for job_id, database_url in wanted.items():
+		job = scheduler.get_job(job_id)
+		if job is None:
+			scheduler.add_job(
+				monitor.check_database,
+				IntervalTrigger(seconds=settings.check_interval_seconds),
+				args=[database_url],
+				id=job_id,
+				name=job_id,
+				# A database added at runtime is checked at once; at startup the first tick waits one interval
+				**({"next_run_time": now} if job_id in urgent else {}),
+			)
+		elif job_id in urgent:
+			job.modify(next_run_time=now)
+
+
+def _apply_target_changes(due_now: list[Target]) -> None:
+	if not scheduler_lock.held:
+		return
+	if settings.scheduler_mode == "adaptive":
+		if due_now and scheduler.running:
+			# Wake the adaptive job now; it recomputes the next deadline over the new targets
+			scheduler.add_job(adaptive_check, id="db-activity-check", name="db-activity-check", replace_existing=True)
+	else:
+		sync_check_jobs(due_now)
+
+
+async def reload_targets() -> None:
+	"""Load the target registry into the monitor and adjust only the affected scheduler jobs."""
+	global _targets_revision
+	revision = await target_store.revision()
+	targets = [target for target, _ in await target_store.load()]
+	added, removed, changed = monitor.update_targets(targets)
+	_targets_revision = revision
+	if not (added or removed or changed):
+		return
+	logger.info(f"Targets reloaded: {len(added)} added, {len(removed)} removed, {len(changed)} changed")
+	if removed:
+		await monitor.events.publish({"type": "removed", "targets": sorted(removed)})
+	if coordinator is not None and scheduler_lock.held:
+		# Ownership of added targets is settled here; their jobs follow from the new assignment
+		await rebalance_shards()
+	_apply_target_changes([t for t in monitor.targets if t.name in added | changed])
+	await monitor.release_connections()
+
+
+async def poll_target_registry() -> None:
+	try:
+		if await target_store.revision() != _targets_revision:
+			await reload_targets()
+	except Exception as e:
+		logger.error(f"Failed to reload targets: {e}", exc_info=True)
+
+
+async def adaptive_check() -> None:
+	try:
+		await monitor.check_due()
+	finally:
+		scheduler.add_job(
+			adaptive_check,
+			DateTrigger(run_date=monitor.next_wakeup()),
+			id="db-activity-check",
+			name="db-activity-check",
+			replace_existing=True,
+		)
+
+
+async def rebalance_shards() -> None:
+	try:
+		owned = await coordinator.rebalance(t.name for t in monitor.all_targets)
+	except Exception as e:
+		logger.error(f"Failed to renew shard leases: {e}", exc_info=True)
+		# Keep checking while our leases are still valid; after that another replica may hold them
+		if coordinator.leases_expired():
+			monitor.assign(set())
+			SHARD_OWNED_TARGETS.set(0)
+			_apply_target_changes([])
+			await monitor.release_connections()
+		return
+	gained = monitor.assign(owned)
+	SHARD_OWNED_TARGETS.set(len(monitor.targets))
+	SHARD_MEMBERS.set(len(coordinator.members))
+	# Probe newly owned targets now rather than at the next tick
+	_apply_target_changes(gained)
+	await monitor.release_connections()
+
+
 async def shutdown_event() -> None:
+	if _lock_waiter is not None:
+		_lock_waiter.cancel()
+	if status_relay is not None:
+		await status_relay.stop()
+	await monitor.events.close()
 	if scheduler.running:
 		scheduler.shutdown(wait=False)
+	if scheduler_lock.held:
+		if coordinator is not None:
+			await coordinator.stop()
+		if dispatcher is not None:
+			await dispatcher.stop()
+	await monitor.aclose()
+	await close_http_session()
+	await close_smtp_transport()
+	await dispose_engines()
+	scheduler_lock.release()
 
 
-@app.get("/health")
-async def health() -> dict:
+@router.get("/health")
+async def health(deep: bool = False) -> dict:
+	# The deep view reports cached probe freshness and never touches the database
+	if deep:
+		# HTTP-only workers run no checks; they report what the scheduling worker relayed, or "unknown"
+		snapshot = monitor.health_snapshot(None if scheduler_lock.held else monitor.events.latest)
+		snapshot["databases"] = monitor.probe_engine.connections.snapshot()
+		if coordinator is not None:
+			snapshot["shard"] = coordinator.snapshot()
+		return snapshot
 	return {"status": "ok"}
 
 
-@app.get("/check-now")
+@router.get("/metrics")
+async def metrics() -> Response:
+	if metrics_relay is None or scheduler_lock.held:
+		return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+	# The series that matter live in the scheduling worker; serve what it last published
+	body = await metrics_relay.latest()
+	if body is None:
+		raise HTTPException(status_code=503, detail="The scheduling worker has not published metrics yet")
+	return Response(body, media_type=CONTENT_TYPE_LATEST)
+
+
+@router.get("/debug/slow-checks")
+async def slow_checks() -> dict:
+	"""Span trees of recent checks and deliveries that took longer than TRACE_SLOW_CHECK_MS."""
+	tracer = get_tracer()
+	if tracer is None:
+		raise HTTPException(status_code=404, detail="Tracing is disabled (TRACE_ENABLED=false)")
+	traces = tracer.slow_traces()
+	return {"budget_ms": tracer.slow_ms, "count": len(traces), "traces": traces}
+
+
+@router.get("/events")
+async def status_events() -> StreamingResponse:
+	"""Server-Sent Events: a snapshot, then every check result and alert as it happens."""
+	if monitor.events.full:
+		raise HTTPException(status_code=503, detail="Too many status stream clients")
+
+	async def body():
+		subscription = monitor.events.subscribe()
+		try:
+			async for message in stream(subscription):
+				yield message.sse if message is not None else ": keep-alive\n\n"
+		finally:
+			monitor.events.unsubscribe(subscription)
+
+	return StreamingResponse(
+		body(),
+		media_type="text/event-stream",
+		# Stop proxies from buffering the stream
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+
+
+@router.websocket("/ws")
+async def status_websocket(websocket: WebSocket) -> None:
+	"""The /events stream over a WebSocket: one JSON object per message."""
+	if monitor.events.full:
+		await websocket.close(code=1013)
+		return
+	await websocket.accept()
+	subscription = monitor.events.subscribe()
+	try:
+		async for message in stream(subscription):
+			# Idle ticks double as a liveness check, since only a send notices a vanished client
+			await websocket.send_text(message.data if message is not None else '{"type": "keep-alive"}')
+		await websocket.close()
+	except WebSocketDisconnect:
+		pass
+	finally:
+		monitor.events.unsubscribe(subscription)
+
+
+@router.get("/check-now")
 async def manual_check() -> dict:
-	return await monitor.check_and_alert()
+	return await monitor.check_now()
+
+
+async def _find_target(name: str) -> Target:
+	# Read from the store rather than this worker's list, which only the scheduler lock holder keeps current
+	target = await target_store.get(name)
+	if target is not None:
+		return target
+	raise HTTPException(status_code=404, detail=f"Unknown target {name!r}")
+
+
+async def _parse_target(data: dict) -> Target:
+	try:
+		target = target_from_dict(data)
+		allowed = any(same_database(target.database_url, url) for url in api_database_urls)
+	except (RuntimeError, ValueError, TypeError, ArgumentError) as e:
+		raise HTTPException(status_code=422, detail=str(e))
+	if not allowed:
+		raise HTTPException(
+			status_code=422, detail="database_url is not a configured database; list it in TARGETS_API_DATABASE_URLS"
+		)
+	return await _restore_password(target)
+
+
+async def _restore_password(target: Target) -> Target:
+	"""A URL echoed back from GET /targets carries the masked password; put the stored one back."""
+	url = make_url(target.database_url)
+	if url.password != MASKED_PASSWORD:
+		return target
+	# The target's own stored URL first, then the configured databases
+	stored_target = await target_store.get(target.name)
+	candidates = ([stored_target.database_url] if stored_target is not None else []) + api_database_urls
+	for candidate in candidates:
+		stored = make_url(candidate)
+		if stored.username == url.username and stored.password and same_database(candidate, target.database_url):
+			return replace(target, database_url=url.set(password=stored.password).render_as_string(hide_password=False))
+	raise HTTPException(status_code=422, detail="database_url carries the masked password; send the real one")
+
+
+def require_targets_token(authorization: Optional[str] = Header(None)) -> None:
+	"""Guards the endpoints that change targets; they stay disabled until TARGETS_API_TOKEN is set."""
+	if not settings.targets_api_token:
+		raise HTTPException(status_code=403, detail="Changing targets over the API is disabled; set TARGETS_API_TOKEN")
+	expected = f"Bearer {settings.targets_api_token}".encode()
+	if not secrets.compare_digest((authorization or "").encode(), expected):
+		raise HTTPException(status_code=401, detail="Invalid or missing bearer token", headers={"WWW-Authenticate": "Bearer"})
+
+
+async def _save_target(target: Target) -> dict:
+	await target_store.put(target)
+	await reload_targets()
+	return target_to_dict(target)
+
+
+@router.get("/targets")
+async def list_targets() -> list[dict]:
+	return [{**target_to_dict(target), "source": source} for target, source in await target_store.load()]
+
+
+@router.get("/targets/{name}")
+async def get_target(name: str) -> dict:
+	return target_to_dict(await _find_target(name))
+
+
+@router.post("/targets", status_code=201, dependencies=[Depends(require_targets_token)])
+async def create_target(payload: dict = Body(...)) -> dict:
+	target = await _parse_target(payload)
+	if not await target_store.create(target):
+		raise HTTPException(status_code=409, detail=f"Target {target.name!r} already exists")
+	await reload_targets()
+	return target_to_dict(target)
+
+
+@router.put("/targets/{name}", dependencies=[Depends(require_targets_token)])
+async def replace_target(name: str, payload: dict = Body(...)) -> dict:
+	"""Create or replace a target; omitted fields take their configured defaults."""
+	return await _save_target(await _parse_target({**payload, "name": name}))
+
+
+@router.patch("/targets/{name}", dependencies=[Depends(require_targets_token)])
+async def update_target(name: str, payload: dict = Body(...)) -> dict:
+	"""Change some fields of a target, e.g. {"inactivity_threshold_minutes": 30}."""
+	if payload.get("name", name) != name:
+		raise HTTPException(status_code=422, detail="Targets cannot be renamed; create a new one instead")
+	return await _save_target(await _parse_target({**asdict(await _find_target(name)), **payload}))
+
+
+@router.delete("/targets/{name}", status_code=204, dependencies=[Depends(require_targets_token)])
+async def delete_target(name: str) -> Response:
+	if not await target_store.delete(name):
+		raise HTTPException(status_code=404, detail=f"Unknown target {name!r}")
+	await reload_targets()
+	return Response(status_code=204)
 
 
 if __name__ == "__main__":
-	import uvicorn
-	uvicorn.run(
-		"app.main:app",
-		host="0.0.0.0",
-		port=8000,
-		reload=True,
-		log_level="info"
-	)
+	from .server import main
+
+	main()
 
 
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional
+
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED, JobEvent
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+if TYPE_CHECKING:
+	from .target_state import TargetState
+
+# Probes are cheap when indexed and seconds-long when not; buckets cover both
+PROBE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DELIVERY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+PROBE_LATENCY = Histogram(
+	"activity_probe_duration_seconds",
+	"Latest-timestamp probe latency per target (the batched statement for its database)",
+	["target"],
+	buckets=PROBE_BUCKETS,
+)
+PROBE_ERRORS = Counter("activity_probe_errors_total", "Failed probes per target", ["target"])
+PROBES_SKIPPED = Counter(
+	"activity_probes_skipped_total", "Timestamp queries skipped because the change signal was unchanged", ["target"]
+)
+PROBE_TIMEOUTS = Counter("activity_probe_timeouts_total", "Probe statements abandoned at PROBE_TIMEOUT_SECONDS", ["database"])
+PROBE_CIRCUIT_OPEN = Gauge("activity_probe_circuit_open", "1 while probes of a database fail fast after repeated errors", ["database"])
+TARGET_INACTIVE_SECONDS = Gauge(
+	"activity_target_inactive_seconds", "Seconds since the newest row of each target", ["target"]
+)
+TARGET_ALERTING = Gauge(
+	"activity_target_alerting", "1 while a target is past its inactivity threshold", ["target"]
+)
+TARGET_INACTIVE_KEYS = Gauge(
+	"activity_target_inactive_keys", "Keys of a grouped target past the inactivity threshold", ["target"]
+)
+
+# Series labelled by target name, dropped again when a target is removed
+_TARGET_LABELLED = (PROBE_LATENCY, PROBE_ERRORS, PROBES_SKIPPED, TARGET_INACTIVE_SECONDS, TARGET_ALERTING, TARGET_INACTIVE_KEYS)
+
+
+def forget_target_metrics(name: str) -> None:
+	"""Remove every per-target series of `name`, so /metrics stops reporting a target that is gone."""
+	for metric in _TARGET_LABELLED:
+		try:
+			metric.remove(name)
+		except KeyError:
+			pass
+
+
+DELIVERY_LATENCY = Histogram(
+	"notification_delivery_duration_seconds",
+	"Alert delivery latency per channel",
+	["channel"],
+	buckets=DELIVERY_BUCKETS,
+)
+DELIVERY_FAILURES = Counter("notification_delivery_failures_total", "Failed alert deliveries per channel", ["channel"])
+
+SCHEDULER_LAG = Histogram(
+	"scheduler_job_lag_seconds",
+	"Delay between a job's scheduled run time and its submission",
+	["job"],
+	buckets=LAG_BUCKETS,
+)
+SCHEDULER_MISSED = Counter("scheduler_job_missed_total", "Runs skipped because they were past their misfire grace time", ["job"])
+SCHEDULER_OVERLAPPED = Counter(
+	"scheduler_job_overlapped_total", "Runs skipped because the previous run was still in progress", ["job"]
+)
+
+STREAM_CLIENTS = Gauge("status_stream_clients", "Connected /events and /ws clients")
+STREAM_CLIENTS_DROPPED = Counter("status_stream_clients_dropped_total", "Stream clients disconnected for falling behind")
+
+LOG_RECORDS_DROPPED = Counter(
+	"log_records_dropped_total", "Log records discarded by the rate limit or because the log queue was full", ["reason"]
+)
+TRACE_SPANS_DROPPED = Counter("trace_spans_dropped_total", "Spans not exported because the trace queue was full")
+
+SHARD_OWNED_TARGETS = Gauge("shard_owned_targets", "Targets whose lease this replica holds")
+SHARD_MEMBERS = Gauge("shard_members", "Live replicas sharing the targets")
+
+
+def scheduler_listener(job_event: JobEvent) -> None:
+	"""APScheduler listener recording job lag, misses and overlapping runs."""
+	name = job_event.job_id
+	if job_event.code == EVENT_JOB_SUBMITTED:
+		now = datetime.now(timezone.utc)
+		for scheduled in job_event.scheduled_run_times:
+			SCHEDULER_LAG.labels(name).observe(max((now - scheduled).total_seconds(), 0.0))
+	elif job_event.code == EVENT_JOB_MISSED:
+		SCHEDULER_MISSED.labels(name).inc()
+	elif job_event.code == EVENT_JOB_MAX_INSTANCES:
+		SCHEDULER_OVERLAPPED.labels(name).inc()
+
+
+SCHEDULER_EVENTS = EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES
+
+_engines: list[AsyncEngine] = []
+_checkouts: dict[str, int] = {}
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+	"""Count pool checkouts for an engine; current pool sizes are read at scrape time."""
+	label = engine.url.render_as_string(hide_password=True)
+	_engines.append(engine)
+	_checkouts.setdefault(label, 0)
+
+	def on_checkout(*_args) -> None:
+		_checkouts[label] += 1
+
+	event.listen(engine.sync_engine, "checkout", on_checkout)
+
+
+class PoolCollector(Collector):
+	"""Exposes SQLAlchemy pool state for every instrumented engine."""
+
+	def collect(self):
+		checked_out = GaugeMetricFamily("db_pool_checked_out", "Connections currently checked out", labels=["database"])
+		checked_in = GaugeMetricFamily("db_pool_checked_in", "Idle connections in the pool", labels=["database"])
+		overflow = GaugeMetricFamily("db_pool_overflow", "Connections open beyond the pool size", labels=["database"])
+		size = GaugeMetricFamily("db_pool_size", "Configured pool size", labels=["database"])
+		checkouts = CounterMetricFamily("db_pool_checkouts", "Pool checkouts since startup", labels=["database"])
+
+		for engine in list(_engines):
+			label = engine.url.render_as_string(hide_password=True)
+			pool = engine.sync_engine.pool
+			# Not every pool class (e.g. NullPool, StaticPool) tracks these
+			for family, attr in ((checked_out, "checkedout"), (checked_in, "checkedin"), (overflow, "overflow"), (size, "size")):
+				if hasattr(pool, attr):
+					family.add_metric([label], getattr(pool, attr)())
+			checkouts.add_metric([label], _checkouts.get(label, 0))
+
+		yield from (checked_out, checked_in, overflow, size, checkouts)
+
+
+REGISTRY.register(PoolCollector())
+
+_target_state: Optional[TargetState] = None
+
+
+def track_target_state(state: TargetState) -> None:
+	"""Export the target counts of this monitor state at scrape time."""
+	global _target_state
+	_target_state = state
+
+
+class TargetCollector(Collector):
+	"""Target totals that stay cheap to scrape with PER_TARGET_METRICS off."""
+
+	def collect(self):
+		state = _target_state
+		if state is None:
+			return
+		yield GaugeMetricFamily("activity_targets", "Targets known to the monitor", value=len(state))
+		yield GaugeMetricFamily(
+			"activity_targets_alerting", "Targets alerted on and not yet seen active again", value=state.alerting.count(1)
+		)
+
+
+REGISTRY.register(TargetCollector())
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Optional
+
+from prometheus_client import REGISTRY, generate_latest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import settings
+from .db import get_engine
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+	"""
+	CREATE TABLE IF NOT EXISTS metrics_snapshot (
+		id INTEGER PRIMARY KEY,
+		body BLOB NOT NULL,
+		pid INTEGER NOT NULL,
+		created_at REAL NOT NULL
+	)
+	""",
+)
+
+_UPSERT = """
+	INSERT INTO metrics_snapshot (id, body, pid, created_at) VALUES (1, :body, :pid, :now)
+	ON CONFLICT (id) DO UPDATE SET body = excluded.body, pid = excluded.pid, created_at = excluded.created_at
+"""
+
+
+class MetricsRelay:
+	"""
+	Serves the scheduling worker's registry from every worker.
+
+	Probe, target, delivery, breaker and shard series only exist in the
+	worker holding the scheduler lock. It writes its exposition to a single
+	row of metrics_snapshot every METRICS_RELAY_SECONDS; the other workers
+	answer /metrics with that row, so a scrape sees the same series whichever
+	worker takes it. Worker-local series (stream clients, dropped log records)
+	are therefore the scheduling worker's.
+	"""
+
+	def __init__(self, database_url: Optional[str] = None) -> None:
+		self.database_url = database_url or settings.state_database_url
+
+	@property
+	def engine(self) -> AsyncEngine:
+		return get_engine(self.database_url)
+
+	async def create_schema(self) -> None:
+		async with self.engine.begin() as conn:
+			for statement in _SCHEMA:
+				await conn.execute(text(statement))
+
+	async def publish(self) -> None:
+		try:
+			async with self.engine.begin() as conn:
+				await conn.execute(text(_UPSERT), {"body": generate_latest(REGISTRY), "pid": os.getpid(), "now": time.time()})
+		except Exception as e:
+			logger.error(f"Failed to publish metrics for the other workers: {e}", exc_info=True)
+
+	async def latest(self) -> Optional[bytes]:
+		"""The last published exposition plus its age, or None before the scheduling worker published any."""
+		async with self.engine.connect() as conn:
+			row = (await conn.execute(text("SELECT body, created_at FROM metrics_snapshot WHERE id = 1"))).one_or_none()
+		if row is None:
+			return None
+		age = max(time.time() - row.created_at, 0.0)
+		return bytes(row.body) + (
+			"# HELP metrics_relay_age_seconds Age of the scheduling worker's metrics served by this worker\n"
+			"# TYPE metrics_relay_age_seconds gauge\n"
+			f"metrics_relay_age_seconds {age}\n"
+		).encode()
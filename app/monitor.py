@@ -1,109 +1,556 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from datetime import datetime, timezone
-from typing import Optional
-
-from dateutil import parser as date_parser
+import time
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Optional
 
+from .alerts import Alert, AlertEvent, alert_for_event, deliver_alert
+from .baselines import BaselineTracker, RateCheck
+from .broadcast import StatusBroadcaster
+from .change_sources import CHANGE_DETECTION_MODES, ChangeDetector
 from .config import settings
-from .db import fetch_latest_timestamp
-from .emailer import send_alert_email
-from .teams_notifier import send_teams_notification
+from .digest import AlertDigest
+from .grouped import KeyState, KeyStateStore
+from .metrics import PROBES_SKIPPED, TARGET_INACTIVE_KEYS, track_target_state
+from .outbox import OutboxDispatcher
+from .probe import ProbeEngine, ProbeResult
+from .scheduling import next_check_at
+from .target_state import STATUSES, TargetState, to_datetime
+from .targets import Target, load_targets
+from .tracing import span
 
 logger = logging.getLogger(__name__)
 
 
+def _utc_now() -> datetime:
+	return datetime.now(timezone.utc)
+
+
 class ActivityMonitor:
-	def __init__(self) -> None:
-		self._last_alert_at_utc: Optional[datetime] = None
+	def __init__(
+		self,
+		targets: Optional[list[Target]] = None,
+		dispatcher: Optional[OutboxDispatcher] = None,
+		probe_engine: Optional[ProbeEngine] = None,
+		clock: Optional[Callable[[], datetime]] = None,
+	) -> None:
+		self.all_targets: list[Target] = targets if targets is not None else load_targets()
+		# The targets this replica checks: all of them unless sharding assigns a subset
+		self.targets: list[Target] = self.all_targets
+		# Names handed out by sharding; None means this replica checks every target
+		self._assigned: Optional[set[str]] = None
+		# Learned arrival-rate baselines; the probe counts new rows only when they are enabled
+		self.baselines = BaselineTracker() if settings.baseline_enabled else None
+		self.probe_engine = probe_engine or ProbeEngine(count_arrivals=self.baselines is not None)
+		# Current UTC time; replays substitute a virtual clock
+		self.clock: Callable[[], datetime] = clock or _utc_now
+		# Alerts are queued here when set, otherwise delivered inline
+		self.dispatcher = dispatcher
+		# False in HTTP-only workers: checks report inactivity but leave alerting to the scheduling worker
+		self.sends_alerts = True
+		# Live /events and /ws subscribers receive every check result and alert from here
+		self.events = StatusBroadcaster()
+		self.digest = (
+			AlertDigest(self._send, settings.digest_window_seconds, dispatcher=dispatcher)
+			if settings.digest_window_seconds > 0 else None
+		)
+		# Last seen, alert, last check and next check per target; every checked target starts out due
+		self._state = TargetState(self.all_targets)
+		self._schedule_now(self.targets)
+		track_target_state(self._state)
+		# Per-key last seen and alert state of grouped targets; saved once load_key_state has attached a store
+		self._keys: dict[str, KeyState] = {}
+		self.key_store: Optional[KeyStateStore] = None
+		self._keys_saved_at = time.monotonic()
+		# Grouped targets removed or changed since the last save, whose stored state is deleted then
+		self._keys_dropped: set[str] = set()
+		if settings.change_detection not in CHANGE_DETECTION_MODES:
+			raise RuntimeError(f"CHANGE_DETECTION must be one of {sorted(CHANGE_DETECTION_MODES)}, got {settings.change_detection!r}")
+		self.change_detector = ChangeDetector() if settings.change_detection == "auto" else None
+		# Last successful probe per target, reused while the change signal says nothing moved
+		self._last_results: dict[str, ProbeResult] = {}
+		# Serialises evaluation so overlapping checks cannot both fire the same alert
+		self._alert_lock = asyncio.Lock()
+		self._inflight: Optional[asyncio.Task] = None
+		# (monotonic time, result) of the last check covering every target
+		self._last_check: Optional[tuple[float, dict]] = None
+
+	async def prepare(self) -> None:
+		"""Check timestamp indexes up front so missing ones are reported at startup."""
+		await self.probe_engine.check_indexes(self.all_targets)
+		for target in self.all_targets:
+			if target.key_column and target.inactivity_threshold_minutes > settings.grouped_lookback_minutes:
+				logger.warning(
+					f"[{target.name}] GROUPED_LOOKBACK_MINUTES ({settings.grouped_lookback_minutes:g}) is shorter than the "
+					f"threshold ({target.inactivity_threshold_minutes}); keys already quiet at first start are not discovered",
+					extra={"target": target.name},
+				)
+		sampled = sum(1 for t in self.all_targets if not t.key_column)
+		if self.baselines is not None and settings.scheduler_mode == "adaptive" and sampled:
+			logger.info(
+				f"BASELINE_ENABLED: {sampled} ungrouped target(s) are probed at least every CHECK_INTERVAL_SECONDS "
+				f"({settings.check_interval_seconds:g}s) in adaptive mode, so their arrival rates are sampled evenly"
+			)
+
+	async def load_key_state(self, store: Optional[KeyStateStore] = None) -> None:
+		"""Restore per-key state saved by a previous run and keep saving it to `store` from now on."""
+		self.key_store = store or KeyStateStore()
+		await self.key_store.create_schema()
+		grouped = {t.name for t in self.all_targets if t.key_column}
+		loaded = {name: state for name, state in (await self.key_store.load()).items() if name in grouped}
+		self._keys.update(loaded)
+		if loaded:
+			logger.info(f"Loaded per-key state for {len(loaded)} grouped target(s), {sum(map(len, loaded.values()))} key(s)")
+
+	async def save_key_state(self, force: bool = False) -> None:
+		"""Write changed per-key state, at most every GROUPED_STATE_SAVE_SECONDS unless forced."""
+		if self.key_store is None or not self.sends_alerts:
+			return
+		if not force and time.monotonic() - self._keys_saved_at < settings.grouped_state_save_seconds:
+			return
+		self._keys_saved_at = time.monotonic()
+		dropped, self._keys_dropped = self._keys_dropped - self._keys.keys(), set()
+		dirty = [(name, state) for name, state in self._keys.items() if state.dirty]
+		await self.key_store.delete(dropped)
+		await self.key_store.save(dirty)
+		for _, state in dirty:
+			state.dirty = False
+
+	def assign(self, names: set[str]) -> list[Target]:
+		"""Restrict checks to the named targets; returns the newly gained ones, which are due at once."""
+		self._assigned = names
+		previous = {t.name for t in self.targets}
+		self.targets = [t for t in self.all_targets if t.name in names]
+		for name in previous - names:
+			# Another replica owns it now; start fresh if it ever comes back
+			self._state.forget_checks(self._state.index[name])
+			self._keys.pop(name, None)
+		if previous != names:
+			self._last_check = None
+		gained = [t for t in self.targets if t.name not in previous]
+		self._schedule_now(gained)
+		return gained
+
+	def update_targets(self, targets: list[Target]) -> tuple[set[str], set[str], set[str]]:
+		"""
+		Swap in a new target list at runtime; returns the (added, removed, changed) names.
+
+		Cooldowns and alert state survive for targets that are kept. A changed
+		target is due at once and starts a fresh probe history, since its
+		table, column or database may differ.
+		"""
+		old = {t.name: t for t in self.all_targets}
+		new = {t.name: t for t in targets}
+		added = new.keys() - old.keys()
+		removed = old.keys() - new.keys()
+		changed = {name for name in new.keys() & old.keys() if new[name] != old[name]}
+
+		self.all_targets = list(targets)
+		self.targets = self.all_targets if self._assigned is None else [t for t in targets if t.name in self._assigned]
+		self.probe_engine.forget(old[name] for name in removed | changed)
+		if self.change_detector is not None:
+			self.change_detector.forget(old[name] for name in removed | changed)
+		for name in removed | changed:
+			self._last_results.pop(name, None)
+			self._keys.pop(name, None)
+			if old[name].key_column:
+				self._keys_dropped.add(name)
+		for name in removed:
+			self._state.remove(name)
+		for name in changed:
+			self._state.replace(new[name])
+		for name in added:
+			self._state.add(new[name])
+		self._schedule_now(t for t in self.targets if t.name in added | changed)
+		if self.baselines is not None:
+			self.baselines.forget(removed | changed)
+		if added or removed or changed:
+			self._last_check = None
+		return set(added), set(removed), changed
+
+	def _schedule_now(self, targets: Iterable[Target]) -> None:
+		for target in targets:
+			self._state.schedule(self._state.slot(target), 0.0)
+
+	async def release_connections(self) -> None:
+		"""Close probe connections to databases none of this replica's targets use any more."""
+		await self.probe_engine.connections.release({t.database_url for t in self.targets})
+
+	async def aclose(self) -> None:
+		await self.probe_engine.aclose()
+		if self.digest is not None:
+			await self.digest.aclose()
+		if self.change_detector is not None:
+			await self.change_detector.aclose()
+		if self.baselines is not None and self.sends_alerts:
+			await self.baselines.save()
+		if self._keys or self._keys_dropped:
+			await self.save_key_state(force=True)
+
+	async def _probe(self, targets: list[Target]) -> dict[str, ProbeResult]:
+		"""Probe targets, skipping unchanged ones that are not yet close to their alert deadline."""
+		if self.change_detector is None:
+			return await self.probe_engine.probe(targets)
+
+		now = self.clock()
+		margin = timedelta(seconds=settings.change_detection_margin_seconds)
+		with span("change_detection", targets=len(targets)) as trace:
+			unchanged = await self.change_detector.unchanged(targets)
+			trace.set(unchanged=len(unchanged))
+		skipped = [
+			t for t in targets
+			if t in unchanged and t.name in self._last_results and not self._near_deadline(t, now, margin)
+		]
+		results = await self.probe_engine.probe([t for t in targets if t not in skipped])
+		probed_ok = [r for r in results.values() if r.error is None]
+		self.change_detector.commit(r.target for r in probed_ok)
+		self._last_results.update((r.target.name, r) for r in probed_ok)
+
+		for target in skipped:
+			if settings.per_target_metrics:
+				PROBES_SKIPPED.labels(target.name).inc()
+			# Nothing changed, so nothing arrived since the reused probe
+			results[target.name] = replace(self._last_results[target.name], arrived=0, key_latest={})
+		return results
+
+	def _near_deadline(self, target: Target, now: datetime, margin: timedelta) -> bool:
+		last_seen = self._state.last_seen[self._state.slot(target)]
+		return bool(last_seen) and now.timestamp() >= last_seen + (target.inactivity_timedelta() - margin).total_seconds()
+
+	async def check_and_alert(self, targets: Optional[list[Target]] = None) -> dict:
+		"""Probe targets (all by default) in one batch per database and alert on the inactive ones."""
+		targets = self.targets if targets is None else targets
+		with span("check_and_alert", targets=len(targets)) as trace:
+			result = await self._check_and_alert(targets)
+			trace.set(status=result["status"])
+		return result
+
+	async def _check_and_alert(self, targets: list[Target]) -> dict:
+		try:
+			results = await self._probe(targets)
+		except Exception as e:
+			logger.error(f"Error during database check: {e}", exc_info=True)
+			# Adaptive mode took these targets off the schedule; try them again after one interval
+			retry_at = (self.clock() + settings.check_interval_timedelta()).timestamp()
+			for target in targets:
+				if target.name in self._state.index:
+					self._state.schedule(self._state.slot(target), retry_at)
+			return {"status": "error", "error": str(e)}
+
+		per_target: dict[str, dict] = {}
+		state = self._state
+		async with self._alert_lock:
+			now = self.clock()
+			now_ts = now.timestamp()
+			for target in targets:
+				if target.name not in state.index:
+					# Removed while its probe was running
+					continue
+				with span("evaluate", target=target.name) as trace:
+					per_target[target.name] = await self._evaluate(target, results[target.name], now)
+					status = per_target[target.name]["status"]
+					trace.set(status=status)
+				# Looked up again: a reload during alert delivery may have removed the target and reused its slot
+				slot = state.index.get(target.name)
+				if slot is None:
+					continue
+				state.record_check(slot, now_ts, status)
+				due = next_check_at(
+					status,
+					now,
+					self._deadline_basis(target, slot, now_ts),
+					target.inactivity_timedelta(),
+					settings.check_interval_timedelta(),
+					settings.adaptive_jitter_seconds,
+					# Arrival-rate baselines need a sample every interval, not one per threshold
+					settings.check_interval_timedelta() if self.baselines is not None and not target.key_column else None,
+				)
+				state.schedule(slot, due.timestamp())
+
+		if per_target:
+			await self.events.publish({"type": "check", "at": now.isoformat(), "targets": self._stream_view(per_target, now)})
+
+		if self.baselines is not None and self.sends_alerts:
+			try:
+				await self.baselines.save()
+			except Exception as e:
+				logger.error(f"Failed to save arrival baselines: {e}", exc_info=True)
+		if self._keys or self._keys_dropped:
+			try:
+				await self.save_key_state()
+			except Exception as e:
+				logger.error(f"Failed to save per-key state: {e}", exc_info=True)
 
-	async def check_and_alert(self) -> dict:
-		"""Check the latest row timestamp and send an alert if inactive too long."""
+		status = min((r["status"] for r in per_target.values()), key=STATUSES.index, default="ok")
+		result = {"status": status, "now": now.isoformat(), "targets": per_target}
+		if targets is self.targets:
+			self._last_check = (time.monotonic(), result)
+		return result
+
+	def _deadline_basis(self, target: Target, slot: int, now_ts: float) -> Optional[datetime]:
+		"""
+		The last-seen time adaptive scheduling counts the threshold from. For
+		a grouped target that is its oldest key not yet quiet, not the newest
+		row of the table, which any busy key keeps recent.
+		"""
+		if not target.key_column:
+			return to_datetime(self._state.last_seen[slot])
+		keys = self._keys.get(target.name)
+		if keys is None:
+			return None
+		earliest = keys.earliest_active(now_ts - target.inactivity_timedelta().total_seconds())
+		return to_datetime(earliest) if earliest is not None else None
+
+	def _stream_view(self, per_target: dict[str, dict], now: datetime) -> dict[str, dict]:
+		view = {}
+		for name, result in per_target.items():
+			slot = self._state.index.get(name)
+			last_seen = to_datetime(self._state.last_seen[slot]) if slot is not None else None
+			due = self._state.due_at(slot) if slot is not None else None
+			view[name] = {
+				**result,
+				"checked_at": now.isoformat(),
+				"last_activity": last_seen.isoformat() if last_seen else None,
+				"next_check_at": to_datetime(due).isoformat() if due else None,
+			}
+		return view
+
+	async def check_database(self, database_url: str) -> dict:
+		"""Interval mode: check this replica's targets on one database (one scheduler job each)."""
+		return await self.check_and_alert([t for t in self.targets if t.database_url == database_url])
+
+	async def check_now(self) -> dict:
+		"""
+		On-demand check for HTTP callers.
+
+		Serves the last full result while it is younger than
+		CHECK_CACHE_TTL_SECONDS; otherwise concurrent callers share a single
+		in-flight probe instead of each querying the database.
+		"""
+		if self._last_check is not None and time.monotonic() - self._last_check[0] <= settings.check_cache_ttl_seconds:
+			return self._last_check[1]
+		if self._inflight is None:
+			self._inflight = asyncio.create_task(self._run_shared_check())
+		# Shielded so one caller disconnecting does not cancel the probe for the others
+		return await asyncio.shield(self._inflight)
+
+	async def _run_shared_check(self) -> dict:
+		try:
+			return await self.check_and_alert()
+		finally:
+			self._inflight = None
+
+	def health_snapshot(self, relayed: Optional[dict[str, dict]] = None) -> dict:
+		"""
+		Freshness of the last check per target, from memory only.
+
+		HTTP-only workers run no checks of their own and pass `relayed`, the
+		latest results the scheduling worker published (StatusBroadcaster.latest);
+		a target missing from it is reported with status "unknown".
+		"""
+		now = self.clock()
+		now_ts = now.timestamp()
+		stale_after = 2 * settings.check_interval_seconds
+		state = self._state
+		targets: dict[str, dict] = {}
+		degraded = False
+		for target in self.targets:
+			if relayed is None:
+				slot = state.slot(target)
+				checked_at, status = state.checked_at[slot], state.last_status(slot)
+				due = state.due_at(slot)
+				last_seen = to_datetime(state.last_seen[slot])
+			else:
+				entry = relayed.get(target.name)
+				if entry is None:
+					checked_at, status, due, last_seen = 0.0, "unknown", None, None
+				else:
+					checked_at = datetime.fromisoformat(entry["checked_at"]).timestamp()
+					status = entry.get("status")
+					due = datetime.fromisoformat(entry["next_check_at"]).timestamp() if entry.get("next_check_at") else None
+					last_seen = datetime.fromisoformat(entry["last_activity"]) if entry.get("last_activity") else None
+			# A check is stale once it is overdue by more than the allowance (adaptive targets may sleep long)
+			stale = not checked_at or now_ts - max(checked_at, due or checked_at) > stale_after
+			degraded = degraded or stale or status == "error"
+			targets[target.name] = {
+				"status": status,
+				"checked_at": to_datetime(checked_at).isoformat() if checked_at else None,
+				"check_age_seconds": round(now_ts - checked_at, 3) if checked_at else None,
+				"last_activity": last_seen.isoformat() if last_seen else None,
+				"stale": stale,
+			}
+		return {"status": "degraded" if degraded else "ok", "now": now.isoformat(), "targets": targets}
+
+	async def check_due(self) -> dict:
+		"""Adaptive mode: probe only the targets whose next check time has arrived."""
+		state = self._state
+		due = [state.targets[slot] for slot in state.pop_due(self.clock().timestamp())]
+		return await self.check_and_alert(due)
+
+	def next_wakeup(self) -> datetime:
+		"""Earliest next check time over all targets, never in the past."""
+		now = self.clock()
+		wakeup = self._state.next_wakeup()
+		if wakeup is None:
+			return now + settings.check_interval_timedelta()
+		return max(now, datetime.fromtimestamp(wakeup, tz=timezone.utc))
+
+	async def _evaluate(self, target: Target, result: ProbeResult, now: datetime) -> dict:
+		"""Check one target's latest row timestamp and send an alert if inactive too long."""
+		fields = {"target": target.name, "stage": "evaluate"}
 		try:
-			has_row, latest_iso = await fetch_latest_timestamp()
-			now = datetime.now(timezone.utc)
+			if result.error is not None:
+				raise result.error
 
-			if not has_row:
-				logger.info("No rows found in activity table")
-				return {"status": "no_rows", "now": now.isoformat()}
+			if not result.has_row:
+				logger.info(f"No rows found in activity table {target.table}", extra=fields)
+				return {"status": "no_rows"}
 
-			latest_dt = self._to_utc(latest_iso)
+			rate = None
+			if self.baselines is not None and result.arrived is not None:
+				baseline = self.baselines.get(target.name)
+				baseline.observe(now.timestamp(), result.arrived)
+				rate = baseline.check(now.timestamp())
+
+			state = self._state
+			slot = state.slot(target)
+			latest_dt = result.latest
+			previous_dt = to_datetime(state.last_seen[slot])
+			state.last_seen[slot] = latest_dt.timestamp()
 			inactive_for = now - latest_dt
-			threshold = settings.inactivity_timedelta()
+			threshold = target.inactivity_timedelta()
+			inactive_gauge, alerting_gauge = state.metrics(slot)
+			inactive_gauge.set(inactive_for.total_seconds())
+			if target.key_column:
+				return await self._evaluate_keys(target, result, latest_dt, now)
+			alerting_gauge.set(1 if inactive_for >= threshold else 0)
 
-			logger.debug(f"Last activity: {latest_dt}, Inactive for: {inactive_for}, Threshold: {threshold}")
+			logger.debug(
+				f"[{target.name}] Last activity: {latest_dt}, Inactive for: {inactive_for}, Threshold: {threshold}",
+				extra={**fields, "inactive_for_seconds": int(inactive_for.total_seconds())},
+			)
 
 			if inactive_for >= threshold:
-				if not self._is_in_cooldown(now):
-					logger.warning(f"Database inactive for {inactive_for}, sending alert")
-					await self._send_inactivity_alert(latest_dt, inactive_for, threshold)
-					self._last_alert_at_utc = now
+				if not self.sends_alerts:
+					return {"status": "inactive", "inactive_for_seconds": int(inactive_for.total_seconds())}
+				if not self._is_in_cooldown(target, now):
+					logger.warning(
+						f"[{target.name}] Database inactive for {inactive_for}, sending alert", extra={**fields, "stage": "alert"}
+					)
+					# Start the cooldown before delivery so a concurrent check sees it
+					state.last_alert[slot] = now.timestamp()
+					state.alerting[slot] = 1
+					await self._notify(AlertEvent("inactive", target, latest_dt, inactive_for, now))
 					return {
 						"status": "alert_sent",
 						"inactive_for_seconds": int(inactive_for.total_seconds()),
 					}
-				logger.info(f"Alert in cooldown until {self._cooldown_until()}")
-				return {"status": "cooldown", "cooldown_until": self._cooldown_until().isoformat()}
+				logger.info(f"[{target.name}] Alert in cooldown until {self._cooldown_until(target)}", extra=fields)
+				return {"status": "cooldown", "cooldown_until": self._cooldown_until(target).isoformat()}
 
+			if state.alerting[slot]:
+				state.alerting[slot] = 0
+				if settings.notify_on_resume:
+					logger.info(f"[{target.name}] Activity resumed", extra={**fields, "stage": "alert"})
+					quiet_for = latest_dt - previous_dt if previous_dt is not None else inactive_for
+					await self._notify(AlertEvent("resumed", target, latest_dt, quiet_for, now))
+
+			if rate is not None and rate.dropped:
+				return await self._rate_drop(target, rate, latest_dt, inactive_for, now)
 			return {"status": "ok", "inactive_for_seconds": int(inactive_for.total_seconds())}
 		except Exception as e:
-			logger.error(f"Error during database check: {e}", exc_info=True)
+			logger.error(f"[{target.name}] Error during database check: {e}", exc_info=True, extra=fields)
 			return {"status": "error", "error": str(e)}
 
-	def _to_utc(self, ts: str) -> datetime:
-		parsed = date_parser.parse(ts)
-		if parsed.tzinfo is None:
-			parsed = parsed.replace(tzinfo=timezone.utc)
-		return parsed.astimezone(timezone.utc)
-
-	def _is_in_cooldown(self, now: datetime) -> bool:
-		if self._last_alert_at_utc is None:
-			return False
-		return now < self._cooldown_until()
-
-	def _cooldown_until(self) -> datetime:
-		assert self._last_alert_at_utc is not None
-		return self._last_alert_at_utc + settings.alert_cooldown_timedelta()
-
-	async def _send_inactivity_alert(self, last_update: datetime, inactive_for, threshold) -> None:
-		title = f"⚠️ Database Inactivity Alert - {int(threshold.total_seconds()//60)} minutes"
-		message = (
-			f"Database activity monitor detected inactivity.\n\n"
-			f"**Activity table:** {settings.activity_table}\n"
-			f"**Timestamp column:** {settings.activity_timestamp_column}\n"
-			f"**Last update (UTC):** {last_update.isoformat()}\n"
-			f"**Inactive for:** {inactive_for}\n"
-			f"**Threshold:** {threshold}\n\n"
-			f"Please check the database for any issues."
-		)
-		
-		# Try Teams notification first (primary method)
-		if settings.enable_teams_notifications and settings.teams_webhook_url:
-			try:
-				await send_teams_notification(title, message)
-				logger.info("Teams notification sent successfully")
-				return
-			except Exception as e:
-				logger.error(f"Failed to send Teams notification: {e}", exc_info=True)
-		
-		# Fallback to email if Teams fails or is disabled
-		if settings.enable_email_notifications:
-			subject = f"DB inactivity alert: no updates in {int(threshold.total_seconds()//60)} min"
-			body = (
-				"Database activity monitor detected inactivity.\n\n"
-				f"Activity table: {settings.activity_table}\n"
-				f"Timestamp column: {settings.activity_timestamp_column}\n"
-				f"Last update (UTC): {last_update.isoformat()}\n"
-				f"Inactive for: {inactive_for}\n"
-				f"Threshold: {threshold}\n"
+	async def _evaluate_keys(self, target: Target, result: ProbeResult, latest_dt: datetime, now: datetime) -> dict:
+		"""Grouped targets: alert on the keys that went quiet, in one notification per target and check."""
+		fields = {"target": target.name, "stage": "evaluate"}
+		state = self._keys.get(target.name)
+		if state is None:
+			state = self._keys[target.name] = KeyState()
+		resumed = state.observe(result.key_latest or {})
+		now_ts = now.timestamp()
+		forgotten = state.forget_before(now_ts - settings.grouped_key_retention_hours * 3600)
+		if forgotten:
+			logger.info(
+				f"[{target.name}] Forgot {forgotten} key(s) silent for over {settings.grouped_key_retention_hours:g}h", extra=fields
 			)
-			try:
-				await send_alert_email(subject, body)
-				logger.info("Alert email sent successfully")
-			except Exception as e:
-				logger.error(f"Failed to send alert email: {e}", exc_info=True)
-		else:
-			logger.warning("Both Teams and email notifications are disabled")
+		quiet = state.quiet(now_ts - target.inactivity_timedelta().total_seconds())
+		if settings.per_target_metrics:
+			TARGET_INACTIVE_KEYS.labels(target.name).set(len(quiet))
+		self._state.metrics(self._state.slot(target))[1].set(1 if quiet else 0)
+		details = {
+			"inactive_for_seconds": int((now - latest_dt).total_seconds()),
+			"keys": len(state),
+			"inactive_keys": len(quiet),
+		}
+		if not self.sends_alerts:
+			return {"status": "inactive" if quiet else "ok", **details}
+
+		if resumed and settings.notify_on_resume:
+			logger.info(f"[{target.name}] Activity resumed for {len(resumed)} key(s)", extra={**fields, "stage": "alert"})
+			quiet_for = max(state.last_seen[slot] - previous for slot, previous in resumed)
+			keys = state.describe(slot for slot, _ in resumed)
+			await self._notify(AlertEvent("resumed", target, keys[0][1], timedelta(seconds=quiet_for), now, keys=keys))
+
+		due = state.due(quiet, now_ts, target.alert_cooldown_timedelta().total_seconds())
+		if due:
+			logger.warning(f"[{target.name}] {len(due)} key(s) inactive, sending alert", extra={**fields, "stage": "alert"})
+			state.mark_alerted(due, now_ts)
+			keys = state.describe(due)
+			await self._notify(AlertEvent("inactive", target, keys[0][1], now - keys[0][1], now, keys=keys))
+			return {"status": "alert_sent", **details}
+		return {"status": "cooldown" if quiet else "ok", **details}
 
+	async def _rate_drop(self, target: Target, rate: RateCheck, latest_dt: datetime, inactive_for: timedelta, now: datetime) -> dict:
+		"""Rows still arrive, but far fewer than usual for this hour of the week."""
+		details = {
+			"inactive_for_seconds": int(inactive_for.total_seconds()),
+			"observed_rows_per_minute": round(rate.observed, 3),
+			"expected_rows_per_minute": round(rate.expected, 3),
+		}
+		if not self.sends_alerts or self._is_in_cooldown(target, now):
+			return {"status": "ok", "reason": "rate_drop", **details}
+		logger.warning(
+			f"[{target.name}] Arrival rate {rate.observed:.2f}/min is below the usual {rate.expected:.2f}/min, sending alert",
+			extra={"target": target.name, "stage": "alert"},
+		)
+		# Shares the inactivity cooldown, so one incident does not alert twice under two names
+		self._state.last_alert[self._state.slot(target)] = now.timestamp()
+		await self._notify(
+			AlertEvent("rate_drop", target, latest_dt, inactive_for, now, observed_rate=rate.observed, expected_rate=rate.expected)
+		)
+		return {"status": "alert_sent", "reason": "rate_drop", **details}
+
+	def _is_in_cooldown(self, target: Target, now: datetime) -> bool:
+		last_alert = self._state.last_alert[self._state.slot(target)]
+		return bool(last_alert) and now.timestamp() < last_alert + target.alert_cooldown_timedelta().total_seconds()
+
+	def _cooldown_until(self, target: Target) -> datetime:
+		return to_datetime(self._state.last_alert[self._state.slot(target)]) + target.alert_cooldown_timedelta()
 
+	async def _notify(self, event: AlertEvent) -> None:
+		await self.events.publish({
+			"type": "alert",
+			"kind": event.kind,
+			"target": event.target.name,
+			"last_update": event.last_update.isoformat(),
+			"at": event.at.isoformat(),
+			**({"keys": len(event.keys)} if event.keys else {}),
+		})
+		if self.digest is not None:
+			await self.digest.add(event)
+		else:
+			await self._send(alert_for_event(event))
+
+	async def _send(self, alert: Alert) -> None:
+		try:
+			if self.dispatcher is not None:
+				await self.dispatcher.enqueue(alert)
+			else:
+				await deliver_alert(alert)
+		except Exception as e:
+			logger.error(f"Failed to send notification {alert.dedup_key}: {e}", exc_info=True, extra={"stage": "notify"})
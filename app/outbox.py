@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Iterable, Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from .alerts import Alert, DeliveryError, deliver_alert
+from .config import settings
+from .db import get_engine
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+	"""
+	CREATE TABLE IF NOT EXISTS notification_outbox (
+		id INTEGER PRIMARY KEY AUTOINCREMENT,
+		dedup_key TEXT NOT NULL,
+		payload TEXT NOT NULL,
+		status TEXT NOT NULL DEFAULT 'pending',
+		attempts INTEGER NOT NULL DEFAULT 0,
+		next_attempt_at REAL NOT NULL,
+		created_at REAL NOT NULL,
+		delivered_at REAL,
+		last_error TEXT
+	)
+	""",
+	# Only one undelivered row per key; once delivered the same key may be queued again
+	"""
+	CREATE UNIQUE INDEX IF NOT EXISTS ux_notification_outbox_open_dedup
+	ON notification_outbox (dedup_key) WHERE status IN ('pending', 'sending')
+	""",
+	"""
+	CREATE INDEX IF NOT EXISTS ix_notification_outbox_due
+	ON notification_outbox (status, next_attempt_at)
+	""",
+)
+
+
+class NotificationOutbox:
+	"""Durable queue of alerts in the local state database."""
+
+	def __init__(self, database_url: Optional[str] = None) -> None:
+		self.database_url = database_url or settings.state_database_url
+
+	@property
+	def engine(self) -> AsyncEngine:
+		# Resolved on first use so constructing this at import time does not build the engine
+		return get_engine(self.database_url)
+
+	async def create_schema(self) -> None:
+		async with self.engine.begin() as conn:
+			for statement in _SCHEMA:
+				await conn.execute(text(statement))
+
+	async def enqueue(self, alert: Alert, replaces: Iterable[int] = ()) -> bool:
+		"""
+		Store an alert for delivery; False if an identical one is already queued.
+
+		`replaces` names held rows (see `hold`) that this alert supersedes; they
+		are deleted in the same transaction unless already claimed.
+		"""
+		now = time.time()
+		async with self.engine.begin() as conn:
+			await self._delete_held(conn, replaces)
+			result = await conn.execute(
+				text(
+					"""
+					INSERT INTO notification_outbox (dedup_key, payload, next_attempt_at, created_at)
+					VALUES (:dedup_key, :payload, :now, :now)
+					ON CONFLICT DO NOTHING
+					"""
+				),
+				{"dedup_key": alert.dedup_key, "payload": json.dumps(alert.to_dict()), "now": now},
+			)
+		return result.rowcount == 1
+
+	async def hold(self, alert: Alert, until: float) -> Optional[int]:
+		"""
+		Store an alert that only becomes due at `until` and return its id, or
+		None if an identical one is already queued. The alert digest holds each
+		event this way while its window is open, so a crash before the flush
+		still delivers them one by one.
+		"""
+		async with self.engine.begin() as conn:
+			row = (
+				await conn.execute(
+					text(
+						"""
+						INSERT INTO notification_outbox (dedup_key, payload, next_attempt_at, created_at)
+						VALUES (:dedup_key, :payload, :until, :now)
+						ON CONFLICT DO NOTHING
+						RETURNING id
+						"""
+					),
+					{"dedup_key": alert.dedup_key, "payload": json.dumps(alert.to_dict()), "until": until, "now": time.time()},
+				)
+			).first()
+		return row[0] if row is not None else None
+
+	async def release(self, ids: Iterable[int]) -> None:
+		"""Make held rows due at once."""
+		ids = list(ids)
+		if not ids:
+			return
+		async with self.engine.begin() as conn:
+			await conn.execute(
+				text("UPDATE notification_outbox SET next_attempt_at = :now WHERE status = 'pending' AND id IN :ids").bindparams(
+					bindparam("ids", expanding=True)
+				),
+				{"ids": ids, "now": time.time()},
+			)
+
+	@staticmethod
+	async def _delete_held(conn: AsyncConnection, ids: Iterable[int]) -> None:
+		ids = list(ids)
+		if ids:
+			await conn.execute(
+				text("DELETE FROM notification_outbox WHERE status = 'pending' AND id IN :ids").bindparams(
+					bindparam("ids", expanding=True)
+				),
+				{"ids": ids},
+			)
+
+	async def recover(self) -> int:
+		"""
+		Return rows whose claim lease has run out to the pending state.
+
+		Rows still within their lease may belong to another live process
+		sharing the state database, so they are left to it.
+		"""
+		async with self.engine.begin() as conn:
+			result = await conn.execute(
+				text("UPDATE notification_outbox SET status = 'pending' WHERE status = 'sending' AND next_attempt_at <= :now"),
+				{"now": time.time()},
+			)
+		return result.rowcount
+
+	async def claim(self, limit: int) -> list[tuple[int, int, Alert]]:
+		"""
+		Mark up to `limit` due rows as sending and return (id, attempts, alert).
+
+		A claim holds a row for OUTBOX_CLAIM_TIMEOUT_SECONDS (kept in
+		next_attempt_at while sending). If the outcome is never recorded, e.g.
+		because the state database was briefly unavailable, the row is claimed
+		again once that lease runs out instead of staying 'sending' until restart.
+		"""
+		now = time.time()
+		async with self.engine.begin() as conn:
+			rows = (
+				await conn.execute(
+					text(
+						"""
+						SELECT id, attempts, payload FROM notification_outbox
+						WHERE status IN ('pending', 'sending') AND next_attempt_at <= :now
+						ORDER BY id LIMIT :limit
+						"""
+					),
+					{"now": now, "limit": limit},
+				)
+			).all()
+			if rows:
+				await conn.execute(
+					text(
+						"UPDATE notification_outbox SET status = 'sending', next_attempt_at = :lease_until WHERE id IN :ids"
+					).bindparams(bindparam("ids", expanding=True)),
+					{"ids": [row[0] for row in rows], "lease_until": now + settings.outbox_claim_timeout_seconds},
+				)
+		return [(row[0], row[1], Alert.from_dict(json.loads(row[2]))) for row in rows]
+
+	async def mark_delivered(self, ids: list[int]) -> None:
+		if not ids:
+			return
+		async with self.engine.begin() as conn:
+			await conn.execute(
+				text(
+					"UPDATE notification_outbox SET status = 'delivered', delivered_at = :now, last_error = NULL WHERE id IN :ids"
+				).bindparams(bindparam("ids", expanding=True)),
+				{"ids": ids, "now": time.time()},
+			)
+
+	async def mark_failed(self, failures: list[tuple[int, int, str, Optional[Alert]]]) -> None:
+		"""
+		Reschedule (id, attempts_so_far, error, retry) rows with backoff, or give
+		up after OUTBOX_MAX_ATTEMPTS. A `retry` alert replaces the stored payload,
+		e.g. to resend only to the Teams webhooks that failed.
+		"""
+		if not failures:
+			return
+		now = time.time()
+		params = []
+		for row_id, attempts, error, retry in failures:
+			attempts += 1
+			delay = min(settings.outbox_retry_base_seconds * (2 ** (attempts - 1)), 3600)
+			params.append({
+				"id": row_id,
+				"attempts": attempts,
+				"status": "failed" if attempts >= settings.outbox_max_attempts else "pending",
+				"next_attempt_at": now + delay + random.uniform(0, delay / 4),
+				"error": error[:2000],
+				"payload": json.dumps(retry.to_dict()) if retry is not None else None,
+			})
+		async with self.engine.begin() as conn:
+			await conn.execute(
+				text(
+					"""
+					UPDATE notification_outbox
+					SET status = :status, attempts = :attempts, next_attempt_at = :next_attempt_at, last_error = :error,
+						payload = COALESCE(:payload, payload)
+					WHERE id = :id
+					"""
+				),
+				params,
+			)
+
+	async def purge(self, older_than_seconds: float) -> int:
+		async with self.engine.begin() as conn:
+			result = await conn.execute(
+				text("DELETE FROM notification_outbox WHERE status = 'delivered' AND delivered_at < :cutoff"),
+				{"cutoff": time.time() - older_than_seconds},
+			)
+		return result.rowcount
+
+	async def pending_count(self) -> int:
+		async with self.engine.connect() as conn:
+			return (
+				await conn.execute(text("SELECT COUNT(*) FROM notification_outbox WHERE status IN ('pending', 'sending')"))
+			).scalar_one()
+
+
+class OutboxDispatcher:
+	"""
+	Drains the outbox with a pool of async workers.
+
+	One poller claims due rows in batches and hands them to the workers, which
+	deliver every alert of a batch concurrently and record the outcomes with a
+	single UPDATE each. Enqueueing wakes the poller, so alerts go out at once
+	when the notifiers are healthy.
+	"""
+
+	def __init__(
+		self,
+		outbox: NotificationOutbox,
+		deliver: Callable[[Alert], Awaitable[None]] = deliver_alert,
+		workers: Optional[int] = None,
+		batch_size: Optional[int] = None,
+		poll_seconds: Optional[float] = None,
+	) -> None:
+		self.outbox = outbox
+		self.deliver = deliver
+		self.workers = workers or settings.outbox_workers
+		self.batch_size = batch_size or settings.outbox_batch_size
+		self.poll_seconds = poll_seconds or settings.outbox_poll_seconds
+		self._queue: asyncio.Queue[list[tuple[int, int, Alert]]] = asyncio.Queue(maxsize=self.workers)
+		self._wakeup = asyncio.Event()
+		self._tasks: list[asyncio.Task] = []
+
+	async def start(self) -> None:
+		await self.outbox.create_schema()
+		recovered = await self.outbox.recover()
+		if recovered:
+			logger.info(f"Recovered {recovered} undelivered notification(s) from the outbox")
+		await self.outbox.purge(settings.outbox_retention_days * 86400)
+		self._tasks = [asyncio.create_task(self._poll(), name="outbox-poller")]
+		self._tasks += [asyncio.create_task(self._work(), name=f"outbox-worker-{i}") for i in range(self.workers)]
+
+	async def stop(self) -> None:
+		# Rows claimed but not yet recorded stay 'sending' until their claim lease runs out, then go out again
+		for task in self._tasks:
+			task.cancel()
+		await asyncio.gather(*self._tasks, return_exceptions=True)
+		self._tasks = []
+
+	async def enqueue(self, alert: Alert, replaces: Iterable[int] = ()) -> bool:
+		queued = await self.outbox.enqueue(alert, replaces)
+		if queued:
+			self._wakeup.set()
+		else:
+			logger.info(f"Notification {alert.dedup_key} is already queued, skipping duplicate")
+		return queued
+
+	async def release(self, ids: Iterable[int]) -> None:
+		await self.outbox.release(ids)
+		self._wakeup.set()
+
+	async def _poll(self) -> None:
+		while True:
+			# Clear before claiming so an enqueue that lands during the claim still wakes us
+			self._wakeup.clear()
+			try:
+				batch = await self.outbox.claim(self.batch_size)
+			except Exception as e:
+				logger.error(f"Failed to claim outbox rows: {e}", exc_info=True)
+				batch = []
+			if batch:
+				await self._queue.put(batch)
+				if len(batch) == self.batch_size:
+					continue
+			try:
+				await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+			except asyncio.TimeoutError:
+				pass
+
+	async def _work(self) -> None:
+		while True:
+			batch = await self._queue.get()
+			try:
+				await self._deliver_batch(batch)
+			except Exception as e:
+				logger.error(f"Outbox worker failed to record a batch: {e}", exc_info=True)
+			finally:
+				self._queue.task_done()
+
+	async def _deliver_batch(self, batch: list[tuple[int, int, Alert]]) -> None:
+		outcomes = await asyncio.gather(*(self.deliver(alert) for _, _, alert in batch), return_exceptions=True)
+		delivered: list[int] = []
+		failed: list[tuple[int, int, str, Optional[Alert]]] = []
+		for (row_id, attempts, alert), outcome in zip(batch, outcomes):
+			if isinstance(outcome, BaseException):
+				logger.warning(f"Delivery of {alert.dedup_key} failed (attempt {attempts + 1}): {outcome}")
+				retry = outcome.retry if isinstance(outcome, DeliveryError) else None
+				failed.append((row_id, attempts, str(outcome), retry))
+			else:
+				delivered.append(row_id)
+		await self.outbox.mark_delivered(delivered)
+		await self.outbox.mark_failed(failed)
@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+from sqlalchemy import Row, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql.elements import TextClause
+
+from .config import settings
+from .db import get_engine
+from .metrics import PROBE_ERRORS, PROBE_LATENCY
+from .probe_connections import ProbeConnections
+from .targets import Target
+from .timestamps import TimestampDecoder
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+INDEX_POLICIES = {"warn", "refuse", "ignore"}
+
+
+class MissingIndexError(RuntimeError):
+	"""Raised for targets refused because their timestamp column is not indexed."""
+
+
+@dataclass
+class ProbeResult:
+	"""Latest timestamp observed for one target during a probe."""
+
+	target: Target
+	has_row: bool = False
+	# Aware UTC datetime decoded from the column's native representation
+	latest: Optional[datetime] = None
+	# Rows newer than the previous high-water mark, when arrival counting is on and a mark exists
+	arrived: Optional[int] = None
+	# Grouped targets: epoch seconds of the newest row per key among the rows this probe read
+	key_latest: Optional[dict[str, float]] = None
+	error: Optional[Exception] = None
+
+	@property
+	def latest_iso(self) -> Optional[str]:
+		return self.latest.isoformat() if self.latest is not None else None
+
+
+def group_by_database(targets: Iterable[Target]) -> dict[str, list[Target]]:
+	groups: dict[str, list[Target]] = defaultdict(list)
+	for target in targets:
+		groups[target.database_url].append(target)
+	return dict(groups)
+
+
+def build_batch_query(
+	targets: list[Target],
+	high_water: Optional[dict[Target, Any]] = None,
+	count_arrivals: bool = False,
+) -> TextClause:
+	"""
+	One statement returning (target_index, latest) for every target.
+
+	Each branch is a MAX() over a single table, which the database can answer
+	from an index on the timestamp column without sorting the table. Targets
+	with a known high-water mark only look at rows newer than it, so an
+	indexed probe touches nothing but the rows inserted since the last tick;
+	a NULL means nothing new arrived.
+
+	With count_arrivals, a third column counts those new rows from the same
+	index range scan (NULL for targets without a high-water mark yet).
+	"""
+	high_water = high_water or {}
+	branches = []
+	params = {}
+	for index, target in enumerate(targets):
+		branch = f"SELECT {index} AS target_index, MAX({target.timestamp_column}) AS latest"
+		if count_arrivals:
+			branch += ", COUNT(*) AS arrived" if target in high_water else ", NULL AS arrived"
+		branch += f" FROM {target.table}"
+		if target in high_water:
+			branch += f" WHERE {target.timestamp_column} > :hwm_{index}"
+			params[f"hwm_{index}"] = high_water[target]
+		branches.append(branch)
+	return text("\nUNION ALL\n".join(branches)).bindparams(**params)
+
+
+def build_grouped_query(target: Target, since: Any) -> TextClause:
+	"""
+	(key, latest) for every key of a grouped target with rows at or after `since`.
+
+	The range condition on the timestamp column keeps this an index range
+	scan over recent rows, aggregated per key in a single pass, however many
+	keys the table holds. `>=` rather than `>` so rows sharing the boundary
+	timestamp are not missed; re-reading them is harmless for a MAX().
+	"""
+	return text(
+		f"SELECT {target.key_column} AS activity_key, MAX({target.timestamp_column}) AS latest FROM {target.table} "
+		f"WHERE {target.timestamp_column} >= :since GROUP BY {target.key_column}"
+	).bindparams(since=since)
+
+
+def _split_table(table: str) -> tuple[Optional[str], str]:
+	schema, _, name = table.rpartition(".")
+	return (schema or None), name
+
+
+def _leading_column_indexed(sync_conn: Connection, target: Target) -> bool:
+	"""True when the timestamp column leads an index, unique constraint or primary key."""
+	schema, table = _split_table(target.table)
+	inspector = inspect(sync_conn)
+	column = target.timestamp_column.lower()
+	candidates = [ix.get("column_names") or [] for ix in inspector.get_indexes(table, schema=schema)]
+	candidates += [uc.get("column_names") or [] for uc in inspector.get_unique_constraints(table, schema=schema)]
+	candidates.append(inspector.get_pk_constraint(table, schema=schema).get("constrained_columns") or [])
+	return any(cols and cols[0] is not None and cols[0].lower() == column for cols in candidates)
+
+
+class ProbeEngine:
+	"""
+	Batched latest-timestamp probe with per-target index checks and high-water marks.
+
+	The first probe of a target inspects the catalog for an index on its
+	timestamp column (see TIMESTAMP_INDEX_POLICY) and reads the full MAX();
+	later probes are incremental from the last value seen. Statements run on
+	a dedicated connection per database with a timeout and circuit breaker
+	(see ProbeConnections).
+	"""
+
+	def __init__(
+		self,
+		index_policy: Optional[str] = None,
+		count_arrivals: bool = False,
+		connections: Optional[ProbeConnections] = None,
+	) -> None:
+		self.count_arrivals = count_arrivals
+		self.connections = connections or ProbeConnections()
+		self.index_policy = (index_policy or settings.timestamp_index_policy).lower()
+		if self.index_policy not in INDEX_POLICIES:
+			raise RuntimeError(f"TIMESTAMP_INDEX_POLICY must be one of {sorted(INDEX_POLICIES)}, got {self.index_policy!r}")
+		self._indexed: dict[Target, bool] = {}
+		self._high_water: dict[Target, Any] = {}
+		self._decoders: dict[Target, TimestampDecoder] = {}
+
+	def is_indexed(self, target: Target) -> Optional[bool]:
+		return self._indexed.get(target)
+
+	def forget(self, targets: Iterable[Target]) -> None:
+		"""Drop cached index checks and high-water marks, e.g. for targets removed at runtime."""
+		for target in targets:
+			self._indexed.pop(target, None)
+			self._high_water.pop(target, None)
+			self._decoders.pop(target, None)
+
+	def _decoder(self, target: Target) -> TimestampDecoder:
+		decoder = self._decoders.get(target)
+		if decoder is None:
+			decoder = self._decoders[target] = TimestampDecoder(target.source_timezone, target.timestamp_format)
+		return decoder
+
+	async def check_indexes(self, targets: Iterable[Target]) -> dict[Target, bool]:
+		"""Inspect the catalog once per target; cached for the life of the engine."""
+		pending = [t for t in targets if t not in self._indexed]
+		if not pending or self.index_policy == "ignore":
+			for target in pending:
+				self._indexed[target] = True
+			return {t: self._indexed[t] for t in targets}
+
+		for database_url, group in group_by_database(pending).items():
+			try:
+				async with get_engine(database_url).connect() as conn:
+					# Targets sharing a table and column (e.g. with different thresholds) need one lookup
+					seen: dict[tuple[str, str], bool] = {}
+					for target in group:
+						column = (target.table, target.timestamp_column)
+						if column not in seen:
+							seen[column] = await conn.run_sync(_leading_column_indexed, target)
+						self._indexed[target] = seen[column]
+			except Exception as e:
+				# Catalog lookups are best effort; the probe itself will surface real errors
+				logger.warning(f"Could not inspect indexes on {_safe_url(database_url)}: {e}")
+				continue
+
+		for target in pending:
+			if self._indexed.get(target) is False:
+				action = "refusing to probe it" if self.index_policy == "refuse" else "every probe will scan the whole table"
+				logger.warning(
+					f"🐢 No index leads with {target.table}.{target.timestamp_column} (target {target.name}); {action}. "
+					f"Create one with: CREATE INDEX ix_{_split_table(target.table)[1]}_{target.timestamp_column} "
+					f"ON {target.table} ({target.timestamp_column})"
+				)
+		return {t: self._indexed.get(t, True) for t in targets}
+
+	def _refused(self, target: Target) -> bool:
+		return self.index_policy == "refuse" and self._indexed.get(target) is False
+
+	async def _probe_database(self, database_url: str, targets: list[Target]) -> list[ProbeResult]:
+		results = [ProbeResult(target=t) for t in targets]
+		runnable = []
+		for result in results:
+			if self._refused(result.target):
+				result.error = MissingIndexError(
+					f"{result.target.table}.{result.target.timestamp_column} is not indexed (TIMESTAMP_INDEX_POLICY=refuse)"
+				)
+			else:
+				runnable.append(result)
+		if not runnable:
+			return results
+
+		grouped = [r for r in runnable if r.target.key_column]
+		# Grouped targets continue from their high-water mark; only the first probe needs the plain MAX()
+		since = {r.target: self._high_water[r.target] for r in grouped if r.target in self._high_water}
+		batched = [r for r in runnable if r.target not in since]
+		if batched:
+			await self._probe_batch(database_url, batched)
+		for result in grouped:
+			if result.error is None and (result.has_row or result.target in since):
+				await self._probe_keys(database_url, result, since.get(result.target))
+		return results
+
+	async def _probe_batch(self, database_url: str, runnable: list[ProbeResult]) -> None:
+		query = build_batch_query([r.target for r in runnable], self._high_water, self.count_arrivals)
+		started = time.perf_counter()
+		try:
+			with span("probe", database=_safe_url(database_url), targets=len(runnable)):
+				rows = await self.connections.execute(database_url, query)
+		except Exception as e:
+			logger.error(
+				f"Probe failed for {len(runnable)} target(s) on {_safe_url(database_url)}: {e}",
+				extra=_probe_fields(database_url, started),
+			)
+			for result in runnable:
+				result.error = e
+				if settings.per_target_metrics:
+					PROBE_ERRORS.labels(result.target.name).inc()
+			return
+		finally:
+			elapsed = time.perf_counter() - started
+			if settings.per_target_metrics:
+				for result in runnable:
+					PROBE_LATENCY.labels(result.target.name).observe(elapsed)
+		logger.debug(f"Probed {len(runnable)} target(s) on {_safe_url(database_url)}", extra=_probe_fields(database_url, started))
+
+		with span("decode", database=_safe_url(database_url), rows=len(rows)):
+			self._decode(runnable, rows)
+
+	async def _probe_keys(self, database_url: str, result: ProbeResult, since: Any) -> None:
+		"""Grouped targets: the newest row per key since the high-water mark (or the lookback window)."""
+		target = result.target
+		decoder = self._decoder(target)
+		if since is None:
+			# First probe: discover the keys active within the lookback window before the newest row
+			since = decoder.encode(result.latest - timedelta(minutes=settings.grouped_lookback_minutes))
+		started = time.perf_counter()
+		try:
+			with span("probe_keys", database=_safe_url(database_url), target=target.name):
+				rows = await self.connections.execute(database_url, build_grouped_query(target, since))
+		except Exception as e:
+			logger.error(
+				f"Grouped probe failed for {target.name} on {_safe_url(database_url)}: {e}",
+				extra={**_probe_fields(database_url, started), "target": target.name},
+			)
+			result.error = e
+			if settings.per_target_metrics:
+				PROBE_ERRORS.labels(target.name).inc()
+			return
+		finally:
+			if settings.per_target_metrics:
+				PROBE_LATENCY.labels(target.name).observe(time.perf_counter() - started)
+
+		with span("decode_keys", target=target.name, rows=len(rows)):
+			keys: dict[str, float] = {}
+			newest, newest_raw = None, None
+			try:
+				for key, raw in rows:
+					if raw is None:
+						continue
+					seen = decoder.decode(raw)
+					keys["NULL" if key is None else str(key)] = seen.timestamp()
+					if newest is None or seen > newest:
+						newest, newest_raw = seen, raw
+			except (TypeError, ValueError, OverflowError) as e:
+				result.error = ValueError(f"Cannot decode {target.timestamp_column} value {raw!r}: {e}")
+				return
+		result.key_latest = keys
+		if newest is not None and (result.latest is None or newest >= result.latest):
+			self._high_water[target] = newest_raw
+			result.latest = newest
+		elif result.latest is None:
+			# Nothing at or after the high-water mark: the newest row is still the one it records
+			result.latest = decoder.decode(since)
+		result.has_row = True
+
+	def _decode(self, runnable: list[ProbeResult], rows: Sequence[Row]) -> None:
+		rows_by_index = {row[0]: row for row in rows}
+		for index, result in enumerate(runnable):
+			target = result.target
+			row = rows_by_index.get(index)
+			latest = row[1] if row is not None else None
+			if self.count_arrivals and row is not None and row[2] is not None:
+				result.arrived = int(row[2])
+			if latest is None:
+				# Nothing newer than the high-water mark (or an empty table)
+				latest = self._high_water.get(target)
+				if latest is None:
+					continue
+			else:
+				self._high_water[target] = latest
+			result.has_row = True
+			try:
+				result.latest = self._decoder(target).decode(latest)
+			except (TypeError, ValueError, OverflowError) as e:
+				result.error = ValueError(f"Cannot decode {target.timestamp_column} value {latest!r}: {e}")
+
+	async def probe(self, targets: Iterable[Target]) -> dict[str, ProbeResult]:
+		"""
+		Probe targets in batched statements of up to PROBE_BATCH_SIZE targets
+		per database, with up to PROBE_WORKERS databases probed at once.
+
+		Each database has a single probe connection, so its batches run one
+		after another in one worker; more workers only help when there are
+		more databases. The largest databases are started first, so a
+		database with thousands of targets does not run alone at the end.
+		"""
+		targets = list(targets)
+		await self.check_indexes(targets)
+		per_database = sorted(group_by_database(targets).items(), key=lambda item: len(item[1]), reverse=True)
+		results: dict[str, ProbeResult] = {}
+		queue = iter(per_database)
+		await asyncio.gather(*(self._drain(queue, results) for _ in range(min(max(settings.probe_workers, 1), len(per_database)))))
+		return results
+
+	async def _drain(self, queue: Iterator[tuple[str, list[Target]]], results: dict[str, ProbeResult]) -> None:
+		"""One probe worker: takes databases off the shared queue and runs each one's batches in turn."""
+		size = max(settings.probe_batch_size, 1)
+		for database_url, group in queue:
+			for start in range(0, len(group), size):
+				for result in await self._probe_database(database_url, group[start:start + size]):
+					results[result.target.name] = result
+
+	async def aclose(self) -> None:
+		await self.connections.aclose()
+
+
+async def probe_targets(targets: Iterable[Target]) -> dict[str, ProbeResult]:
+	"""One-off, non-incremental probe of the given targets."""
+	engine = ProbeEngine(index_policy="ignore")
+	try:
+		return await engine.probe(targets)
+	finally:
+		await engine.aclose()
+
+
+def _probe_fields(database_url: str, started: float) -> dict:
+	return {"stage": "probe", "database": _safe_url(database_url), "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def _safe_url(database_url: str) -> str:
+	return get_engine(database_url).url.render_as_string(hide_password=True)
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Optional, Sequence
+
+from sqlalchemy import Row, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql.elements import TextClause
+
+from .config import settings
+from .db import get_engine
+from .metrics import PROBE_CIRCUIT_OPEN, PROBE_TIMEOUTS
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class ProbeTimeoutError(RuntimeError):
+	"""Raised when a probe statement runs longer than PROBE_TIMEOUT_SECONDS, or cannot get the connection in time."""
+
+
+class CircuitOpenError(RuntimeError):
+	"""Raised without touching the database while its circuit breaker is open."""
+
+
+def probe_timeout_seconds() -> float:
+	"""PROBE_TIMEOUT_SECONDS, or half the check interval when unset."""
+	timeout = settings.probe_timeout_seconds or settings.check_interval_seconds / 2
+	if timeout >= settings.check_interval_seconds:
+		raise RuntimeError("PROBE_TIMEOUT_SECONDS must be shorter than CHECK_INTERVAL_SECONDS")
+	return timeout
+
+
+class CircuitBreaker:
+	"""
+	Consecutive-failure breaker for one database.
+
+	After `failure_threshold` failed probes in a row the circuit opens and
+	probes fail fast for `reset_seconds`, doubling on every failed retry up to
+	`max_reset_seconds`. Once the wait is over a single trial probe goes
+	through (half-open); success closes the circuit again.
+	"""
+
+	def __init__(self, failure_threshold: int, reset_seconds: float, max_reset_seconds: float) -> None:
+		self.failure_threshold = failure_threshold
+		self.reset_seconds = reset_seconds
+		self.max_reset_seconds = max_reset_seconds
+		self.failures = 0
+		self.opened_at: Optional[float] = None
+		self.open_for = reset_seconds
+		self._trial = False
+
+	@property
+	def state(self) -> str:
+		if self.opened_at is None:
+			return "closed"
+		return "half_open" if self._trial or time.monotonic() >= self.opened_at + self.open_for else "open"
+
+	def allow(self) -> bool:
+		if self.opened_at is None:
+			return True
+		if self._trial or time.monotonic() < self.opened_at + self.open_for:
+			return False
+		self._trial = True
+		return True
+
+	def record_success(self) -> None:
+		self.failures = 0
+		self.opened_at = None
+		self.open_for = self.reset_seconds
+		self._trial = False
+
+	def record_failure(self) -> bool:
+		"""Count a failure; True when this opens (or re-opens) the circuit."""
+		self.failures += 1
+		if self._trial:
+			self._trial = False
+			self.open_for = min(self.open_for * 2, self.max_reset_seconds)
+		elif self.opened_at is not None or self.failures < self.failure_threshold:
+			return False
+		self.opened_at = time.monotonic()
+		return True
+
+	def retry_at(self) -> Optional[float]:
+		return None if self.opened_at is None else self.opened_at + self.open_for
+
+
+class ProbeConnection:
+	"""
+	One long-lived connection for probing a database, taken from its shared engine.
+
+	Holding the connection skips the pool checkout (and its pre-ping) on
+	every tick, and lets drivers with a per-connection statement cache reuse
+	the prepared probe statement: asyncpg prepares server-side on first
+	execution and keeps it in SQLAlchemy's prepared statement cache. The
+	connection runs in autocommit mode so no transaction (and no snapshot)
+	stays open between ticks. Probes are serialised per database, so a slow
+	one cannot stack up overlapping statements behind it.
+	"""
+
+	def __init__(self, database_url: str, timeout: float) -> None:
+		self.database_url = database_url
+		self.timeout = timeout
+		self.breaker = CircuitBreaker(
+			settings.probe_breaker_failures,
+			settings.probe_breaker_reset_seconds,
+			settings.probe_breaker_max_reset_seconds,
+		)
+		self._conn: Optional[AsyncConnection] = None
+		self._lock = asyncio.Lock()
+		# Probes waiting for the connection
+		self._queued = 0
+		# Timed-out probes still winding down on their own connections
+		self._abandoned: set[asyncio.Task] = set()
+
+	@property
+	def label(self) -> str:
+		return get_engine(self.database_url).url.render_as_string(hide_password=True)
+
+	async def _connect(self) -> AsyncConnection:
+		with span("pool_checkout"):
+			conn = await get_engine(self.database_url).connect()
+		try:
+			with span("session_setup"):
+				await conn.execution_options(isolation_level="AUTOCOMMIT")
+				await self._set_statement_timeout(conn)
+		except BaseException:
+			await conn.close()
+			raise
+		return conn
+
+	async def _set_statement_timeout(self, conn: AsyncConnection) -> None:
+		"""Server-side limit too, so the database itself abandons a runaway probe."""
+		ms = int(self.timeout * 1000)
+		dialect = conn.dialect.name
+		if dialect == "postgresql":
+			await conn.execute(text(f"SET statement_timeout = {ms}"))
+		elif dialect == "mysql" and not conn.dialect.is_mariadb:
+			await conn.execute(text(f"SET SESSION max_execution_time = {ms}"))
+		# Elsewhere (SQLite, MariaDB, ...) the client-side timeout alone applies
+
+	async def execute(self, query: TextClause) -> Sequence[Row]:
+		# Each statement holds the connection for at most `timeout`, so the wait is bounded by the
+		# probes queued ahead (plus one timeout of slack); waiting is not a failure of the database
+		ahead = self._queued
+		self._queued += 1
+		try:
+			with span("lock_wait"):
+				await asyncio.wait_for(self._lock.acquire(), self.timeout * (ahead + 2))
+		except asyncio.TimeoutError:
+			raise ProbeTimeoutError(f"Still queued behind {ahead} probe(s) of this database") from None
+		finally:
+			self._queued -= 1
+		try:
+			# Decided after the wait, so probes queued behind a failure see the circuit it opened
+			if not self.breaker.allow():
+				raise CircuitOpenError(
+					f"Circuit open after {self.breaker.failures} failed probe(s); next attempt in "
+					f"{max(self.breaker.retry_at() - time.monotonic(), 0):.0f}s"
+				)
+			# The statement's own deadline starts once it has the connection
+			deadline = time.monotonic() + self.timeout
+			conn, self._conn = self._conn, None
+			task = asyncio.ensure_future(self._run(conn, query))
+			try:
+				done, _ = await asyncio.wait({task}, timeout=max(deadline - time.monotonic(), 0.001))
+			except asyncio.CancelledError:
+				task.cancel()
+				raise
+			if not done:
+				# Do not wait for the driver to give the connection back (SQLite only notices
+				# the cancellation once the statement ends); it is dropped in the background
+				task.cancel()
+				self._abandoned.add(task)
+				task.add_done_callback(self._reap)
+				PROBE_TIMEOUTS.labels(self.label).inc()
+				error = ProbeTimeoutError(f"Probe exceeded {self.timeout:g}s")
+				self._failed(error)
+				raise error
+			try:
+				self._conn, rows = task.result()
+			except Exception as e:
+				self._failed(e)
+				raise
+		finally:
+			self._lock.release()
+		self.breaker.record_success()
+		PROBE_CIRCUIT_OPEN.labels(self.label).set(0)
+		return rows
+
+	async def _run(self, conn: Optional[AsyncConnection], query: TextClause) -> tuple[AsyncConnection, Sequence[Row]]:
+		if conn is None:
+			conn = await self._connect()
+		try:
+			with span("execute"):
+				return conn, (await conn.execute(query)).all()
+		except BaseException:
+			# Broken, or cancelled mid-statement: the connection's state is unknown
+			await self._discard(conn)
+			raise
+
+	def _reap(self, task: asyncio.Task) -> None:
+		self._abandoned.discard(task)
+		if not task.cancelled() and task.exception() is not None:
+			logger.debug(f"Abandoned probe on {self.label} failed: {task.exception()}")
+
+	def _failed(self, error: Exception) -> None:
+		if self.breaker.record_failure():
+			PROBE_CIRCUIT_OPEN.labels(self.label).set(1)
+			logger.error(
+				f"Circuit opened for {self.label} after {self.breaker.failures} failed probe(s), "
+				f"retrying in {self.breaker.open_for:g}s: {error}"
+			)
+
+	async def _discard(self, conn: AsyncConnection) -> None:
+		try:
+			await conn.invalidate()
+			await conn.close()
+		except Exception as e:
+			logger.debug(f"Error discarding probe connection to {self.label}: {e}")
+
+	async def close(self) -> None:
+		async with self._lock:
+			conn, self._conn = self._conn, None
+			if conn is not None:
+				await conn.close()
+
+	def snapshot(self) -> dict:
+		retry_at = self.breaker.retry_at()
+		return {
+			"circuit": self.breaker.state,
+			"consecutive_failures": self.breaker.failures,
+			"retry_in_seconds": round(max(retry_at - time.monotonic(), 0), 1) if retry_at is not None else None,
+		}
+
+
+class ProbeConnections:
+	"""The dedicated probe connection and circuit breaker of every probed database."""
+
+	def __init__(self, timeout: Optional[float] = None) -> None:
+		self.timeout = timeout or probe_timeout_seconds()
+		self._connections: dict[str, ProbeConnection] = {}
+
+	def get(self, database_url: str) -> ProbeConnection:
+		connection = self._connections.get(database_url)
+		if connection is None:
+			connection = self._connections[database_url] = ProbeConnection(database_url, self.timeout)
+		return connection
+
+	async def execute(self, database_url: str, query: TextClause) -> Sequence[Row]:
+		return await self.get(database_url).execute(query)
+
+	async def release(self, keep: set[str]) -> None:
+		"""Close the connections of databases no longer probed."""
+		for database_url in list(self._connections.keys() - keep):
+			await self._connections.pop(database_url).close()
+
+	async def aclose(self) -> None:
+		await self.release(set())
+
+	def snapshot(self) -> dict:
+		return {connection.label: connection.snapshot() for connection in self._connections.values()}
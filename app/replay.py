@@ -0,0 +1,442 @@
+"""
+Replay historical activity through the alerting logic in virtual time.
+
+    python -m app.replay --csv export.csv --threshold-minutes 30 --cooldown-minutes 120
+    python -m app.replay --parquet export.parquet --target orders
+    python -m app.replay --from-table --start 2026-09-01 --end 2026-10-01 --output replay.json
+
+The configured targets are checked by the real ActivityMonitor, on a
+virtual clock that jumps from one tick to the next. Probes are answered
+from a timestamp-ordered row stream instead of the database, and alert
+events are recorded instead of delivered. Input is read incrementally, so
+memory stays flat however long the export is; exports must therefore be
+sorted by timestamp, and a row out of order stops the replay.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import heapq
+import json
+import logging
+import random
+import time
+from array import array
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+from sqlalchemy import text
+
+from .alerts import AlertEvent
+from .baselines import BaselineStore, BaselineTracker
+from .config import settings
+from .db import dispose_engines, get_engine
+from .logging_config import configure_logging
+from .monitor import ActivityMonitor
+from .probe import ProbeResult
+from .targets import Target, load_targets
+from .timestamps import TimestampDecoder
+
+logger = logging.getLogger(__name__)
+
+# (target name, key or None, aware UTC timestamp) of one historical row
+Row = tuple[str, Optional[str], datetime]
+
+# Rows pulled from a Parquet file or database cursor at a time
+BATCH_ROWS = 65536
+
+
+class VirtualClock:
+	"""The monitor's notion of now, advanced by the replay loop."""
+
+	def __init__(self, now: Optional[datetime] = None) -> None:
+		self.now = now or datetime.now(timezone.utc)
+
+	def __call__(self) -> datetime:
+		return self.now
+
+
+class ReplayProbe:
+	"""
+	Stands in for ProbeEngine: answers each probe from a timestamp-ordered
+	row stream, consuming the rows up to the virtual clock.
+
+	Like the real probe, arrival counts and per-key timestamps cover the
+	rows since the previous probe, and the first probe of a target reports
+	no arrival count.
+	"""
+
+	def __init__(self, rows: AsyncIterator[Row], clock: VirtualClock, count_arrivals: bool = False) -> None:
+		self.clock = clock
+		self.count_arrivals = count_arrivals
+		self.rows_read = 0
+		self.exhausted = False
+		# Set when the input turns out to be unsorted; the monitor treats probe errors as transient, the replay stops
+		self.error: Optional[RuntimeError] = None
+		self._rows = rows
+		self._next: Optional[Row] = None
+		# Timestamp of the last row taken from the stream, to catch unsorted input
+		self._last_at: Optional[datetime] = None
+		self._latest: dict[str, datetime] = {}
+		self._arrived: dict[str, int] = {}
+		self._keys: dict[str, dict[str, float]] = {}
+		self._probed: set[str] = set()
+
+	async def peek(self) -> Optional[datetime]:
+		"""
+		Timestamp of the next unread row, None once the stream is exhausted.
+
+		Rows must come in timestamp order: one older than its predecessor
+		would land after the clock has passed it, so it raises rather than
+		quietly skewing the report.
+		"""
+		if self._next is None and not self.exhausted:
+			try:
+				self._next = await self._rows.__anext__()
+			except StopAsyncIteration:
+				self.exhausted = True
+			else:
+				at = self._next[2]
+				if self._last_at is not None and at < self._last_at:
+					self.error = RuntimeError(
+						f"Replay input is not sorted by timestamp: a row of {self._next[0]!r} at {at.isoformat()} "
+						f"follows one at {self._last_at.isoformat()}; sort the export by its timestamp column"
+					)
+					raise self.error
+				self._last_at = at
+		return self._next[2] if self._next is not None else None
+
+	async def _advance(self, now: datetime) -> None:
+		while True:
+			at = await self.peek()
+			if at is None or at > now:
+				return
+			name, key, _ = self._next
+			self._next = None
+			self.rows_read += 1
+			latest = self._latest.get(name)
+			if latest is None or at > latest:
+				self._latest[name] = at
+			self._arrived[name] = self._arrived.get(name, 0) + 1
+			if key is not None:
+				keys = self._keys.setdefault(name, {})
+				seen = at.timestamp()
+				if seen > keys.get(key, 0.0):
+					keys[key] = seen
+
+	async def probe(self, targets: Iterable[Target]) -> dict[str, ProbeResult]:
+		await self._advance(self.clock())
+		results = {}
+		for target in targets:
+			latest = self._latest.get(target.name)
+			result = ProbeResult(target=target, has_row=latest is not None, latest=latest)
+			if self.count_arrivals and target.name in self._probed:
+				result.arrived = self._arrived.get(target.name, 0)
+			self._arrived.pop(target.name, None)
+			if target.key_column:
+				result.key_latest = self._keys.pop(target.name, {})
+			self._probed.add(target.name)
+			results[target.name] = result
+		return results
+
+	async def aclose(self) -> None:
+		pass
+
+
+class _DiscardingBaselineStore(BaselineStore):
+	"""Baselines learned during a replay stay in memory and never reach the state database."""
+
+	async def save(self, baselines) -> None:
+		pass
+
+
+class ReplayMonitor(ActivityMonitor):
+	"""ActivityMonitor on a virtual clock that records alert events instead of delivering them."""
+
+	def __init__(self, targets: list[Target], probe: ReplayProbe, clock: VirtualClock) -> None:
+		super().__init__(targets, probe_engine=probe, clock=clock)
+		self.fired: list[AlertEvent] = []
+		# The digest window runs on real timers and change detection queries the live database
+		self.digest = None
+		self.change_detector = None
+		if self.baselines is not None:
+			# Learned from scratch over the replayed history
+			self.baselines = BaselineTracker(_DiscardingBaselineStore())
+
+	async def _notify(self, event: AlertEvent) -> None:
+		self.fired.append(event)
+
+
+def _decode_records(
+	records: Iterable[dict], targets: dict[str, Target], timestamp_column: Optional[str], target_column: Optional[str]
+) -> Iterator[Row]:
+	"""Rows of an exported file as (target, key, timestamp), skipping targets not being replayed."""
+	decoders = {name: TimestampDecoder(t.source_timezone, t.timestamp_format) for name, t in targets.items()}
+	only = next(iter(targets)) if len(targets) == 1 else None
+	for record in records:
+		name = record.get(target_column) if target_column else only
+		target = targets.get(name)
+		if target is None:
+			continue
+		value = record.get(timestamp_column or target.timestamp_column)
+		if value is None or value == "":
+			continue
+		key = record.get(target.key_column) if target.key_column else None
+		yield name, None if key is None else str(key), decoders[name].decode(value)
+
+
+def _target_column(columns: Iterable[str], target_column: str, targets: dict[str, Target]) -> Optional[str]:
+	if target_column in columns:
+		return target_column
+	if len(targets) > 1:
+		raise RuntimeError(f"The input has no {target_column!r} column; pick one target with --target")
+	return None
+
+
+def csv_rows(path: str, targets: dict[str, Target], timestamp_column: Optional[str], target_column: str) -> Iterator[Row]:
+	with open(path, newline="", encoding="utf-8") as f:
+		reader = csv.DictReader(f)
+		column = _target_column(reader.fieldnames or [], target_column, targets)
+		yield from _decode_records(reader, targets, timestamp_column, column)
+
+
+def parquet_rows(path: str, targets: dict[str, Target], timestamp_column: Optional[str], target_column: str) -> Iterator[Row]:
+	try:
+		import pyarrow.parquet as pq
+	except ImportError:
+		raise RuntimeError("Replaying Parquet files needs pyarrow: pip install pyarrow") from None
+	parquet = pq.ParquetFile(path)
+	column = _target_column(parquet.schema_arrow.names, target_column, targets)
+	records = (record for batch in parquet.iter_batches(batch_size=BATCH_ROWS) for record in batch.to_pylist())
+	yield from _decode_records(records, targets, timestamp_column, column)
+
+
+async def table_rows(target: Target, start: Optional[datetime], end: Optional[datetime]) -> AsyncIterator[Row]:
+	"""Stream a target's own table in timestamp order, reading only the indexed range being replayed."""
+	decoder = TimestampDecoder(target.source_timezone, target.timestamp_format)
+	column = target.timestamp_column
+	async with get_engine(target.database_url).connect() as conn:
+		# One value first, so the bounds can be encoded in the column's representation
+		sample = (await conn.execute(text(f"SELECT MAX({column}) FROM {target.table}"))).scalar()
+		if sample is None:
+			return
+		decoder.decode(sample)
+		where, params = [f"{column} IS NOT NULL"], {}
+		if start is not None:
+			where.append(f"{column} >= :start")
+			params["start"] = decoder.encode(start)
+		if end is not None:
+			where.append(f"{column} <= :end")
+			params["end"] = decoder.encode(end)
+		key = f"{target.key_column}, " if target.key_column else "NULL, "
+		query = text(f"SELECT {key}{column} FROM {target.table} WHERE {' AND '.join(where)} ORDER BY {column}")
+		result = await conn.stream(query.bindparams(**params), execution_options={"yield_per": BATCH_ROWS})
+		async for key_value, value in result:
+			yield target.name, None if key_value is None else str(key_value), decoder.decode(value)
+
+
+async def _iterate(rows: Iterable[Row]) -> AsyncIterator[Row]:
+	for row in rows:
+		yield row
+
+
+async def merge_rows(streams: list[AsyncIterator[Row]]) -> AsyncIterator[Row]:
+	"""Merge timestamp-ordered streams into one, holding a single row per stream."""
+	heap = []
+	for index, stream in enumerate(streams):
+		try:
+			row = await stream.__anext__()
+		except StopAsyncIteration:
+			continue
+		heap.append((row[2], index, row))
+	heapq.heapify(heap)
+	while heap:
+		_, index, row = heap[0]
+		yield row
+		try:
+			following = await streams[index].__anext__()
+		except StopAsyncIteration:
+			heapq.heappop(heap)
+			continue
+		heapq.heapreplace(heap, (following[2], index, following))
+
+
+def _percentiles(values: Iterable[float]) -> dict:
+	ordered = sorted(values)
+	if not ordered:
+		return {"n": 0}
+
+	def pct(p: float) -> float:
+		return round(ordered[min(int(p * len(ordered)), len(ordered) - 1)], 3)
+
+	return {"n": len(ordered), "p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99), "max": round(ordered[-1], 3)}
+
+
+def _first_alerts(events: list[AlertEvent]) -> Iterator[AlertEvent]:
+	"""The first inactivity alert of every quiet spell, leaving out repeats after the cooldown."""
+	seen = set()
+	for event in events:
+		if event.kind == "inactive" and not event.keys and (event.target.name, event.last_update) not in seen:
+			seen.add((event.target.name, event.last_update))
+			yield event
+
+
+def _event_record(event: AlertEvent) -> dict:
+	record = {
+		"at": event.at.isoformat(),
+		"kind": event.kind,
+		"target": event.target.name,
+		"last_update": event.last_update.isoformat(),
+		"inactive_for_seconds": round(event.inactive_for.total_seconds(), 3),
+	}
+	if event.keys:
+		record["keys"] = [key for key, _ in event.keys]
+	if event.kind == "rate_drop":
+		record["observed_rate"] = round(event.observed_rate, 3)
+		record["expected_rate"] = round(event.expected_rate, 3)
+	return record
+
+
+async def replay(
+	targets: list[Target],
+	rows: AsyncIterator[Row],
+	start: Optional[datetime] = None,
+	end: Optional[datetime] = None,
+	scheduler_mode: Optional[str] = None,
+	interval: Optional[timedelta] = None,
+) -> dict:
+	"""Run the monitor over `rows` from `start` (default: the first row) to `end` (default: the last row)."""
+	interval = interval or settings.check_interval_timedelta()
+	adaptive = (scheduler_mode or settings.scheduler_mode) == "adaptive"
+	clock = VirtualClock()
+	probe = ReplayProbe(rows, clock, count_arrivals=settings.baseline_enabled)
+	first = await probe.peek()
+	if first is None:
+		raise RuntimeError("No rows to replay for the selected targets")
+	clock.now = start or first
+	monitor = ReplayMonitor(targets, probe, clock)
+
+	tick_ms = array("d")
+	started = time.perf_counter()
+	while (clock.now <= end) if end is not None else not probe.exhausted:
+		tick_started = time.perf_counter()
+		if adaptive:
+			await monitor.check_due()
+		else:
+			await monitor.check_and_alert()
+		if probe.error is not None:
+			raise probe.error
+		tick_ms.append((time.perf_counter() - tick_started) * 1000)
+		clock.now = monitor.next_wakeup() if adaptive else clock.now + interval
+	wall = time.perf_counter() - started
+	await monitor.aclose()
+
+	virtual_start = start or first
+	virtual_seconds = (clock.now - virtual_start).total_seconds()
+	thresholds = {t.name: t.inactivity_timedelta().total_seconds() for t in targets}
+	by_kind: dict[str, int] = {}
+	by_target: dict[str, int] = {}
+	for event in monitor.fired:
+		by_kind[event.kind] = by_kind.get(event.kind, 0) + 1
+		by_target[event.target.name] = by_target.get(event.target.name, 0) + 1
+	return {
+		"start": virtual_start.isoformat(),
+		"end": clock.now.isoformat(),
+		"scheduler_mode": "adaptive" if adaptive else "interval",
+		"ticks": len(tick_ms),
+		"rows": probe.rows_read,
+		"wall_seconds": round(wall, 3),
+		"ticks_per_second": round(len(tick_ms) / wall, 1) if wall else None,
+		"rows_per_second": round(probe.rows_read / wall, 1) if wall else None,
+		# Virtual time covered per second of wall time
+		"speedup": round(virtual_seconds / wall) if wall else None,
+		"tick_ms": _percentiles(tick_ms),
+		"alerts": {"total": len(monitor.fired), "by_kind": by_kind, "by_target": by_target},
+		# How long after crossing the threshold each quiet spell was first alerted on (bounded by the check interval)
+		"detection_delay_seconds": _percentiles(
+			event.inactive_for.total_seconds() - thresholds[event.target.name] for event in _first_alerts(monitor.fired)
+		),
+		"events": [_event_record(event) for event in monitor.fired],
+	}
+
+
+def _parse_time(value: str) -> datetime:
+	parsed = datetime.fromisoformat(value)
+	return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	source = parser.add_mutually_exclusive_group(required=True)
+	source.add_argument("--csv", help="CSV export with a header row, sorted by timestamp (oldest first)")
+	source.add_argument("--parquet", help="Parquet export sorted by timestamp, oldest first (needs pyarrow)")
+	source.add_argument("--from-table", action="store_true", help="Stream each target's own table")
+	parser.add_argument("--target", action="append", help="Replay only this target (repeatable; default: all configured)")
+	parser.add_argument("--timestamp-column", help="Timestamp column in the export (default: each target's timestamp_column)")
+	parser.add_argument("--target-column", default="target", help="Export column naming each row's target (default: target)")
+	parser.add_argument("--start", type=_parse_time, help="Virtual start time, ISO 8601 (default: the first row)")
+	parser.add_argument("--end", type=_parse_time, help="Virtual end time, ISO 8601 (default: the last row)")
+	parser.add_argument("--threshold-minutes", type=int, help="Override every target's inactivity threshold")
+	parser.add_argument("--cooldown-minutes", type=int, help="Override every target's alert cooldown")
+	parser.add_argument("--interval-seconds", type=float, help="Override CHECK_INTERVAL_SECONDS")
+	parser.add_argument("--scheduler-mode", choices=("interval", "adaptive"), help="Override SCHEDULER_MODE")
+	parser.add_argument("--seed", type=int, default=1, help="Seed for the adaptive scheduler's jitter")
+	parser.add_argument("--output", help="Write the report, including every alert event, as JSON to this path")
+	parser.add_argument("--verbose", action="store_true", help="Keep the monitor's per-check logging")
+	args = parser.parse_args(argv)
+
+	configure_logging()
+	if not args.verbose:
+		# Months of ticks would otherwise log every cooldown and alert decision
+		logging.getLogger("app").setLevel(logging.ERROR)
+
+	targets = load_targets()
+	if args.target:
+		unknown = set(args.target) - {t.name for t in targets}
+		if unknown:
+			raise RuntimeError(f"Unknown target(s): {', '.join(sorted(unknown))}")
+		targets = [t for t in targets if t.name in args.target]
+	overrides = {}
+	if args.threshold_minutes is not None:
+		overrides["inactivity_threshold_minutes"] = args.threshold_minutes
+	if args.cooldown_minutes is not None:
+		overrides["alert_cooldown_minutes"] = args.cooldown_minutes
+	targets = [replace(t, **overrides) for t in targets]
+	by_name = {t.name: t for t in targets}
+	random.seed(args.seed)
+
+	async def run() -> dict:
+		if args.csv:
+			rows = _iterate(csv_rows(args.csv, by_name, args.timestamp_column, args.target_column))
+		elif args.parquet:
+			rows = _iterate(parquet_rows(args.parquet, by_name, args.timestamp_column, args.target_column))
+		else:
+			rows = merge_rows([table_rows(t, args.start, args.end) for t in targets])
+		interval = timedelta(seconds=args.interval_seconds) if args.interval_seconds else None
+		try:
+			return await replay(targets, rows, args.start, args.end, args.scheduler_mode, interval)
+		finally:
+			await dispose_engines()
+
+	report = asyncio.run(run())
+	print(
+		f"⏪ Replayed {report['start']} → {report['end']}: {report['ticks']} ticks, {report['rows']} rows "
+		f"in {report['wall_seconds']}s ({report['speedup']}x real time, {report['ticks_per_second']} ticks/s)"
+	)
+	print(f"   tick latency ms: {report['tick_ms']}")
+	print(f"   alerts: {report['alerts']['total']} {report['alerts']['by_kind']}")
+	if report["detection_delay_seconds"]["n"]:
+		print(f"   detection delay s: {report['detection_delay_seconds']}")
+	for name, count in sorted(report["alerts"]["by_target"].items(), key=lambda item: -item[1]):
+		print(f"   {name:<30} {count:>6}")
+	if args.output:
+		Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+		print(f"📄 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+	main()
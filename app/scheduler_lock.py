@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import logging
+import os
+from typing import Optional
+
+try:
+	import fcntl
+except ImportError:  # Windows
+	fcntl = None
+	import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+def _try_lock(fd: int) -> None:
+	if fcntl is not None:
+		fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+	else:
+		msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+
+def _unlock(fd: int) -> None:
+	if fcntl is not None:
+		fcntl.flock(fd, fcntl.LOCK_UN)
+	else:
+		os.lseek(fd, 0, os.SEEK_SET)
+		msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class SchedulerLock:
+	"""
+	Exclusive, non-blocking lock on a file, used so exactly one worker process
+	on a host runs the scheduler. The operating system drops the lock when the
+	holder exits, however it exits, so another worker can take over.
+	"""
+
+	def __init__(self, path: str) -> None:
+		self.path = path
+		self._fd: Optional[int] = None
+
+	@property
+	def held(self) -> bool:
+		return self._fd is not None
+
+	def acquire(self) -> bool:
+		if self._fd is not None:
+			return True
+		fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+		try:
+			_try_lock(fd)
+		except OSError:
+			os.close(fd)
+			return False
+		# Record the holder for anyone inspecting the file
+		os.ftruncate(fd, 0)
+		os.write(fd, f"{os.getpid()}\n".encode())
+		self._fd = fd
+		logger.info(f"Acquired scheduler lock {self.path} (pid {os.getpid()})")
+		return True
+
+	def release(self) -> None:
+		if self._fd is None:
+			return
+		try:
+			_unlock(self._fd)
+		finally:
+			os.close(self._fd)
+			self._fd = None
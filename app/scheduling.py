@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+# Never re-probe a target sooner than this, even if its deadline has already passed
+MIN_DELAY = timedelta(seconds=1)
+
+SCHEDULER_MODES = {"interval", "adaptive"}
+
+
+def next_check_at(
+	status: str,
+	now: datetime,
+	last_seen: Optional[datetime],
+	threshold: timedelta,
+	interval: timedelta,
+	jitter_seconds: float = 0.0,
+	max_delay: Optional[timedelta] = None,
+) -> datetime:
+	"""
+	When a target next needs probing in adaptive mode.
+
+	A healthy target whose newest row is at T cannot alert before
+	T + threshold, so that is the next useful check; a small random jitter
+	keeps targets written by the same job from all being probed in one tick.
+	Errors, empty tables and targets already alerting (so that resumption is
+	noticed promptly) fall back to the base interval. `max_delay` caps the
+	wait, e.g. for targets whose arrival rate must be sampled regularly.
+	"""
+	if status == "ok" and last_seen is not None:
+		due = last_seen + threshold + timedelta(seconds=random.uniform(0, jitter_seconds))
+	else:
+		due = now + interval
+	if max_delay is not None:
+		due = min(due, now + max_delay)
+	return max(due, now + MIN_DELAY)
@@ -0,0 +1,57 @@
+"""
+Production entry point: uvicorn without the reloader, several HTTP workers,
+and uvloop/httptools when installed (they come with uvicorn[standard]).
+
+Every worker serves the API; the one holding SCHEDULER_LOCK_FILE also runs
+the scheduled checks, the outbox and the shard leases (see app.main).
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import os
+from typing import Optional
+
+import uvicorn
+
+from .config import settings
+from .logging_config import configure_logging
+
+
+def _installed(module: str) -> bool:
+	return importlib.util.find_spec(module) is not None
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+	parser = argparse.ArgumentParser(description="Run the Database Activity Monitor")
+	parser.add_argument("--host", default=settings.host)
+	parser.add_argument("--port", type=int, default=settings.port)
+	parser.add_argument("--workers", type=int, default=settings.web_concurrency, help="HTTP worker processes (WEB_CONCURRENCY)")
+	parser.add_argument("--reload", action="store_true", help="Development only: one worker, restart on code changes")
+	args = parser.parse_args(argv)
+	configure_logging()
+	# Workers read this to decide whether status events must be relayed between them
+	os.environ["WEB_CONCURRENCY"] = str(1 if args.reload else args.workers)
+
+	uvicorn.run(
+		# Each worker builds its own app, monitor and background threads when it starts
+		"app.main:create_app",
+		factory=True,
+		host=args.host,
+		port=args.port,
+		workers=1 if args.reload else args.workers,
+		reload=args.reload,
+		# uvloop is not available on Windows; fall back to the standard implementations there
+		loop="uvloop" if _installed("uvloop") else "asyncio",
+		http="httptools" if _installed("httptools") else "h11",
+		log_level=settings.log_level.lower(),
+		# Open /events and /ws streams would otherwise hold up shutdown indefinitely
+		timeout_graceful_shutdown=5,
+		# Keep uvicorn's own records on the queued handler set up by configure_logging
+		log_config=None,
+	)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import bisect
+import hashlib
+import logging
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import settings
+from .db import get_engine
+
+logger = logging.getLogger(__name__)
+
+# Points per replica on the ring; more points give a more even split
+VNODES = 64
+
+# Targets per IN (...) list, well under SQLite's bound-parameter limit
+RELEASE_BATCH_SIZE = 500
+
+_SCHEMA = (
+	"""
+	CREATE TABLE IF NOT EXISTS shard_members (
+		replica_id TEXT PRIMARY KEY,
+		expires_at REAL NOT NULL
+	)
+	""",
+	# A lease is held for as long as its owner's membership is live; renewing it is the heartbeat
+	"""
+	CREATE TABLE IF NOT EXISTS shard_leases (
+		target TEXT PRIMARY KEY,
+		owner TEXT NOT NULL
+	)
+	""",
+)
+
+
+def _hash(key: str) -> int:
+	return int.from_bytes(hashlib.sha1(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+	"""Consistent hash ring: adding or removing a replica moves only ~1/N of the targets."""
+
+	def __init__(self, members: Iterable[str], vnodes: int = VNODES) -> None:
+		points = sorted((_hash(f"{member}#{i}"), member) for member in set(members) for i in range(vnodes))
+		self._hashes = [h for h, _ in points]
+		self._members = [m for _, m in points]
+
+	def owner(self, key: str) -> Optional[str]:
+		if not self._hashes:
+			return None
+		index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+		return self._members[index]
+
+
+class LeaseStore:
+	"""
+	Replica membership and per-target ownership leases in a shared database.
+
+	Membership rows carry an expiry time that each replica renews with its
+	heartbeat. A target's lease names its owner and stays valid as long as
+	that owner's membership does, so renewing costs one row however many
+	targets a replica holds, and lease rows are only written when a target
+	changes hands. Expiry uses each replica's wall clock, so keep clock skew
+	well below the TTL.
+	"""
+
+	def __init__(self, database_url: Optional[str] = None) -> None:
+		self.database_url = database_url or settings.lease_database_url
+
+	@property
+	def engine(self) -> AsyncEngine:
+		# Resolved on first use so constructing this at import time does not build the engine
+		return get_engine(self.database_url)
+
+	async def create_schema(self) -> None:
+		async with self.engine.begin() as conn:
+			for statement in _SCHEMA:
+				await conn.execute(text(statement))
+
+	async def heartbeat(self, replica_id: str, ttl_seconds: float) -> list[str]:
+		"""Renew this replica's membership (and with it its leases) and return every live replica."""
+		now = time.time()
+		async with self.engine.begin() as conn:
+			await conn.execute(
+				text(
+					"""
+					INSERT INTO shard_members (replica_id, expires_at) VALUES (:replica_id, :expires_at)
+					ON CONFLICT (replica_id) DO UPDATE SET expires_at = excluded.expires_at
+					"""
+				),
+				{"replica_id": replica_id, "expires_at": now + ttl_seconds},
+			)
+			await conn.execute(text("DELETE FROM shard_members WHERE expires_at < :now"), {"now": now})
+			# Leases of replicas that are gone are void; dropping them keeps the table to live owners
+			await conn.execute(text("DELETE FROM shard_leases WHERE owner NOT IN (SELECT replica_id FROM shard_members)"))
+			rows = await conn.execute(text("SELECT replica_id FROM shard_members ORDER BY replica_id"))
+			return [row.replica_id for row in rows]
+
+	async def held(self, replica_id: str) -> set[str]:
+		async with self.engine.connect() as conn:
+			rows = await conn.execute(text("SELECT target FROM shard_leases WHERE owner = :owner"), {"owner": replica_id})
+			return {row.target for row in rows}
+
+	async def claim(self, replica_id: str, targets: Iterable[str]) -> set[str]:
+		"""
+		Take leases on `targets`; return every target this replica now holds.
+
+		A lease whose owner is still a live member is left alone until it is
+		released or the owner's membership expires, so two replicas never own
+		a target at once.
+		"""
+		params = [{"target": t, "owner": replica_id, "now": time.time()} for t in targets]
+		async with self.engine.begin() as conn:
+			if params:
+				await conn.execute(
+					text(
+						"""
+						INSERT INTO shard_leases (target, owner) VALUES (:target, :owner)
+						ON CONFLICT (target) DO UPDATE SET owner = excluded.owner
+						WHERE shard_leases.owner NOT IN (SELECT replica_id FROM shard_members WHERE expires_at >= :now)
+						"""
+					),
+					params,
+				)
+			rows = await conn.execute(text("SELECT target FROM shard_leases WHERE owner = :owner"), {"owner": replica_id})
+			return {row.target for row in rows}
+
+	async def release(self, replica_id: str, targets: Optional[Iterable[str]] = None) -> None:
+		"""Drop this replica's leases on `targets` (all of them when None), so their new owners can claim them."""
+		async with self.engine.begin() as conn:
+			if targets is None:
+				await conn.execute(text("DELETE FROM shard_leases WHERE owner = :owner"), {"owner": replica_id})
+				return
+			targets = list(targets)
+			for start in range(0, len(targets), RELEASE_BATCH_SIZE):
+				await conn.execute(
+					text("DELETE FROM shard_leases WHERE owner = :owner AND target IN :targets").bindparams(
+						bindparam("targets", expanding=True)
+					),
+					{"owner": replica_id, "targets": targets[start:start + RELEASE_BATCH_SIZE]},
+				)
+
+	async def leave(self, replica_id: str) -> None:
+		await self.release(replica_id)
+		async with self.engine.begin() as conn:
+			await conn.execute(text("DELETE FROM shard_members WHERE replica_id = :replica_id"), {"replica_id": replica_id})
+
+
+class ShardCoordinator:
+	"""
+	Decides which targets this replica monitors.
+
+	Each rebalance renews membership, maps every target onto a hash ring of
+	the live replicas, releases the leases the ring now gives to someone else
+	and claims the ones it gives to us that we do not hold yet. A replica
+	that dies stops renewing; its membership, and with it its leases, expire
+	after LEASE_TTL_SECONDS and the survivors pick its targets up on their
+	next rebalance.
+	"""
+
+	def __init__(
+		self,
+		store: LeaseStore,
+		replica_id: Optional[str] = None,
+		ttl_seconds: Optional[float] = None,
+	) -> None:
+		self.store = store
+		self.replica_id = replica_id or settings.replica_id
+		self.ttl_seconds = ttl_seconds or settings.lease_ttl_seconds
+		self.members: list[str] = []
+		self.owned: set[str] = set()
+		self._renewed_at: Optional[float] = None
+
+	async def start(self) -> None:
+		await self.store.create_schema()
+
+	async def rebalance(self, targets: Iterable[str]) -> set[str]:
+		targets = list(targets)
+		# Leases are written during this call, so they run from here rather than from its end
+		started = time.monotonic()
+		self.members = await self.store.heartbeat(self.replica_id, self.ttl_seconds)
+		ring = HashRing(self.members)
+		assigned = {t for t in targets if ring.owner(t) == self.replica_id}
+		# Only leases changing hands are written; the heartbeat above renewed the rest
+		held = await self.store.held(self.replica_id)
+		if held - assigned:
+			await self.store.release(self.replica_id, held - assigned)
+		owned = await self.store.claim(self.replica_id, assigned - held)
+		if owned != self.owned:
+			logger.info(
+				f"Replica {self.replica_id} owns {len(owned)}/{len(targets)} target(s) "
+				f"across {len(self.members)} replica(s)"
+			)
+		self.owned = owned
+		self._renewed_at = started
+		return owned
+
+	def leases_expired(self) -> bool:
+		"""True once the last successful renewal is older than the lease TTL."""
+		return self._renewed_at is None or time.monotonic() - self._renewed_at > self.ttl_seconds
+
+	async def stop(self) -> None:
+		# Hand targets over right away instead of waiting for the leases to expire
+		await self.store.leave(self.replica_id)
+		self.owned = set()
+
+	def snapshot(self) -> dict:
+		return {"replica_id": self.replica_id, "members": self.members, "owned_targets": sorted(self.owned)}
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import heapq
+from array import array
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from .config import settings
+from .metrics import TARGET_ALERTING, TARGET_INACTIVE_SECONDS, forget_target_metrics
+from .targets import Target
+
+# Check statuses, most severe first; stored per target as an index into this tuple
+STATUSES = ("error", "alert_sent", "inactive", "cooldown", "no_rows", "ok")
+_NOT_CHECKED = 255
+_NEVER = 0.0
+_UNSCHEDULED = float("inf")
+
+
+class _NoopGauge:
+	"""Stands in for a per-target gauge while PER_TARGET_METRICS is off."""
+
+	__slots__ = ()
+
+	def set(self, value: float) -> None:
+		pass
+
+
+_NOOP_GAUGES = (_NoopGauge(), _NoopGauge())
+
+
+def to_datetime(seconds: float) -> Optional[datetime]:
+	"""Aware UTC datetime for stored epoch seconds, None for the 'never' marker."""
+	return datetime.fromtimestamp(seconds, tz=timezone.utc) if seconds != _NEVER else None
+
+
+class TargetState:
+	"""
+	Check, alert and scheduling state for every target, one slot per target.
+
+	Like KeyState, targets map to slots in parallel arrays of epoch seconds
+	and flag bytes rather than a dict entry per target and field, so 100k
+	targets cost a few MB. Next check times are kept in a min-heap of
+	(due, slot) with lazy deletion: rescheduling pushes a new entry and the
+	old one is skipped when it surfaces, so picking the due targets costs
+	O(due · log n) and the next wakeup is the heap top instead of a scan.
+	"""
+
+	__slots__ = (
+		"index", "targets", "last_seen", "last_alert", "checked_at", "next_due", "status", "alerting", "gauges", "_free",
+		"_heap", "_scheduled",
+	)
+
+	def __init__(self, targets: Iterable[Target] = ()) -> None:
+		self.index: dict[str, int] = {}
+		# Target per slot; None for a slot freed by a removed target
+		self.targets: list[Optional[Target]] = []
+		# Epoch seconds of the newest row seen (0 = none yet)
+		self.last_seen = array("d")
+		# Epoch seconds of the last alert, which starts the cooldown (0 = never alerted)
+		self.last_alert = array("d")
+		# Epoch seconds of the last completed check (0 = not checked yet)
+		self.checked_at = array("d")
+		# Epoch seconds of the next check; inf while not scheduled or being checked
+		self.next_due = array("d")
+		# Index into STATUSES of the last check's status
+		self.status = bytearray()
+		# 1 while a target has been alerted on and not seen active again
+		self.alerting = bytearray()
+		# Prometheus children per slot, resolved once instead of by label on every check
+		self.gauges: list[Optional[tuple]] = []
+		self._free: list[int] = []
+		self._heap: list[tuple[float, int]] = []
+		self._scheduled = 0
+		for target in targets:
+			self.add(target)
+
+	def __len__(self) -> int:
+		return len(self.index)
+
+	def slot(self, target: Target) -> int:
+		return self.index[target.name]
+
+	def add(self, target: Target) -> int:
+		"""Give a new target a slot (reusing a freed one) with blank state."""
+		if self._free:
+			slot = self._free.pop()
+			self.targets[slot] = target
+			self._reset(slot)
+		else:
+			slot = len(self.targets)
+			self.targets.append(target)
+			self.last_seen.append(_NEVER)
+			self.last_alert.append(_NEVER)
+			self.checked_at.append(_NEVER)
+			self.next_due.append(_UNSCHEDULED)
+			self.status.append(_NOT_CHECKED)
+			self.alerting.append(0)
+			self.gauges.append(None)
+		self.index[target.name] = slot
+		return slot
+
+	def replace(self, target: Target) -> int:
+		"""A changed target keeps its slot and its alert state but starts a fresh check history."""
+		slot = self.index[target.name]
+		self.targets[slot] = target
+		self.unschedule(slot)
+		self.last_seen[slot] = _NEVER
+		self.checked_at[slot] = _NEVER
+		self.status[slot] = _NOT_CHECKED
+		return slot
+
+	def remove(self, name: str) -> None:
+		slot = self.index.pop(name)
+		forget_target_metrics(name)
+		self.unschedule(slot)
+		self.targets[slot] = None
+		self._reset(slot)
+		self._free.append(slot)
+
+	def _reset(self, slot: int) -> None:
+		self.last_seen[slot] = _NEVER
+		self.last_alert[slot] = _NEVER
+		self.checked_at[slot] = _NEVER
+		self.status[slot] = _NOT_CHECKED
+		self.alerting[slot] = 0
+		self.gauges[slot] = None
+
+	def forget_checks(self, slot: int) -> None:
+		"""Drop scheduling, last-check state and metrics, e.g. when another replica takes the target over."""
+		self.unschedule(slot)
+		self.checked_at[slot] = _NEVER
+		self.status[slot] = _NOT_CHECKED
+		# The new owner exports the target's series from now on
+		forget_target_metrics(self.targets[slot].name)
+		self.gauges[slot] = None
+
+	def record_check(self, slot: int, at: float, status: str) -> None:
+		self.checked_at[slot] = at
+		self.status[slot] = STATUSES.index(status)
+
+	def last_status(self, slot: int) -> Optional[str]:
+		code = self.status[slot]
+		return STATUSES[code] if code != _NOT_CHECKED else None
+
+	def metrics(self, slot: int) -> tuple:
+		"""(inactive seconds, alerting) gauges of the target in `slot`."""
+		if not settings.per_target_metrics:
+			return _NOOP_GAUGES
+		gauges = self.gauges[slot]
+		if gauges is None:
+			name = self.targets[slot].name
+			gauges = self.gauges[slot] = (TARGET_INACTIVE_SECONDS.labels(name), TARGET_ALERTING.labels(name))
+		return gauges
+
+	def schedule(self, slot: int, due: float) -> None:
+		"""Set the next check time; 0 means due at once."""
+		if self.next_due[slot] == _UNSCHEDULED:
+			self._scheduled += 1
+		self.next_due[slot] = due
+		heapq.heappush(self._heap, (due, slot))
+		# Stale entries pile up when targets are rescheduled without being popped (interval mode, reloads)
+		if len(self._heap) > 2 * self._scheduled + 64:
+			self._heap = [(when, index) for index, when in enumerate(self.next_due) if when != _UNSCHEDULED]
+			heapq.heapify(self._heap)
+
+	def unschedule(self, slot: int) -> None:
+		if self.next_due[slot] != _UNSCHEDULED:
+			self._scheduled -= 1
+			self.next_due[slot] = _UNSCHEDULED
+
+	def due_at(self, slot: int) -> Optional[float]:
+		"""Next check time of `slot`, None while it is not scheduled."""
+		due = self.next_due[slot]
+		return due if due != _UNSCHEDULED else None
+
+	def pop_due(self, now: float) -> list[int]:
+		"""Slots due at `now`, taken off the schedule until they are rescheduled."""
+		heap, next_due = self._heap, self.next_due
+		due = []
+		while heap and heap[0][0] <= now:
+			when, slot = heapq.heappop(heap)
+			if next_due[slot] == when:
+				self.unschedule(slot)
+				due.append(slot)
+		return due
+
+	def next_wakeup(self) -> Optional[float]:
+		"""Earliest scheduled check time, or None when nothing is scheduled."""
+		heap = self._heap
+		while heap and self.next_due[heap[0][1]] != heap[0][0]:
+			heapq.heappop(heap)
+		return heap[0][0] if heap else None
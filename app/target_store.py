@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from .config import settings
+from .db import get_engine
+from .targets import Target, validate_identifiers
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+	"""
+	CREATE TABLE IF NOT EXISTS monitored_targets (
+		name TEXT PRIMARY KEY,
+		table_name TEXT NOT NULL,
+		timestamp_column TEXT NOT NULL,
+		database_url TEXT NOT NULL,
+		inactivity_threshold_minutes INTEGER NOT NULL,
+		alert_cooldown_minutes INTEGER NOT NULL,
+		critical INTEGER NOT NULL DEFAULT 0,
+		source_timezone TEXT NOT NULL DEFAULT 'UTC',
+		timestamp_format TEXT,
+		key_column TEXT,
+		source TEXT NOT NULL,
+		updated_at REAL NOT NULL
+	)
+	""",
+	# A single counter bumped by every write, so replicas can cheaply tell whether to reload
+	"""
+	CREATE TABLE IF NOT EXISTS monitored_targets_revision (
+		id INTEGER PRIMARY KEY,
+		revision INTEGER NOT NULL
+	)
+	""",
+)
+
+# Columns added after the table was first released, created on start when missing
+_ADDED_COLUMNS = {
+	"source_timezone": "TEXT NOT NULL DEFAULT 'UTC'",
+	"timestamp_format": "TEXT",
+	"key_column": "TEXT",
+}
+
+_INSERT = """
+	INSERT INTO monitored_targets (
+		name, table_name, timestamp_column, database_url,
+		inactivity_threshold_minutes, alert_cooldown_minutes, critical,
+		source_timezone, timestamp_format, key_column, source, updated_at
+	) VALUES (
+		:name, :table_name, :timestamp_column, :database_url,
+		:inactivity_threshold_minutes, :alert_cooldown_minutes, :critical,
+		:source_timezone, :timestamp_format, :key_column, :source, :updated_at
+	)
+"""
+
+_UPSERT = _INSERT + """
+	ON CONFLICT (name) DO UPDATE SET
+		table_name = excluded.table_name,
+		timestamp_column = excluded.timestamp_column,
+		database_url = excluded.database_url,
+		inactivity_threshold_minutes = excluded.inactivity_threshold_minutes,
+		alert_cooldown_minutes = excluded.alert_cooldown_minutes,
+		critical = excluded.critical,
+		source_timezone = excluded.source_timezone,
+		timestamp_format = excluded.timestamp_format,
+		key_column = excluded.key_column,
+		source = excluded.source,
+		updated_at = excluded.updated_at
+"""
+
+
+def _row_params(target: Target, source: str) -> dict:
+	return {
+		"name": target.name,
+		"table_name": target.table,
+		"timestamp_column": target.timestamp_column,
+		"database_url": target.database_url,
+		"inactivity_threshold_minutes": target.inactivity_threshold_minutes,
+		"alert_cooldown_minutes": target.alert_cooldown_minutes,
+		"critical": int(target.critical),
+		"source_timezone": target.source_timezone,
+		"timestamp_format": target.timestamp_format,
+		"key_column": target.key_column,
+		"source": source,
+		"updated_at": time.time(),
+	}
+
+
+def _row_to_target(row) -> Target:
+	return Target(
+		name=row.name,
+		table=row.table_name,
+		timestamp_column=row.timestamp_column,
+		database_url=row.database_url,
+		inactivity_threshold_minutes=row.inactivity_threshold_minutes,
+		alert_cooldown_minutes=row.alert_cooldown_minutes,
+		critical=bool(row.critical),
+		source_timezone=row.source_timezone,
+		timestamp_format=row.timestamp_format,
+		key_column=row.key_column,
+	)
+
+
+class TargetStore:
+	"""
+	Runtime registry of monitored targets in the local state database.
+
+	Rows come from two sources: "config" rows mirror TARGETS_FILE /
+	ACTIVITY_TABLE and are refreshed at every start, "api" rows were created
+	or edited through /targets and take precedence over the configuration.
+	"""
+
+	def __init__(self, database_url: Optional[str] = None) -> None:
+		self.database_url = database_url or settings.state_database_url
+
+	@property
+	def engine(self) -> AsyncEngine:
+		return get_engine(self.database_url)
+
+	async def create_schema(self) -> None:
+		async with self.engine.begin() as conn:
+			for statement in _SCHEMA:
+				await conn.execute(text(statement))
+			columns = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_columns("monitored_targets"))
+			existing = {column["name"] for column in columns}
+			for name, definition in _ADDED_COLUMNS.items():
+				if name not in existing:
+					await conn.execute(text(f"ALTER TABLE monitored_targets ADD COLUMN {name} {definition}"))
+			await conn.execute(
+				text("INSERT INTO monitored_targets_revision (id, revision) VALUES (1, 0) ON CONFLICT (id) DO NOTHING")
+			)
+
+	async def _bump(self, conn: AsyncConnection) -> None:
+		await conn.execute(text("UPDATE monitored_targets_revision SET revision = revision + 1 WHERE id = 1"))
+
+	async def revision(self) -> int:
+		async with self.engine.connect() as conn:
+			return (await conn.execute(text("SELECT revision FROM monitored_targets_revision WHERE id = 1"))).scalar_one()
+
+	async def sync_config(self, targets: Iterable[Target]) -> None:
+		"""Mirror the configured targets, leaving rows edited through the API alone."""
+		targets = list(targets)
+		names = {t.name for t in targets}
+		existing = {t.name: (t, source) for t, source in await self.load()}
+		changed = [
+			t for t in targets
+			if t.name not in existing or (existing[t.name][1] == "config" and existing[t.name][0] != t)
+		]
+		stale = [name for name, (_, source) in existing.items() if source == "config" and name not in names]
+		if not changed and not stale:
+			return
+		async with self.engine.begin() as conn:
+			for target in changed:
+				await conn.execute(text(_UPSERT), _row_params(target, "config"))
+			for name in stale:
+				await conn.execute(text("DELETE FROM monitored_targets WHERE name = :name"), {"name": name})
+			await self._bump(conn)
+		if stale:
+			logger.info(f"Removed {len(stale)} target(s) no longer in the configuration: {', '.join(sorted(stale))}")
+
+	async def load(self) -> list[tuple[Target, str]]:
+		async with self.engine.connect() as conn:
+			rows = (await conn.execute(text("SELECT * FROM monitored_targets ORDER BY name"))).all()
+		loaded = []
+		for row in rows:
+			target = _row_to_target(row)
+			try:
+				validate_identifiers(target)
+			except RuntimeError as e:
+				# Rows stored before names were validated must never reach the probe SQL
+				logger.error(f"Skipping stored target: {e}")
+				continue
+			loaded.append((target, row.source))
+		return loaded
+
+	async def get(self, name: str) -> Optional[Target]:
+		"""Read one target straight from the table, so every worker sees the latest edit."""
+		async with self.engine.connect() as conn:
+			row = (
+				await conn.execute(text("SELECT * FROM monitored_targets WHERE name = :name"), {"name": name})
+			).one_or_none()
+		if row is None:
+			return None
+		target = _row_to_target(row)
+		try:
+			validate_identifiers(target)
+		except RuntimeError as e:
+			logger.error(f"Skipping stored target: {e}")
+			return None
+		return target
+
+	async def create(self, target: Target) -> bool:
+		"""Insert a new API target; False when the name is already taken, decided by the insert itself."""
+		async with self.engine.begin() as conn:
+			result = await conn.execute(
+				text(_INSERT + " ON CONFLICT (name) DO NOTHING"), _row_params(target, "api")
+			)
+			if result.rowcount == 0:
+				return False
+			await self._bump(conn)
+			return True
+
+	async def put(self, target: Target) -> None:
+		async with self.engine.begin() as conn:
+			await conn.execute(text(_UPSERT), _row_params(target, "api"))
+			await self._bump(conn)
+
+	async def delete(self, name: str) -> bool:
+		async with self.engine.begin() as conn:
+			result = await conn.execute(text("DELETE FROM monitored_targets WHERE name = :name"), {"name": name})
+			await self._bump(conn)
+			return result.rowcount > 0
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy.engine import make_url
+
+from .config import settings
+from .timestamps import resolve_timezone
+
+# Names are interpolated into probe SQL, so only plain identifiers (optionally schema.table) are accepted
+_COLUMN_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_TABLE_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?")
+
+
+@dataclass(frozen=True, slots=True)
+class Target:
+	"""A table/timestamp column pair watched for inactivity."""
+
+	name: str
+	table: str
+	timestamp_column: str
+	database_url: str
+	inactivity_threshold_minutes: int
+	alert_cooldown_minutes: int
+	# Critical targets bypass the digest window and notify immediately
+	critical: bool = False
+	# Zone of naive timestamp values, and an optional fixed format (see app.timestamps)
+	source_timezone: str = "UTC"
+	timestamp_format: Optional[str] = None
+	# Grouped targets alert per value of this column (e.g. tenant_id) instead of for the table as a whole
+	key_column: Optional[str] = None
+
+	def inactivity_timedelta(self) -> timedelta:
+		return timedelta(minutes=self.inactivity_threshold_minutes)
+
+	def alert_cooldown_timedelta(self) -> timedelta:
+		return timedelta(minutes=self.alert_cooldown_minutes)
+
+
+def validate_identifiers(target: Target) -> Target:
+	"""Reject table and column names that are not plain SQL identifiers."""
+	if not _TABLE_NAME.fullmatch(target.table):
+		raise RuntimeError(f"Target {target.name!r}: table {target.table!r} must be a plain identifier (letters, digits, _; optional schema.)")
+	for field, value in (("timestamp_column", target.timestamp_column), ("key_column", target.key_column)):
+		if value is not None and not _COLUMN_NAME.fullmatch(value):
+			raise RuntimeError(f"Target {target.name!r}: {field} {value!r} must be a plain identifier (letters, digits, _)")
+	return target
+
+
+def default_target() -> Target:
+	"""The single target described by ACTIVITY_TABLE / ACTIVITY_TIMESTAMP_COLUMN."""
+	if not settings.activity_table:
+		raise RuntimeError("Missing required environment variable: ACTIVITY_TABLE (or set TARGETS_FILE)")
+	return validate_identifiers(Target(
+		name=settings.activity_table,
+		table=settings.activity_table,
+		timestamp_column=settings.activity_timestamp_column,
+		database_url=settings.database_url,
+		inactivity_threshold_minutes=settings.inactivity_threshold_minutes,
+		alert_cooldown_minutes=settings.alert_cooldown_minutes,
+		source_timezone=settings.source_timezone,
+		timestamp_format=settings.timestamp_format or None,
+		key_column=settings.activity_key_column or None,
+	))
+
+
+def target_from_dict(data: dict) -> Target:
+	"""Build a target from a TARGETS_FILE entry, filling gaps from Settings."""
+	if not data.get("table"):
+		raise RuntimeError(f"Target entry is missing 'table': {data}")
+	source_timezone = data.get("source_timezone") or settings.source_timezone
+	resolve_timezone(source_timezone)
+	return validate_identifiers(Target(
+		name=data.get("name") or data["table"],
+		table=data["table"],
+		timestamp_column=data.get("timestamp_column") or settings.activity_timestamp_column,
+		database_url=data.get("database_url") or settings.database_url,
+		inactivity_threshold_minutes=int(data.get("inactivity_threshold_minutes", settings.inactivity_threshold_minutes)),
+		alert_cooldown_minutes=int(data.get("alert_cooldown_minutes", settings.alert_cooldown_minutes)),
+		critical=bool(data.get("critical", False)),
+		source_timezone=source_timezone,
+		timestamp_format=data.get("timestamp_format") or settings.timestamp_format or None,
+		key_column=data.get("key_column") or None,
+	))
+
+
+def load_targets() -> list[Target]:
+	"""
+	Return every configured target.
+
+	TARGETS_FILE points at a JSON list of objects with at least a "table" key;
+	relative paths are resolved from the project root. Without it the monitor
+	watches the single ACTIVITY_TABLE target.
+	"""
+	if not settings.targets_file:
+		return [default_target()]
+
+	path = Path(settings.targets_file)
+	if not path.is_absolute():
+		path = Path(__file__).resolve().parents[1] / path
+	entries = json.loads(path.read_text(encoding="utf-8"))
+	if not isinstance(entries, list) or not entries:
+		raise RuntimeError(f"TARGETS_FILE {path} must contain a non-empty JSON list")
+
+	targets = [target_from_dict(entry) for entry in entries]
+	names = [t.name for t in targets]
+	duplicates = sorted({n for n in names if names.count(n) > 1})
+	if duplicates:
+		raise RuntimeError(f"Duplicate target names in {path}: {', '.join(duplicates)}")
+	return targets
+
+
+def target_to_dict(target: Target) -> dict:
+	"""JSON view of a target for the API, with any database password masked."""
+	data = asdict(target)
+	data["database_url"] = make_url(target.database_url).render_as_string(hide_password=True)
+	return data
@@ -1,32 +1,163 @@
 from __future__ import annotations
 
 import aiohttp
+import asyncio
 import json
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Optional
 
 from .config import settings
+from .tracing import span
+
+# Statuses worth retrying: throttling and transient server-side failures
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+MAX_BACKOFF_SECONDS = 60.0
+
+logger = logging.getLogger(__name__)
+
+
+class PartialDeliveryError(Exception):
+    """Raised when a card reached some webhooks but not all; `failed_urls` lists the ones to retry."""
+
+    def __init__(self, message: str, failed_urls: list[str]) -> None:
+        super().__init__(message)
+        self.failed_urls = failed_urls
+
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+async def start_http_session() -> aiohttp.ClientSession:
+    """
+    Create the application-wide HTTP session (called from FastAPI startup)
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=max(settings.teams_max_concurrency * 2, 10),
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=settings.teams_timeout_seconds),
+        )
+    return _session
+
+
+async def close_http_session() -> None:
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+@asynccontextmanager
+async def _session_scope() -> AsyncIterator[aiohttp.ClientSession]:
+    # Reuse the application session; one-off scripts get a throwaway one
+    if _session is not None and not _session.closed:
+        yield _session
+        return
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=settings.teams_timeout_seconds)) as session:
+        yield session
+
+
+def configured_webhook_urls() -> list[str]:
+    urls = [settings.teams_webhook_url] if settings.teams_webhook_url else []
+    return list(dict.fromkeys(urls + settings.teams_webhook_urls))
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(retry_at.tzinfo)).total_seconds(), 0.0)
+
+
+def _backoff_seconds(attempt: int) -> float:
+    delay = settings.teams_backoff_seconds * (2 ** attempt)
+    return min(delay + random.uniform(0, delay / 2), MAX_BACKOFF_SECONDS)
+
+
+async def _post_with_retry(session: aiohttp.ClientSession, webhook_url: str, payload: dict) -> None:
+    last_error: Optional[str] = None
+    for attempt in range(settings.teams_max_retries + 1):
+        delay: Optional[float] = None
+        with span("teams_post", attempt=attempt + 1) as trace:
+            try:
+                async with session.post(
+                    webhook_url,
+                    json=payload,
+                    headers={"Content-Type": "application/json"}
+                ) as response:
+                    trace.set(status=response.status)
+                    if response.status == 200:
+                        return
+                    error_text = await response.text()
+                    last_error = f"Teams webhook failed with status {response.status}: {error_text}"
+                    if response.status not in RETRYABLE_STATUSES:
+                        raise Exception(last_error)
+                    delay = _retry_after_seconds(response.headers.get("Retry-After"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = f"network error: {e!r}"
+                trace.set(error=last_error)
+
+        if attempt < settings.teams_max_retries:
+            delay = _backoff_seconds(attempt) if delay is None else min(delay, MAX_BACKOFF_SECONDS)
+            logger.warning(
+                f"⚠️ Teams webhook attempt {attempt + 1} failed ({last_error}); retrying in {delay:.1f}s",
+                extra={"stage": "retry", "channel": "teams", "attempt": attempt + 1, "retry_in_seconds": round(delay, 1)},
+            )
+            await asyncio.sleep(delay)
+
+    raise Exception(f"{last_error} (after {settings.teams_max_retries + 1} attempts)")
 
 
 async def send_teams_notification(
     title: str, 
     message: str, 
-    webhook_url: Optional[str] = None
+    webhook_url: Optional[str] = None,
+    threshold_minutes: Optional[int] = None,
+    facts: Optional[list[dict]] = None,
+    sections: Optional[list[dict]] = None,
+    theme_color: str = "0076D7",
+    webhook_urls: Optional[list[str]] = None
 ) -> None:
     """
     Send a notification to Microsoft Teams via webhook
+
+    Without an explicit webhook_url (or a `webhook_urls` subset) the card is
+    posted to every configured webhook (TEAMS_WEBHOOK_URL plus
+    TEAMS_WEBHOOK_URLS) concurrently. When only some of them fail this raises
+    PartialDeliveryError naming them, so a retry can skip the channels that
+    already have the card. `facts` replaces the default status/time/threshold
+    facts and `sections` are appended below them.
     """
     # Use webhook URL from config or parameter
-    webhook_url = webhook_url or settings.teams_webhook_url
+    webhook_urls = [webhook_url] if webhook_url else (webhook_urls or configured_webhook_urls())
+    threshold_minutes = threshold_minutes or settings.inactivity_threshold_minutes
     
-    if not webhook_url:
+    if not webhook_urls:
         raise ValueError("Teams webhook URL not configured. Please set TEAMS_WEBHOOK_URL in your .env file")
     
     # Create Teams message card
     teams_message = {
         "@type": "MessageCard",
         "@context": "http://schema.org/extensions",
-        "themeColor": "0076D7",
+        "themeColor": theme_color,
         "summary": title,
         "sections": [
             {
@@ -34,7 +165,7 @@ async def send_teams_notification(
                 "activitySubtitle": f"Database Activity Monitor - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
                 "activityImage": "https://img.icons8.com/color/96/000000/database.png",
                 "text": message,
-                "facts": [
+                "facts": facts or [
                     {
                         "name": "Status",
                         "value": "⚠️ Database Inactivity Alert"
@@ -45,10 +176,11 @@ async def send_teams_notification(
                     },
                     {
                         "name": "Threshold",
-                        "value": f"{settings.inactivity_threshold_minutes} minutes"
+                        "value": f"{threshold_minutes} minutes"
                     }
                 ]
-            }
+            },
+            *(sections or [])
         ],
         "potentialAction": [
             {
@@ -64,28 +196,36 @@ async def send_teams_notification(
         ]
     }
     
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                webhook_url,
-                json=teams_message,
-                headers={"Content-Type": "application/json"}
-            ) as response:
-                if response.status == 200:
-                    print(f"✅ Teams notification sent successfully")
-                else:
-                    error_text = await response.text()
-                    raise Exception(f"Teams webhook failed with status {response.status}: {error_text}")
-                    
-    except aiohttp.ClientError as e:
-        error_msg = f"❌ Teams notification failed (network error): {e}"
-        print(error_msg)
-        raise Exception(error_msg)
-        
-    except Exception as e:
-        error_msg = f"❌ Teams notification failed: {e}"
-        print(error_msg)
-        raise Exception(error_msg)
+    semaphore = asyncio.Semaphore(settings.teams_max_concurrency)
+
+    async def post(session: aiohttp.ClientSession, url: str) -> Optional[str]:
+        async with semaphore:
+            try:
+                await _post_with_retry(session, url, teams_message)
+                return None
+            except Exception as e:
+                return str(e)
+
+    started = time.perf_counter()
+    with span("send_teams_notification", webhooks=len(webhook_urls)):
+        async with _session_scope() as session:
+            errors = await asyncio.gather(*(post(session, url) for url in webhook_urls))
+    fields = {"stage": "send", "channel": "teams", "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    failed = [(url, e) for url, e in zip(webhook_urls, errors) if e is not None]
+    for _, error in failed:
+        logger.error(f"❌ Teams notification failed: {error}", extra=fields)
+    if len(failed) == len(webhook_urls):
+        raise Exception(f"❌ Teams notification failed for all {len(webhook_urls)} webhook(s): {failed[-1][1]}")
+    if failed:
+        raise PartialDeliveryError(
+            f"Teams notification failed for {len(failed)}/{len(webhook_urls)} webhook(s): {failed[-1][1]}",
+            [url for url, _ in failed],
+        )
+    logger.info(
+        f"✅ Teams notification sent successfully to {len(webhook_urls) - len(failed)}/{len(webhook_urls)} webhook(s)",
+        extra=fields,
+    )
 
 
 async def send_teams_activity_resumed_notification() -> None:
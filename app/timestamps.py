@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import logging
+from datetime import date, datetime, timezone, tzinfo
+from typing import Any, Callable, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from dateutil import parser as date_parser
+
+logger = logging.getLogger(__name__)
+
+# Tried in order when a string value is not ISO 8601
+STRPTIME_FORMATS = (
+	"%Y-%m-%d %H:%M:%S.%f",
+	"%Y/%m/%d %H:%M:%S",
+	"%d/%m/%Y %H:%M:%S",
+	"%m/%d/%Y %H:%M:%S",
+	"%d.%m.%Y %H:%M:%S",
+	"%d-%b-%Y %H:%M:%S",
+	"%Y%m%d%H%M%S",
+)
+
+# Formats a value can match both ways round (03/04/2024); the convention stays undecided until a value
+# only one of them parses, e.g. 13/04/2024 or 04/13/2024
+AMBIGUOUS_FORMATS = {
+	"%d/%m/%Y %H:%M:%S": "%m/%d/%Y %H:%M:%S",
+}
+
+# Explicit TIMESTAMP_FORMAT values besides strptime patterns
+EPOCH_FORMATS = {"epoch_s": 1, "epoch_ms": 1_000, "epoch_us": 1_000_000, "epoch_ns": 1_000_000_000}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def resolve_timezone(name: Optional[str]) -> tzinfo:
+	"""tzinfo for an IANA name such as "Europe/Berlin"; empty or "UTC" means UTC."""
+	if not name or name.upper() == "UTC":
+		return timezone.utc
+	try:
+		return ZoneInfo(name)
+	except (ZoneInfoNotFoundError, ValueError) as e:
+		raise RuntimeError(f"Unknown time zone {name!r}") from e
+
+
+def _epoch_divisor(value: float) -> int:
+	"""Guess the unit of an epoch number from its magnitude (seconds until the year 5138)."""
+	magnitude = abs(value)
+	if magnitude < 1e11:
+		return 1
+	if magnitude < 1e14:
+		return 1_000
+	if magnitude < 1e17:
+		return 1_000_000
+	return 1_000_000_000
+
+
+class TimestampDecoder:
+	"""
+	Turns the raw values one target's timestamp column returns into aware UTC
+	datetimes.
+
+	The representation (native datetime, epoch number, or a string format) is
+	detected from the first value and the matching parser is cached, so later
+	values skip detection. If a value stops matching, detection runs again.
+	Naive values are interpreted in the target's source time zone.
+
+	Slash dates that read both day-first and month-first leave the convention
+	undecided: they are decoded day-first, with a warning, until a value that
+	only one convention accepts settles it.
+	"""
+
+	def __init__(self, source_timezone: Optional[str] = None, timestamp_format: Optional[str] = None) -> None:
+		self.tz = resolve_timezone(source_timezone)
+		self.timestamp_format = timestamp_format or None
+		self.kind: Optional[str] = None
+		self._parse: Optional[Callable[[Any], datetime]] = None
+		self._divisor = 1
+		self._strptime_format: Optional[str] = None
+		# The other reading of an ambiguous strptime format, until a value settles it
+		self._undecided: Optional[str] = None
+		# Date/time separator of ISO strings ("T" or " "), or None for date-only values
+		self._iso_sep: Optional[str] = " "
+
+	def decode(self, value: Any) -> datetime:
+		if self._parse is None:
+			self._detect(value)
+		if self._undecided is not None and isinstance(value, str):
+			self._settle(value.strip())
+		try:
+			return self._parse(value)
+		except (AttributeError, TypeError, ValueError, OverflowError):
+			if self.timestamp_format:
+				raise
+			# The column's representation changed (or the first value was misleading); detect again
+			self._detect(value)
+			return self._parse(value)
+
+	def encode(self, dt: datetime) -> Any:
+		"""Convert an aware datetime into the column's representation, e.g. for a bind parameter."""
+		if self._parse is None:
+			raise RuntimeError("Cannot encode before the first value has been decoded")
+		local = dt.astimezone(self.tz).replace(tzinfo=None)
+		if self.kind == "epoch":
+			return int((dt - _EPOCH).total_seconds() * self._divisor)
+		if self.kind == "strptime":
+			return local.strftime(self._strptime_format)
+		if self.kind in ("iso", "fallback"):
+			# Same shape as the stored strings, so comparisons on a text column order correctly
+			return local.date().isoformat() if self._iso_sep is None else local.isoformat(sep=self._iso_sep)
+		# Native columns: hand the driver a naive value in the source zone, as stored
+		return local
+
+	def _localize(self, dt: datetime) -> datetime:
+		if dt.tzinfo is None:
+			dt = dt.replace(tzinfo=self.tz)
+		return dt.astimezone(timezone.utc)
+
+	def _detect(self, value: Any) -> None:
+		self._undecided = None
+		if self.timestamp_format and not isinstance(value, (datetime, date)):
+			self._use_format(self.timestamp_format)
+		elif isinstance(value, datetime):
+			self.kind, self._parse = "native", self._localize
+		elif isinstance(value, date):
+			self.kind, self._parse = "date", lambda v: self._localize(datetime(v.year, v.month, v.day))
+		elif isinstance(value, (int, float)) and not isinstance(value, bool):
+			self._use_epoch(_epoch_divisor(value))
+		elif isinstance(value, str):
+			self._detect_string(value.strip())
+		else:
+			raise ValueError(f"Unsupported timestamp value {value!r} of type {type(value).__name__}")
+		logger.debug(f"Timestamp format detected: {self.describe()}")
+
+	def _detect_string(self, value: str) -> None:
+		try:
+			datetime.fromisoformat(value)
+			self.kind, self._parse = "iso", lambda v: self._localize(datetime.fromisoformat(v.strip()))
+			self._iso_sep = None if len(value) == 10 else "T" if value[10:11] == "T" else " "
+			return
+		except ValueError:
+			pass
+		# Before the epoch check, so compact "%Y%m%d%H%M%S" strings are not taken for epoch numbers
+		for fmt in STRPTIME_FORMATS:
+			# strptime accepts short digit runs, so only a 14-digit string is a compact timestamp
+			if fmt == "%Y%m%d%H%M%S" and len(value) != 14:
+				continue
+			try:
+				datetime.strptime(value, fmt)
+			except ValueError:
+				continue
+			self._use_format(fmt)
+			alternative = AMBIGUOUS_FORMATS.get(fmt)
+			if alternative is not None and self._parses(value, alternative):
+				self._undecided = alternative
+				logger.warning(
+					f"Timestamp {value!r} reads both as {fmt} and as {alternative}; decoding it as {fmt} until a "
+					f"value settles the convention. Set TIMESTAMP_FORMAT for this target to be sure"
+				)
+			return
+		try:
+			self._use_epoch(_epoch_divisor(float(value)))
+			return
+		except ValueError:
+			pass
+		# Last resort: the general-purpose (slow) parser; set TIMESTAMP_FORMAT to avoid it
+		date_parser.parse(value)
+		logger.warning(f"Timestamp {value!r} matches no known format; falling back to dateutil for this target")
+		self.kind, self._parse = "fallback", lambda v: self._localize(date_parser.parse(v))
+		self._iso_sep = " "
+
+	@staticmethod
+	def _parses(value: str, fmt: str) -> bool:
+		try:
+			datetime.strptime(value, fmt)
+		except ValueError:
+			return False
+		return True
+
+	def _settle(self, value: str) -> None:
+		"""Pick the day-first or month-first reading once `value` only parses one way."""
+		current, alternative = self._strptime_format, self._undecided
+		if not self._parses(value, alternative):
+			if self._parses(value, current):
+				self._undecided = None
+				logger.info(f"Timestamp {value!r} settles the format as {current}")
+			return
+		if self._parses(value, current):
+			return
+		self._use_format(alternative)
+		self._undecided = None
+		logger.warning(
+			f"Timestamp {value!r} only reads as {alternative}; switching from {current}. Values decoded while the "
+			f"convention was undecided were read the wrong way round"
+		)
+
+	def _use_epoch(self, divisor: int) -> None:
+		self.kind, self._divisor = "epoch", divisor
+		self._parse = lambda v: datetime.fromtimestamp(float(v) / divisor, tz=timezone.utc)
+
+	def _use_format(self, fmt: str) -> None:
+		if fmt in EPOCH_FORMATS:
+			self._use_epoch(EPOCH_FORMATS[fmt])
+			return
+		self.kind, self._strptime_format = "strptime", fmt
+		self._parse = lambda v: self._localize(datetime.strptime(v.strip(), fmt))
+
+	def describe(self) -> str:
+		if self.kind == "epoch":
+			unit = {v: k for k, v in EPOCH_FORMATS.items()}[self._divisor]
+			return unit
+		if self.kind == "strptime":
+			return f"{self._strptime_format} (undecided)" if self._undecided else self._strptime_format
+		return self.kind or "undetected"
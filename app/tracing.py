@@ -0,0 +1,187 @@
+"""
+Lightweight span tracing for checks and alert deliveries.
+
+`with span("name", key=value) as s:` times a block and nests under the
+span currently open in this task (or thread, for work handed to an
+executor with a copied context). When the outermost span of a trace ends,
+every span of the trace is written to a rotating JSONL file by a
+background thread, and the whole tree is kept in memory if it took longer
+than TRACE_SLOW_CHECK_MS. With TRACE_ENABLED=false `span()` returns a
+shared no-op object and records nothing.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import time
+from collections import deque
+from contextvars import ContextVar
+from logging.handlers import QueueListener, RotatingFileHandler
+from typing import Optional
+
+from .config import settings
+from .metrics import TRACE_SPANS_DROPPED
+
+_current: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+_tracer: Optional["Tracer"] = None
+
+
+class Span:
+	"""One timed block; children are spans opened inside it."""
+
+	__slots__ = (
+		"name", "trace_id", "span_id", "parent", "attrs", "children", "started_at", "duration_ms", "error", "_start", "_token"
+	)
+
+	def __init__(self, name: str, parent: Optional[Span], attrs: dict) -> None:
+		self.name = name
+		self.parent = parent
+		self.trace_id = parent.trace_id if parent is not None else os.urandom(8).hex()
+		self.span_id = os.urandom(4).hex()
+		self.attrs = attrs
+		self.children: list[Span] = []
+		self.started_at = time.time()
+		self.duration_ms: Optional[float] = None
+		self.error: Optional[str] = None
+		self._start = time.perf_counter()
+		self._token = None
+
+	def set(self, **attrs) -> None:
+		self.attrs.update(attrs)
+
+	def __enter__(self) -> Span:
+		if self.parent is not None:
+			self.parent.children.append(self)
+		self._token = _current.set(self)
+		return self
+
+	def __exit__(self, exc_type, exc, tb) -> bool:
+		self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+		if exc_type is not None:
+			self.error = f"{exc_type.__name__}: {exc}" if str(exc) else exc_type.__name__
+		_current.reset(self._token)
+		if self.parent is None and _tracer is not None:
+			_tracer.finish(self)
+		return False
+
+	def record(self) -> dict:
+		return {
+			"trace_id": self.trace_id,
+			"span_id": self.span_id,
+			"parent_id": self.parent.span_id if self.parent is not None else None,
+			"name": self.name,
+			"start": self.started_at,
+			# None when the span was still open as the trace ended (e.g. an abandoned probe)
+			"duration_ms": self.duration_ms,
+			"error": self.error,
+			"attrs": self.attrs,
+		}
+
+	def tree(self) -> dict:
+		node = self.record()
+		del node["trace_id"], node["parent_id"]
+		node["children"] = [child.tree() for child in list(self.children)]
+		return node
+
+	def walk(self):
+		yield self
+		for child in list(self.children):
+			yield from child.walk()
+
+
+class _NoopSpan:
+	"""Stands in for Span while tracing is off."""
+
+	__slots__ = ()
+
+	def set(self, **attrs) -> None:
+		pass
+
+	def __enter__(self) -> _NoopSpan:
+		return self
+
+	def __exit__(self, exc_type, exc, tb) -> bool:
+		return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **attrs):
+	"""Time a block as a child of the current span, or as a new trace."""
+	if _tracer is None:
+		return _NOOP
+	return Span(name, _current.get(), attrs)
+
+
+class _SpanFormatter(logging.Formatter):
+	def format(self, record: logging.LogRecord) -> str:
+		return json.dumps(record.msg, default=str, ensure_ascii=False)
+
+
+class Tracer:
+	"""Exports finished traces and keeps the slow ones for /debug/slow-checks."""
+
+	def __init__(self, path: str, max_bytes: int, backups: int, slow_ms: float, slow_buffer_size: int) -> None:
+		self.slow_ms = slow_ms
+		self.slow: deque[dict] = deque(maxlen=slow_buffer_size)
+		self._queue: Optional[queue.Queue] = None
+		self._listener: Optional[QueueListener] = None
+		if path:
+			handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+			handler.setFormatter(_SpanFormatter())
+			# Serialising and writing happen on the listener thread, never on the event loop
+			self._queue = queue.Queue(maxsize=settings.log_queue_size)
+			self._listener = QueueListener(self._queue, handler)
+			self._listener.start()
+
+	def finish(self, root: Span) -> None:
+		if root.duration_ms >= self.slow_ms:
+			self.slow.append({"trace_id": root.trace_id, **root.tree()})
+		if self._queue is None:
+			return
+		for node in root.walk():
+			try:
+				self._queue.put_nowait(logging.makeLogRecord({"msg": node.record()}))
+			except queue.Full:
+				TRACE_SPANS_DROPPED.inc()
+
+	def slow_traces(self) -> list[dict]:
+		"""Slow traces, newest first."""
+		return list(reversed(self.slow))
+
+	def stop(self) -> None:
+		if self._listener is not None:
+			self._listener.stop()
+			self._listener = None
+
+
+def configure_tracing() -> Optional[Tracer]:
+	"""Start the tracer when TRACE_ENABLED is set; safe to call more than once."""
+	global _tracer
+	if _tracer is None and settings.trace_enabled:
+		_tracer = Tracer(
+			settings.trace_file,
+			settings.trace_file_max_bytes,
+			settings.trace_file_backups,
+			settings.trace_slow_check_ms,
+			settings.trace_slow_buffer_size,
+		)
+		atexit.register(stop_tracing)
+	return _tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+	return _tracer
+
+
+def stop_tracing() -> None:
+	"""Flush exported spans and stop the writer thread."""
+	global _tracer
+	if _tracer is not None:
+		_tracer.stop()
+		_tracer = None
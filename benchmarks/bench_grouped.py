@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark grouped (per-key) checks on a SQLite table with many keys
+
+Measures the first check of a grouped target, which discovers every key
+active in the lookback window, a steady-state check that reads only the
+rows since the high-water mark, and the size of the per-key state.
+
+    python benchmarks/bench_grouped.py --keys 100000 --rows 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from common import summarise, write_results
+
+from app.db import dispose_engines
+from app.monitor import ActivityMonitor
+from app.targets import Target
+
+TABLE = "events_keyed"
+
+
+def build_keyed_table(path: str, rows: int, keys: int) -> None:
+	"""
+	`rows` rows evenly spaced over the last 23 hours (inside the default
+	GROUPED_LOOKBACK_MINUTES), spread round-robin over `keys` keys and
+	indexed on updated_at.
+	"""
+	conn = sqlite3.connect(path)
+	conn.execute("PRAGMA journal_mode = OFF")
+	conn.execute("PRAGMA synchronous = OFF")
+	conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+	conn.execute(f"CREATE TABLE {TABLE} (id INTEGER PRIMARY KEY, tenant_id TEXT, updated_at TIMESTAMP)")
+	conn.execute(
+		f"""
+		WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+		INSERT INTO {TABLE} (tenant_id, updated_at)
+		SELECT 'tenant-' || (n % ?), datetime('now', '-' || ((? - n) * 82800.0 / ?) || ' seconds') FROM seq
+		""",
+		(rows, keys, rows, rows),
+	)
+	conn.execute(f"CREATE INDEX ix_{TABLE}_updated_at ON {TABLE} (updated_at)")
+	conn.commit()
+	conn.close()
+
+
+def insert_recent(path: str, count: int, keys: int) -> None:
+	conn = sqlite3.connect(path)
+	conn.executemany(
+		f"INSERT INTO {TABLE} (tenant_id, updated_at) VALUES (?, datetime('now'))",
+		((f"tenant-{n % keys}",) for n in range(count)),
+	)
+	conn.commit()
+	conn.close()
+
+
+async def run(rows: int, keys: int, repeat: int, new_rows: int, path: str) -> dict:
+	build_keyed_table(path, rows, keys)
+	target = Target(TABLE, TABLE, "updated_at", f"sqlite+aiosqlite:///{path}", 60, 60, key_column="tenant_id")
+	monitor = ActivityMonitor([target])
+	# Measure detection, not delivery
+	monitor.sends_alerts = False
+
+	started = time.perf_counter()
+	first = (await monitor.check_and_alert())["targets"][TABLE]
+	discovery_ms = (time.perf_counter() - started) * 1000
+
+	samples = []
+	for _ in range(repeat):
+		insert_recent(path, new_rows, keys)
+		started = time.perf_counter()
+		await monitor.check_and_alert()
+		samples.append((time.perf_counter() - started) * 1000)
+
+	state = monitor._keys[TABLE]
+	state_bytes = sum(
+		sys.getsizeof(part) for part in (state.index, state.keys, state.last_seen, state.last_alert, state.alerting)
+	) + sum(sys.getsizeof(key) for key in state.keys)
+	await monitor.aclose()
+	await dispose_engines()
+	return {
+		"rows": rows,
+		"keys": first["keys"],
+		"discovery_ms": round(discovery_ms, 3),
+		"steady_state": summarise(samples),
+		"new_rows_per_check": new_rows,
+		"state_bytes": state_bytes,
+	}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument("--rows", type=int, default=1_000_000)
+	parser.add_argument("--keys", type=int, default=100_000)
+	parser.add_argument("--new-rows", type=int, default=1000, help="Rows inserted before each steady-state check")
+	parser.add_argument("--repeat", type=int, default=10)
+	parser.add_argument("--db", help="SQLite file to (re)build; defaults to a temporary file")
+	parser.add_argument("--output", help="Write results as JSON to this path")
+	args = parser.parse_args()
+
+	path = args.db or os.path.join(tempfile.mkdtemp(prefix="grouped-bench-"), "bench.db")
+	results = asyncio.run(run(args.rows, args.keys, args.repeat, args.new_rows, path))
+
+	print(f"{results['keys']} keys over {results['rows']} rows")
+	print(f"first check (key discovery)   {results['discovery_ms']:>10.2f} ms")
+	print(
+		f"steady-state check            {results['steady_state']['p50_ms']:>10.2f} ms p50, "
+		f"{results['steady_state']['p95_ms']:.2f} ms p95 ({results['new_rows_per_check']} new rows each)"
+	)
+	print(f"per-key state                 {results['state_bytes'] / 1024 / 1024:>10.2f} MB")
+	if args.output:
+		params = {"rows": args.rows, "keys": args.keys, "new_rows": args.new_rows, "repeat": args.repeat}
+		write_results(args.output, "grouped", params, results)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Load-test the HTTP endpoints and measure notifier throughput
+
+Runs the FastAPI app in-process under uvicorn against a synthetic SQLite
+database, hammers /health, /health?deep=1 and /check-now at several
+concurrency levels, then measures alert delivery against local Teams and
+SMTP stand-ins: direct deliver_alert calls per channel and end to end
+through the outbox. Nothing leaves the machine.
+
+    python benchmarks/bench_http.py --requests 2000 --concurrency 1,10,50 --output results/http.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import time
+
+from common import build_table, summarise, touch_table, write_results
+from standins import SMTPStandIn, TeamsStandIn
+
+import aiohttp
+import uvicorn
+
+from app.alerts import Alert, deliver_alert
+from app.config import settings
+
+ENDPOINTS = ("/health", "/health?deep=1", "/check-now")
+
+
+def _ints(value: str) -> list[int]:
+	return [int(v) for v in value.split(",") if v]
+
+
+def _free_port() -> int:
+	with socket.socket() as sock:
+		sock.bind(("127.0.0.1", 0))
+		return sock.getsockname()[1]
+
+
+def _alert(i: int) -> Alert:
+	return Alert(
+		dedup_key=f"bench:{i}",
+		title=f"Benchmark alert {i}",
+		message="Synthetic alert from bench_http.py",
+		subject=f"Benchmark alert {i}",
+		body="Synthetic alert from bench_http.py",
+		threshold_minutes=10,
+	)
+
+
+def configure(workdir: str, targets: int, rows: int, teams: TeamsStandIn, smtp: SMTPStandIn) -> None:
+	"""Point Settings at the synthetic database and the stand-ins; must run before app.main.create_app()."""
+	path = os.path.join(workdir, "http.db")
+	for i in range(targets):
+		build_table(path, f"feed_{i}", rows, indexed=True)
+		touch_table(path, f"feed_{i}")
+	targets_file = os.path.join(workdir, "targets.json")
+	with open(targets_file, "w", encoding="utf-8") as f:
+		json.dump([{"table": f"feed_{i}", "timestamp_column": "updated_at"} for i in range(targets)], f)
+
+	settings.database_url = f"sqlite+aiosqlite:///{path}"
+	settings.targets_file = targets_file
+	settings.state_database_url = f"sqlite+aiosqlite:///{os.path.join(workdir, 'state.db')}"
+	# Keep the scheduler out of the way; the load test drives the checks
+	settings.scheduler_mode = "interval"
+	settings.check_interval_seconds = 3600
+	settings.teams_webhook_url = ""
+	settings.teams_webhook_urls = [teams.url]
+	settings.smtp_host = smtp.host
+	settings.smtp_port = smtp.port
+	settings.smtp_use_tls = False
+	settings.smtp_use_ssl = False
+	settings.smtp_allow_plaintext = True
+	settings.smtp_user = ""
+	settings.mail_sender = "monitor@example.com"
+	settings.mail_recipients = ["oncall@example.com"]
+
+
+async def load_test(base_url: str, path: str, total: int, concurrency: int) -> dict:
+	samples: list[float] = []
+	errors = 0
+	remaining = total
+
+	async def client(session: aiohttp.ClientSession) -> None:
+		nonlocal remaining, errors
+		while remaining > 0:
+			remaining -= 1
+			started = time.perf_counter()
+			try:
+				async with session.get(base_url + path) as resp:
+					await resp.read()
+					if resp.status != 200:
+						errors += 1
+			except aiohttp.ClientError:
+				errors += 1
+			samples.append((time.perf_counter() - started) * 1000)
+
+	connector = aiohttp.TCPConnector(limit=concurrency)
+	async with aiohttp.ClientSession(connector=connector) as session:
+		started = time.perf_counter()
+		await asyncio.gather(*(client(session) for _ in range(concurrency)))
+		wall = time.perf_counter() - started
+	return {"requests_per_second": round(total / wall, 1), "errors": errors, **summarise(samples)}
+
+
+async def delivery_throughput(count: int, concurrency: int) -> dict:
+	semaphore = asyncio.Semaphore(concurrency)
+	samples: list[float] = []
+
+	async def one(i: int) -> None:
+		async with semaphore:
+			started = time.perf_counter()
+			await deliver_alert(_alert(i))
+			samples.append((time.perf_counter() - started) * 1000)
+
+	started = time.perf_counter()
+	await asyncio.gather(*(one(i) for i in range(count)))
+	wall = time.perf_counter() - started
+	return {"alerts_per_second": round(count / wall, 1), **summarise(samples)}
+
+
+async def outbox_throughput(dispatcher, teams: TeamsStandIn, count: int, timeout: float = 120) -> dict:
+	before = teams.received
+	started = time.perf_counter()
+	for i in range(count):
+		await dispatcher.enqueue(_alert(1_000_000 + i))
+	enqueued = time.perf_counter() - started
+	while teams.received - before < count and time.perf_counter() - started < timeout:
+		await asyncio.sleep(0.01)
+	wall = time.perf_counter() - started
+	delivered = teams.received - before
+	return {
+		"enqueued": count,
+		"delivered": delivered,
+		"enqueue_per_second": round(count / enqueued, 1),
+		"end_to_end_per_second": round(delivered / wall, 1),
+	}
+
+
+async def run(requests: int, concurrency: list[int], alerts: int, targets: int, target_rows: int, workdir: str) -> dict:
+	teams = await TeamsStandIn().start()
+	smtp = await SMTPStandIn().start()
+	configure(workdir, targets, target_rows, teams, smtp)
+
+	from app import main as app_main
+
+	port = _free_port()
+	server = uvicorn.Server(uvicorn.Config(app_main.create_app(), host="127.0.0.1", port=port, log_level="warning"))
+	serving = asyncio.create_task(server.serve())
+	while not server.started:
+		await asyncio.sleep(0.05)
+
+	results: dict[str, dict] = {"endpoints": {}, "delivery": {}}
+	try:
+		base_url = f"http://127.0.0.1:{port}"
+		for path in ENDPOINTS:
+			for level in concurrency:
+				print(f"⏱️ GET {path} x{level}")
+				results["endpoints"][f"{path} x{level}"] = await load_test(base_url, path, requests, level)
+
+		settings.enable_teams_notifications, settings.enable_email_notifications = True, False
+		print("⏱️ deliver_alert via Teams stand-in")
+		results["delivery"]["teams"] = await delivery_throughput(alerts, settings.teams_max_concurrency)
+
+		settings.enable_teams_notifications, settings.enable_email_notifications = False, True
+		print("⏱️ deliver_alert via SMTP stand-in")
+		results["delivery"]["email"] = await delivery_throughput(alerts, 1)
+		results["delivery"]["email"]["smtp_sessions"] = smtp.sessions
+
+		settings.enable_teams_notifications, settings.enable_email_notifications = True, False
+		if app_main.dispatcher is not None:
+			print("⏱️ outbox end to end")
+			results["delivery"]["outbox"] = await outbox_throughput(app_main.dispatcher, teams, alerts)
+	finally:
+		server.should_exit = True
+		await serving
+		await teams.stop()
+		await smtp.stop()
+	return results
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+	parser.add_argument("--requests", type=int, default=1000, help="Requests per endpoint and concurrency level")
+	parser.add_argument("--concurrency", type=_ints, default=[1, 10, 50], help="Comma-separated client counts")
+	parser.add_argument("--alerts", type=int, default=200, help="Alerts per delivery measurement")
+	parser.add_argument("--http-targets", type=int, default=10, help="Tables watched by the app under test")
+	parser.add_argument("--http-target-rows", type=int, default=10_000)
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	add_arguments(parser)
+	parser.add_argument("--workdir", help="Directory for the generated databases; defaults to a temporary one")
+	parser.add_argument("--output", help="Write results as JSON to this path")
+	args = parser.parse_args()
+
+	workdir = args.workdir or tempfile.mkdtemp(prefix="http-bench-")
+	results = asyncio.run(
+		run(args.requests, args.concurrency, args.alerts, args.http_targets, args.http_target_rows, workdir)
+	)
+
+	for name, stats in results["endpoints"].items():
+		print(f"GET {name:<22} {stats['requests_per_second']:>9} req/s  p50 {stats['p50_ms']:>8.2f} ms  p95 {stats['p95_ms']:>8.2f} ms  errors {stats['errors']}")
+	for channel, stats in results["delivery"].items():
+		rate = stats.get("alerts_per_second", stats.get("end_to_end_per_second"))
+		print(f"delivery {channel:<8} {rate:>9} alerts/s")
+	if args.output:
+		params = {k: v for k, v in vars(args).items() if k != "output"}
+		write_results(args.output, "http", params, results)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark latest-timestamp probes on SQLite tables with and without an index
+
+Compares the legacy ORDER BY ... DESC LIMIT 1 query with the batched MAX()
+probe and the incremental high-water-mark probe used by ProbeEngine.
+
+    python benchmarks/bench_index_probe.py --rows 2000000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+
+from common import build_table, time_async, write_results
+
+from sqlalchemy import text
+
+from app.db import dispose_engines, get_engine
+from app.probe import ProbeEngine
+from app.targets import Target
+
+
+async def run(rows: int, repeat: int, path: str) -> dict:
+	build_table(path, "events_indexed", rows, indexed=True)
+	build_table(path, "events_plain", rows, indexed=False)
+	database_url = f"sqlite+aiosqlite:///{path}"
+	engine = get_engine(database_url)
+	results: dict[str, dict] = {}
+
+	for table in ("events_indexed", "events_plain"):
+		target = Target(table, table, "updated_at", database_url, 10, 30)
+
+		async def legacy() -> None:
+			async with engine.connect() as conn:
+				await conn.execute(text(f"SELECT updated_at FROM {table} ORDER BY updated_at DESC LIMIT 1"))
+
+		full = ProbeEngine(index_policy="ignore")
+
+		async def batched_max() -> None:
+			# Forget the high-water mark so every call reads the full MAX()
+			full._high_water.clear()
+			await full.probe([target])
+
+		incremental = ProbeEngine(index_policy="warn")
+		await incremental.probe([target])
+
+		async def incremental_probe() -> None:
+			await incremental.probe([target])
+
+		results[table] = {
+			"indexed": incremental.is_indexed(target),
+			"order_by_desc_limit_1": await time_async(legacy, repeat),
+			"batched_max": await time_async(batched_max, repeat),
+			"incremental": await time_async(incremental_probe, repeat),
+		}
+		await full.aclose()
+		await incremental.aclose()
+
+	await dispose_engines()
+	return results
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument("--rows", type=int, default=1_000_000)
+	parser.add_argument("--repeat", type=int, default=5)
+	parser.add_argument("--db", help="SQLite file to (re)build; defaults to a temporary file")
+	parser.add_argument("--output", help="Write results as JSON to this path")
+	args = parser.parse_args()
+
+	path = args.db or os.path.join(tempfile.mkdtemp(prefix="probe-bench-"), "bench.db")
+	results = asyncio.run(run(args.rows, args.repeat, path))
+
+	print(f"{'table':<16}{'indexed':>9}{'ORDER BY':>12}{'MAX()':>12}{'incremental':>14}  (p50 ms)")
+	for table, r in results.items():
+		print(
+			f"{table:<16}{str(r['indexed']):>9}{r['order_by_desc_limit_1']['p50_ms']:>12.2f}"
+			f"{r['batched_max']['p50_ms']:>12.2f}{r['incremental']['p50_ms']:>14.2f}"
+		)
+	if args.output:
+		write_results(args.output, "index_probe", {"rows": args.rows, "repeat": args.repeat}, results)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark the probe and check pipeline on synthetic SQLite tables
+
+Measures fetch_latest_timestamp on large tables with and without an index,
+then ActivityMonitor.check_and_alert as the number of targets and the number
+of concurrent checks grow. Notifications are disabled; see bench_http.py
+for notifier throughput.
+
+    python benchmarks/bench_pipeline.py --sizes 1000000,10000000 --output results/pipeline.json
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from common import build_table, summarise, time_async, touch_table, write_results
+
+from app.config import settings
+from app.db import dispose_engines, fetch_latest_timestamp
+from app.monitor import ActivityMonitor
+from app.targets import Target
+
+
+def _ints(value: str) -> list[int]:
+	return [int(v) for v in value.split(",") if v]
+
+
+async def bench_fetch_latest(workdir: str, sizes: list[int], repeat: int) -> dict:
+	results = {}
+	for rows in sizes:
+		path = os.path.join(workdir, f"fetch_{rows}.db")
+		for indexed in (True, False):
+			table = f"events_{'indexed' if indexed else 'plain'}"
+			started = time.perf_counter()
+			build_table(path, table, rows, indexed)
+			print(f"  generated {rows:,} rows in {table} ({time.perf_counter() - started:.1f}s)")
+			settings.database_url = f"sqlite+aiosqlite:///{path}"
+			settings.activity_table = table
+			settings.activity_timestamp_column = "updated_at"
+			results[f"{rows}/{table}"] = await time_async(fetch_latest_timestamp, repeat)
+	return results
+
+
+async def bench_check_and_alert(workdir: str, target_counts: list[int], concurrency: list[int], rows: int, repeat: int) -> dict:
+	path = os.path.join(workdir, "targets.db")
+	database_url = f"sqlite+aiosqlite:///{path}"
+	for i in range(max(target_counts)):
+		build_table(path, f"feed_{i}", rows, indexed=True)
+		touch_table(path, f"feed_{i}")
+
+	results: dict[str, dict] = {"by_targets": {}, "by_concurrency": {}}
+	for count in target_counts:
+		targets = [Target(f"feed_{i}", f"feed_{i}", "updated_at", database_url, 60, 30) for i in range(count)]
+		monitor = ActivityMonitor(targets)
+		await monitor.prepare()
+		results["by_targets"][str(count)] = await time_async(monitor.check_and_alert, repeat)
+		await monitor.aclose()
+
+	count = max(target_counts)
+	targets = [Target(f"feed_{i}", f"feed_{i}", "updated_at", database_url, 60, 30) for i in range(count)]
+	monitor = ActivityMonitor(targets)
+	await monitor.prepare()
+	for level in concurrency:
+		samples: list[float] = []
+
+		async def one() -> None:
+			started = time.perf_counter()
+			await monitor.check_and_alert()
+			samples.append((time.perf_counter() - started) * 1000)
+
+		wall_started = time.perf_counter()
+		for _ in range(repeat):
+			await asyncio.gather(*(one() for _ in range(level)))
+		wall = time.perf_counter() - wall_started
+		results["by_concurrency"][str(level)] = {
+			"targets": count,
+			"checks_per_second": round(level * repeat / wall, 2),
+			**summarise(samples),
+		}
+	await monitor.aclose()
+	return results
+
+
+async def run(sizes: list[int], target_counts: list[int], concurrency: list[int], target_rows: int, repeat: int, workdir: str) -> dict:
+	settings.enable_teams_notifications = False
+	settings.enable_email_notifications = False
+	print("⏱️ fetch_latest_timestamp")
+	fetch = await bench_fetch_latest(workdir, sizes, repeat)
+	print("⏱️ check_and_alert")
+	checks = await bench_check_and_alert(workdir, target_counts, concurrency, target_rows, repeat)
+	await dispose_engines()
+	return {"fetch_latest_timestamp": fetch, "check_and_alert": checks}
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+	parser.add_argument("--sizes", type=_ints, default=[1_000_000], help="Comma-separated table sizes, e.g. 1000000,100000000")
+	parser.add_argument("--targets", type=_ints, default=[1, 10, 100], help="Comma-separated target counts")
+	parser.add_argument("--concurrency", type=_ints, default=[1, 4, 16], help="Comma-separated concurrent checks")
+	parser.add_argument("--target-rows", type=int, default=10_000, help="Rows per table in the multi-target runs")
+	parser.add_argument("--repeat", type=int, default=5)
+	parser.add_argument("--workdir", help="Directory for the generated databases; defaults to a temporary one")
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	add_arguments(parser)
+	parser.add_argument("--output", help="Write results as JSON to this path")
+	args = parser.parse_args()
+
+	workdir = args.workdir or tempfile.mkdtemp(prefix="pipeline-bench-")
+	results = asyncio.run(run(args.sizes, args.targets, args.concurrency, args.target_rows, args.repeat, workdir))
+
+	for name, stats in results["fetch_latest_timestamp"].items():
+		print(f"fetch_latest_timestamp {name:<28} p50 {stats['p50_ms']:>10.2f} ms")
+	for count, stats in results["check_and_alert"]["by_targets"].items():
+		print(f"check_and_alert {count:>5} targets          p50 {stats['p50_ms']:>10.2f} ms")
+	for level, stats in results["check_and_alert"]["by_concurrency"].items():
+		print(f"check_and_alert x{level:<4} concurrent  p50 {stats['p50_ms']:>10.2f} ms  {stats['checks_per_second']:>8} checks/s")
+	if args.output:
+		params = {k: v for k, v in vars(args).items() if k != "output"}
+		write_results(args.output, "pipeline", params, results)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Benchmark adaptive scheduling with 10k and 100k targets in one process
+
+Probes are answered from memory on a virtual clock, so the numbers cover
+the monitor's own cost: per-target state, picking the due targets,
+evaluating them and finding the next wakeup. A second part runs real
+probes for many targets on one SQLite database through the probe worker
+pool, once with every batch of that database queued behind a slow
+unindexed probe.
+
+    python benchmarks/bench_scheduler.py --targets 10000,100000 --ticks 2000
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+from common import build_table, summarise, touch_table, write_results
+
+from app.config import settings
+from app.db import dispose_engines
+from app.metrics import TARGET_ALERTING, TARGET_INACTIVE_SECONDS
+from app.monitor import ActivityMonitor
+from app.probe import ProbeResult
+from app.replay import VirtualClock
+from app.targets import Target
+
+
+def _ints(value: str) -> list[int]:
+	return [int(v) for v in value.split(",") if v]
+
+
+class StaticProbe:
+	"""
+	Stands in for ProbeEngine: a target's newest row trails the clock by a
+	few seconds, except every `silent_every`-th target, which stopped
+	writing an hour before the start.
+	"""
+
+	def __init__(self, clock: VirtualClock, silent_every: int) -> None:
+		self.clock = clock
+		self.silent_before = clock.now - timedelta(hours=1)
+		self.silent_every = silent_every
+		self.probed = 0
+
+	async def probe(self, targets) -> dict[str, ProbeResult]:
+		now = self.clock.now
+		results = {}
+		for target in targets:
+			index = int(target.name[2:])
+			latest = self.silent_before if index % self.silent_every == 0 else now - timedelta(seconds=index % 30)
+			results[target.name] = ProbeResult(target, has_row=True, latest=latest)
+		self.probed += len(results)
+		return results
+
+	def forget(self, targets) -> None:
+		pass
+
+	async def aclose(self) -> None:
+		pass
+
+
+def build_targets(count: int, database_url: str = "sqlite+aiosqlite:///:memory:", table: str = "events") -> list[Target]:
+	# Thresholds from 5 to 60 minutes spread the deadlines over the hour
+	return [Target(f"t-{i}", table, "updated_at", database_url, 5 + i % 56, 30) for i in range(count)]
+
+
+def new_monitor(targets: list[Target], probe: StaticProbe) -> ActivityMonitor:
+	monitor = ActivityMonitor(targets, probe_engine=probe, clock=probe.clock)
+	# Measure scheduling and evaluation, not delivery
+	monitor.sends_alerts = False
+	return monitor
+
+
+async def measure_state(targets: list[Target], silent_every: int, per_target_metrics: bool) -> int:
+	"""Bytes allocated by a monitor over `targets` after its first full check, targets themselves excluded."""
+	settings.per_target_metrics = per_target_metrics
+	for gauge in (TARGET_INACTIVE_SECONDS, TARGET_ALERTING):
+		gauge.clear()
+	gc.collect()
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	monitor = new_monitor(targets, StaticProbe(VirtualClock(), silent_every))
+	await monitor.check_due()
+	gc.collect()
+	state_bytes = tracemalloc.get_traced_memory()[0] - before
+	tracemalloc.stop()
+	await monitor.aclose()
+	settings.per_target_metrics = True
+	return state_bytes
+
+
+async def bench_ticks(count: int, ticks: int, silent_every: int) -> dict:
+	targets = build_targets(count)
+	state_bytes = await measure_state(targets, silent_every, per_target_metrics=True)
+	state_bytes_without_metrics = await measure_state(targets, silent_every, per_target_metrics=False)
+	clock = VirtualClock()
+	start = clock.now
+	probe = StaticProbe(clock, silent_every)
+	monitor = new_monitor(targets, probe)
+	started = time.perf_counter()
+	await monitor.check_due()
+	first_ms = (time.perf_counter() - started) * 1000
+
+	tick_samples, wakeup_samples = [], []
+	probed_before = probe.probed
+	wall_started = time.perf_counter()
+	for _ in range(ticks):
+		started = time.perf_counter()
+		wakeup = monitor.next_wakeup()
+		wakeup_samples.append((time.perf_counter() - started) * 1000)
+		clock.now = wakeup
+		started = time.perf_counter()
+		await monitor.check_due()
+		tick_samples.append((time.perf_counter() - started) * 1000)
+	wall = time.perf_counter() - wall_started
+	probed = probe.probed - probed_before
+	await monitor.aclose()
+	return {
+		"targets": count,
+		"state_bytes": state_bytes,
+		"state_bytes_per_target": round(state_bytes / count, 1),
+		"state_bytes_without_target_metrics": state_bytes_without_metrics,
+		"state_bytes_per_target_without_target_metrics": round(state_bytes_without_metrics / count, 1),
+		"first_tick_ms": round(first_ms, 3),
+		"tick": summarise(tick_samples),
+		"next_wakeup": summarise(wakeup_samples),
+		"ticks": ticks,
+		"virtual_seconds": round((clock.now - start).total_seconds(), 1),
+		"targets_checked_per_tick": round(probed / ticks, 1),
+		"targets_checked_per_second": round(probed / wall, 1),
+		"ticks_per_second": round(ticks / wall, 1),
+	}
+
+
+async def bench_probe_pool(count: int, repeat: int, path: str) -> dict:
+	"""Full checks of `count` targets that all probe one SQLite table."""
+	build_table(path, "events", 0, indexed=True)
+	touch_table(path, "events")
+
+	monitor = ActivityMonitor(build_targets(count, f"sqlite+aiosqlite:///{path}"))
+	monitor.sends_alerts = False
+	# The first check also inspects the catalog for each target's timestamp index
+	started = time.perf_counter()
+	await monitor.check_and_alert()
+	first_ms = (time.perf_counter() - started) * 1000
+	samples = []
+	statuses: dict[str, int] = {}
+	for _ in range(repeat):
+		started = time.perf_counter()
+		result = await monitor.check_and_alert()
+		samples.append((time.perf_counter() - started) * 1000)
+		statuses = {}
+		for outcome in result["targets"].values():
+			statuses[outcome["status"]] = statuses.get(outcome["status"], 0) + 1
+	await monitor.aclose()
+	await dispose_engines()
+	return {"targets": count, "first_check_ms": round(first_ms, 3), "check": summarise(samples), "statuses": statuses}
+
+
+async def bench_slow_batch(count: int, repeat: int, slow_rows: int, path: str) -> dict:
+	"""
+	Full checks of `count` targets on one SQLite database whose first batch
+	also probes an unindexed table of `slow_rows` rows.
+
+	The probe timeout is set to twice that slow statement, so every later
+	batch of the database waits behind it; none of them may time out or
+	count against the circuit breaker.
+	"""
+	build_table(path, "events", 0, indexed=True)
+	touch_table(path, "events")
+	build_table(path, "slow_events", slow_rows, indexed=False)
+	touch_table(path, "slow_events")
+	conn = sqlite3.connect(path)
+	started = time.perf_counter()
+	conn.execute("SELECT MAX(updated_at) FROM slow_events").fetchone()
+	slow_ms = (time.perf_counter() - started) * 1000
+	conn.close()
+
+	settings.probe_timeout_seconds = 2 * slow_ms / 1000
+	settings.check_interval_seconds = max(settings.check_interval_seconds, 4 * slow_ms / 1000)
+	database_url = f"sqlite+aiosqlite:///{path}"
+	targets = [Target("slow", "slow_events", "updated_at", database_url, 60, 30), *build_targets(count, database_url)]
+	monitor = ActivityMonitor(targets)
+	monitor.sends_alerts = False
+	await monitor.check_and_alert()
+	samples = []
+	statuses: dict[str, int] = {}
+	for _ in range(repeat):
+		started = time.perf_counter()
+		result = await monitor.check_and_alert()
+		samples.append((time.perf_counter() - started) * 1000)
+		statuses = {}
+		for outcome in result["targets"].values():
+			statuses[outcome["status"]] = statuses.get(outcome["status"], 0) + 1
+	breaker_failures = monitor.probe_engine.connections.get(database_url).breaker.failures
+	await monitor.aclose()
+	await dispose_engines()
+	return {
+		"targets": count + 1,
+		"slow_statement_ms": round(slow_ms, 3),
+		"probe_timeout_ms": round(settings.probe_timeout_seconds * 1000, 3),
+		"check": summarise(samples),
+		"statuses": statuses,
+		"breaker_failures": breaker_failures,
+	}
+
+
+async def run(
+	counts: list[int], ticks: int, silent_every: int, probe_targets: int, repeat: int, slow_rows: int, path: str
+) -> dict:
+	results = {"ticks": {}, "probe_pool": None, "slow_batch": None}
+	for count in counts:
+		results["ticks"][str(count)] = await bench_ticks(count, ticks, silent_every)
+	if probe_targets:
+		results["probe_pool"] = await bench_probe_pool(probe_targets, repeat, path)
+		if slow_rows:
+			results["slow_batch"] = await bench_slow_batch(probe_targets, repeat, slow_rows, path)
+	return results
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument("--targets", type=_ints, default=[10_000, 100_000], help="Comma-separated target counts")
+	parser.add_argument("--ticks", type=int, default=2000, help="Scheduler ticks per target count")
+	parser.add_argument("--silent-every", type=int, default=20, help="Every n-th target is inactive")
+	parser.add_argument("--probe-targets", type=int, default=10_000, help="Targets for the SQLite probe pool run (0 to skip)")
+	parser.add_argument("--repeat", type=int, default=5)
+	parser.add_argument(
+		"--slow-rows", type=int, default=2_000_000, help="Rows of the unindexed table the slow-batch run queues behind (0 to skip)"
+	)
+	parser.add_argument("--db", help="SQLite file to (re)build; defaults to a temporary file")
+	parser.add_argument("--output", help="Write results as JSON to this path")
+	args = parser.parse_args()
+
+	path = args.db or os.path.join(tempfile.mkdtemp(prefix="scheduler-bench-"), "bench.db")
+	results = asyncio.run(run(args.targets, args.ticks, args.silent_every, args.probe_targets, args.repeat, args.slow_rows, path))
+
+	for count, result in results["ticks"].items():
+		print(
+			f"{int(count):>7} targets: state {result['state_bytes'] / 1024 / 1024:7.1f} MB "
+			f"({result['state_bytes_per_target']:.0f} B/target; "
+			f"{result['state_bytes_per_target_without_target_metrics']:.0f} B/target with PER_TARGET_METRICS=false), "
+			f"first tick {result['first_tick_ms']:.1f} ms"
+		)
+		print(
+			f"{'':>17}tick {result['tick']['p50_ms']:8.3f} ms p50 / {result['tick']['p95_ms']:.3f} ms p95, "
+			f"next wakeup {result['next_wakeup']['p50_ms']:.3f} ms p50, "
+			f"{result['ticks_per_second']:.0f} ticks/s, {result['targets_checked_per_second']:.0f} targets/s"
+		)
+	if results["probe_pool"] is not None:
+		pool = results["probe_pool"]
+		print(
+			f"SQLite, {pool['targets']} targets on one database: first check {pool['first_check_ms']:.1f} ms, "
+			f"then {pool['check']['p50_ms']:.1f} ms p50 {pool['statuses']}"
+		)
+	if results["slow_batch"] is not None:
+		slow = results["slow_batch"]
+		print(
+			f"SQLite, {slow['targets']} targets behind a {slow['slow_statement_ms']:.0f} ms unindexed probe "
+			f"(timeout {slow['probe_timeout_ms']:.0f} ms): {slow['check']['p50_ms']:.1f} ms p50 {slow['statuses']}, "
+			f"{slow['breaker_failures']} breaker failure(s)"
+		)
+	if args.output:
+		params = {
+			"targets": args.targets,
+			"ticks": args.ticks,
+			"silent_every": args.silent_every,
+			"probe_targets": args.probe_targets,
+			"repeat": args.repeat,
+			"slow_rows": args.slow_rows,
+		}
+		write_results(args.output, "scheduler", params, results)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,109 @@
+"""
+Shared helpers for the benchmark scripts: synthetic SQLite tables, timing
+and machine-readable result files
+"""
+
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+	sys.path.insert(0, str(ROOT))
+
+# Rows inserted per statement while generating; keeps memory flat for 100M-row tables
+CHUNK_ROWS = 1_000_000
+
+
+def build_table(path: str, table: str, rows: int, indexed: bool, start: str = "2024-01-01") -> None:
+	"""
+	(Re)create `table` in the SQLite file at `path` with `rows` rows, one per
+	second from `start`, optionally indexed on updated_at.
+
+	Rows are generated inside SQLite with a recursive CTE in chunks, and the
+	index is built after loading, which is far faster than maintaining it
+	during the inserts.
+	"""
+	conn = sqlite3.connect(path)
+	conn.execute("PRAGMA journal_mode = OFF")
+	conn.execute("PRAGMA synchronous = OFF")
+	conn.execute(f"DROP TABLE IF EXISTS {table}")
+	conn.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, payload TEXT, updated_at TIMESTAMP)")
+	for offset in range(0, rows, CHUNK_ROWS):
+		count = min(CHUNK_ROWS, rows - offset)
+		conn.execute(
+			f"""
+			WITH RECURSIVE seq(n) AS (SELECT ? UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+			INSERT INTO {table} (payload, updated_at)
+			SELECT 'row-' || n, datetime(?, '+' || n || ' seconds') FROM seq
+			""",
+			(offset + 1, offset + count, start),
+		)
+		conn.commit()
+	if indexed:
+		conn.execute(f"CREATE INDEX ix_{table}_updated_at ON {table} (updated_at)")
+	conn.commit()
+	conn.close()
+
+
+def touch_table(path: str, table: str) -> None:
+	"""Insert one row stamped now, so the table counts as active."""
+	conn = sqlite3.connect(path)
+	conn.execute(f"INSERT INTO {table} (payload, updated_at) VALUES ('touch', datetime('now'))")
+	conn.commit()
+	conn.close()
+
+
+def summarise(samples_ms: list[float]) -> dict:
+	ordered = sorted(samples_ms)
+	return {
+		"n": len(ordered),
+		"mean_ms": round(statistics.fmean(ordered), 3),
+		"p50_ms": round(ordered[len(ordered) // 2], 3),
+		"p95_ms": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 3),
+		"max_ms": round(ordered[-1], 3),
+	}
+
+
+async def time_async(fn: Callable[[], Awaitable[object]], repeat: int, warmup: int = 1) -> dict:
+	for _ in range(warmup):
+		await fn()
+	samples = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		await fn()
+		samples.append((time.perf_counter() - start) * 1000)
+	return summarise(samples)
+
+
+def _git_commit() -> str:
+	try:
+		return subprocess.run(
+			["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return "unknown"
+
+
+def write_results(path: str, suite: str, params: dict, results: dict) -> None:
+	"""Write one JSON document per run; compare files across commits to spot regressions."""
+	document = {
+		"suite": suite,
+		"commit": _git_commit(),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"sqlite": sqlite3.sqlite_version,
+		"recorded_at": datetime.now(timezone.utc).isoformat(),
+		"params": params,
+		"results": results,
+	}
+	Path(path).parent.mkdir(parents=True, exist_ok=True)
+	Path(path).write_text(json.dumps(document, indent=2), encoding="utf-8")
+	print(f"📄 Results written to {path}")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Run every benchmark suite and collect the results in one directory
+
+Each suite runs in its own process so Settings patches and engine pools do
+not leak between them. Results land in benchmarks/results/<commit>/ as one
+JSON file per suite plus a combined summary.json.
+
+    python benchmarks/run_all.py            # defaults: 1M-row tables
+    python benchmarks/run_all.py --quick    # small sizes, for a smoke run
+    python benchmarks/run_all.py --large    # 1M, 10M and 100M rows (slow, ~20 GB of disk)
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from common import ROOT, _git_commit
+
+HERE = Path(__file__).resolve().parent
+
+PROFILES = {
+	"quick": {
+		"index_probe": ["--rows", "100000"],
+		"grouped": ["--rows", "100000", "--keys", "10000", "--repeat", "5"],
+		"scheduler": ["--targets", "1000,10000", "--ticks", "200", "--probe-targets", "1000", "--repeat", "2"],
+		"pipeline": ["--sizes", "100000", "--targets", "1,10", "--concurrency", "1,4", "--target-rows", "1000"],
+		"http": ["--requests", "200", "--concurrency", "1,10", "--alerts", "50", "--http-targets", "5", "--http-target-rows", "1000"],
+	},
+	"default": {
+		"index_probe": ["--rows", "1000000"],
+		"grouped": [],
+		"scheduler": [],
+		"pipeline": [],
+		"http": [],
+	},
+	"large": {
+		"index_probe": ["--rows", "10000000"],
+		"grouped": ["--rows", "10000000", "--keys", "100000"],
+		"scheduler": ["--ticks", "10000", "--probe-targets", "100000"],
+		"pipeline": ["--sizes", "1000000,10000000,100000000", "--targets", "1,10,100,500", "--concurrency", "1,4,16,64"],
+		"http": ["--requests", "5000", "--concurrency", "1,10,50,200", "--alerts", "1000", "--http-targets", "100"],
+	},
+}
+
+SCRIPTS = {
+	"index_probe": "bench_index_probe.py",
+	"grouped": "bench_grouped.py",
+	"scheduler": "bench_scheduler.py",
+	"pipeline": "bench_pipeline.py",
+	"http": "bench_http.py",
+}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	size = parser.add_mutually_exclusive_group()
+	size.add_argument("--quick", action="store_true")
+	size.add_argument("--large", action="store_true")
+	parser.add_argument("--only", choices=sorted(SCRIPTS), action="append", help="Run just this suite (repeatable)")
+	parser.add_argument("--output-dir", help="Defaults to benchmarks/results/<commit>")
+	args = parser.parse_args()
+
+	profile = PROFILES["quick" if args.quick else "large" if args.large else "default"]
+	output_dir = Path(args.output_dir) if args.output_dir else HERE / "results" / _git_commit()
+	output_dir.mkdir(parents=True, exist_ok=True)
+
+	summary: dict[str, dict] = {}
+	failed: list[str] = []
+	for suite in args.only or SCRIPTS:
+		output = output_dir / f"{suite}.json"
+		command = [sys.executable, str(HERE / SCRIPTS[suite]), *profile[suite], "--output", str(output)]
+		print(f"▶️ {suite}: {' '.join(command[1:])}")
+		if subprocess.run(command, cwd=ROOT).returncode != 0:
+			print(f"❌ {suite} failed")
+			failed.append(suite)
+			continue
+		summary[suite] = json.loads(output.read_text(encoding="utf-8"))
+
+	(output_dir / "summary.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+	print(f"📄 Summary written to {output_dir / 'summary.json'}")
+	if failed:
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Simulate fixed-interval vs adaptive scheduling on synthetic row arrivals
+
+Every target receives Poisson-distributed rows with a few injected outages.
+Both policies run the monitor's threshold/cooldown rules against the same
+data in virtual time; the report compares probe query volume with alert
+latency (alert time minus the earliest moment the alert could have fired).
+
+    python benchmarks/simulate_adaptive.py --targets 50 --days 7
+"""
+
+import argparse
+import bisect
+import heapq
+import json
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.scheduling import next_check_at  # noqa: E402
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def generate_arrivals(rng: random.Random, span: float, rate_per_minute: float, outages: int) -> list[float]:
+	"""Row timestamps (seconds from EPOCH) with `outages` silent gaps of 15-180 minutes."""
+	gaps = []
+	for _ in range(outages):
+		start = rng.uniform(0, span)
+		gaps.append((start, start + rng.uniform(15, 180) * 60))
+	rows, t = [], 0.0
+	while True:
+		t += rng.expovariate(rate_per_minute / 60)
+		if t >= span:
+			return rows
+		if not any(start <= t < end for start, end in gaps):
+			rows.append(t)
+
+
+def incidents(rows: list[float], span: float, threshold: float) -> list[float]:
+	"""Earliest alert time of every gap longer than the threshold."""
+	starts = [a + threshold for a, b in zip(rows, rows[1:]) if b - a > threshold]
+	if rows and span - rows[-1] > threshold:
+		starts.append(rows[-1] + threshold)
+	return starts
+
+
+class TargetSim:
+	def __init__(self, rows: list[float], threshold: float, cooldown: float) -> None:
+		self.rows = rows
+		self.threshold = threshold
+		self.cooldown = cooldown
+		self.last_alert: float | None = None
+		self.alerts: list[float] = []
+		self.probes = 0
+
+	def probe(self, now: float) -> tuple[str, float | None]:
+		"""Apply the monitor's decision rules at virtual time `now`."""
+		self.probes += 1
+		i = bisect.bisect_right(self.rows, now)
+		if i == 0:
+			return "no_rows", None
+		latest = self.rows[i - 1]
+		if now - latest >= self.threshold:
+			if self.last_alert is None or now >= self.last_alert + self.cooldown:
+				self.last_alert = now
+				self.alerts.append(now)
+				return "alert_sent", latest
+			return "cooldown", latest
+		return "ok", latest
+
+
+def run_interval(sims: list[TargetSim], span: float, interval: float) -> None:
+	t = interval
+	while t < span:
+		for sim in sims:
+			sim.probe(t)
+		t += interval
+
+
+def run_adaptive(sims: list[TargetSim], span: float, interval: float, jitter: float) -> None:
+	heap = [(interval, i) for i in range(len(sims))]
+	heapq.heapify(heap)
+	interval_td = timedelta(seconds=interval)
+	while heap:
+		t, i = heapq.heappop(heap)
+		if t >= span:
+			continue
+		sim = sims[i]
+		status, latest = sim.probe(t)
+		due = next_check_at(
+			status,
+			EPOCH + timedelta(seconds=t),
+			None if latest is None else EPOCH + timedelta(seconds=latest),
+			timedelta(seconds=sim.threshold),
+			interval_td,
+			jitter,
+		)
+		heapq.heappush(heap, ((due - EPOCH).total_seconds(), i))
+
+
+def summarise(sims: list[TargetSim], span: float) -> dict:
+	latencies, missed = [], 0
+	for sim in sims:
+		for start in incidents(sim.rows, span, sim.threshold):
+			# First alert at or after the incident became alertable, before activity resumed
+			i = bisect.bisect_left(sim.alerts, start)
+			j = bisect.bisect_right(sim.rows, start)
+			resumed = sim.rows[j] if j < len(sim.rows) else span
+			if i < len(sim.alerts) and sim.alerts[i] < resumed:
+				latencies.append(sim.alerts[i] - start)
+			else:
+				missed += 1
+	latencies.sort()
+
+	def pct(p: float) -> float:
+		return latencies[min(int(p * len(latencies)), len(latencies) - 1)] if latencies else 0.0
+
+	return {
+		"probes": sum(s.probes for s in sims),
+		"alerts": sum(len(s.alerts) for s in sims),
+		"incidents_detected": len(latencies),
+		"incidents_missed": missed,
+		"alert_latency_mean_s": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+		"alert_latency_p50_s": round(pct(0.5), 2),
+		"alert_latency_p99_s": round(pct(0.99), 2),
+		"alert_latency_max_s": round(latencies[-1], 2) if latencies else 0.0,
+	}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument("--targets", type=int, default=50)
+	parser.add_argument("--days", type=float, default=7)
+	parser.add_argument("--rate", type=float, default=2.0, help="Mean rows per minute per target")
+	parser.add_argument("--outages", type=int, default=3, help="Injected outages per target")
+	parser.add_argument("--interval", type=float, default=60, help="CHECK_INTERVAL_SECONDS")
+	parser.add_argument("--threshold", type=float, default=10, help="INACTIVITY_THRESHOLD_MINUTES")
+	parser.add_argument("--cooldown", type=float, default=30, help="ALERT_COOLDOWN_MINUTES")
+	parser.add_argument("--jitter", type=float, default=5, help="ADAPTIVE_JITTER_SECONDS")
+	parser.add_argument("--seed", type=int, default=1)
+	parser.add_argument("--output", help="Write results as JSON to this path")
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+	span = args.days * 86400
+	workload = [generate_arrivals(rng, span, args.rate, args.outages) for _ in range(args.targets)]
+
+	def sims() -> list[TargetSim]:
+		return [TargetSim(rows, args.threshold * 60, args.cooldown * 60) for rows in workload]
+
+	interval_sims, adaptive_sims = sims(), sims()
+	run_interval(interval_sims, span, args.interval)
+	random.seed(args.seed)
+	run_adaptive(adaptive_sims, span, args.interval, args.jitter)
+
+	report = {
+		"params": vars(args),
+		"interval": summarise(interval_sims, span),
+		"adaptive": summarise(adaptive_sims, span),
+	}
+	report["probe_reduction"] = round(report["interval"]["probes"] / max(report["adaptive"]["probes"], 1), 2)
+
+	print(f"{'policy':<10}{'probes':>10}{'alerts':>8}{'missed':>8}{'lat p50 s':>11}{'lat p99 s':>11}{'lat max s':>11}")
+	for policy in ("interval", "adaptive"):
+		r = report[policy]
+		print(
+			f"{policy:<10}{r['probes']:>10}{r['alerts']:>8}{r['incidents_missed']:>8}"
+			f"{r['alert_latency_p50_s']:>11}{r['alert_latency_p99_s']:>11}{r['alert_latency_max_s']:>11}"
+		)
+	print(f"probe reduction: {report['probe_reduction']}x")
+	if args.output:
+		Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+	main()
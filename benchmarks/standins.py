@@ -0,0 +1,104 @@
+"""
+Local stand-ins for the Teams webhook and the SMTP server, so notifier
+throughput can be measured without sending real messages
+"""
+
+import asyncio
+from typing import Optional
+
+from aiohttp import web
+
+
+class TeamsStandIn:
+	"""Accepts MessageCard posts on /webhook after an optional artificial latency."""
+
+	def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_seconds: float = 0.0) -> None:
+		self.host = host
+		self.port = port
+		self.latency_seconds = latency_seconds
+		self.received = 0
+		self._runner: Optional[web.AppRunner] = None
+
+	@property
+	def url(self) -> str:
+		return f"http://{self.host}:{self.port}/webhook"
+
+	async def _handle(self, request: web.Request) -> web.Response:
+		await request.read()
+		if self.latency_seconds:
+			await asyncio.sleep(self.latency_seconds)
+		self.received += 1
+		return web.Response(text="1")
+
+	async def start(self) -> "TeamsStandIn":
+		app = web.Application()
+		app.router.add_post("/webhook", self._handle)
+		self._runner = web.AppRunner(app, access_log=None)
+		await self._runner.setup()
+		site = web.TCPSite(self._runner, self.host, self.port)
+		await site.start()
+		self.port = site._server.sockets[0].getsockname()[1]
+		return self
+
+	async def stop(self) -> None:
+		if self._runner is not None:
+			await self._runner.cleanup()
+
+
+class SMTPStandIn:
+	"""
+	Minimal SMTP server: answers EHLO/MAIL/RCPT/DATA/NOOP/QUIT and counts
+	sessions, messages and recipients. No TLS or AUTH, so point the monitor at
+	it with SMTP_USE_TLS=false, SMTP_USE_SSL=false, SMTP_ALLOW_PLAINTEXT=true
+	and an empty SMTP_USER.
+	"""
+
+	def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_seconds: float = 0.0) -> None:
+		self.host = host
+		self.port = port
+		self.latency_seconds = latency_seconds
+		self.sessions = 0
+		self.messages = 0
+		self.recipients = 0
+		self._server: Optional[asyncio.AbstractServer] = None
+
+	async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+		self.sessions += 1
+		writer.write(b"220 localhost ESMTP stand-in\r\n")
+		await writer.drain()
+		try:
+			while line := await reader.readline():
+				command = line.decode(errors="replace").strip().upper()
+				if command.startswith(("EHLO", "HELO")):
+					writer.write(b"250-localhost\r\n250 8BITMIME\r\n")
+				elif command.startswith("RCPT"):
+					self.recipients += 1
+					writer.write(b"250 OK\r\n")
+				elif command == "DATA":
+					writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+					await writer.drain()
+					while await reader.readline() not in (b".\r\n", b""):
+						pass
+					if self.latency_seconds:
+						await asyncio.sleep(self.latency_seconds)
+					self.messages += 1
+					writer.write(b"250 OK queued\r\n")
+				elif command == "QUIT":
+					writer.write(b"221 Bye\r\n")
+					await writer.drain()
+					break
+				else:
+					writer.write(b"250 OK\r\n")
+				await writer.drain()
+		finally:
+			writer.close()
+
+	async def start(self) -> "SMTPStandIn":
+		self._server = await asyncio.start_server(self._handle, self.host, self.port)
+		self.port = self._server.sockets[0].getsockname()[1]
+		return self
+
+	async def stop(self) -> None:
+		if self._server is not None:
+			self._server.close()
+			await self._server.wait_closed()
@@ -1,15 +1,13 @@
 #!/usr/bin/env python3
 """
-Simple startup script for the Database Activity Monitor
+Startup script for the Database Activity Monitor
+
+    python run.py                  # production: no reloader, WEB_CONCURRENCY workers
+    python run.py --workers 4
+    python run.py --reload         # development: single worker, restarts on code changes
 """
 
-import uvicorn
+from app.server import main
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+    main()